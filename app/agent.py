@@ -7,15 +7,16 @@ import asyncio
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../computer-use-demo/computer_use_demo")))
 
 from loop import sampling_loop, APIProvider
+from clients import client_stats, close_clients
 
-from tools import TOOL_GROUPS_BY_VERSION, ToolVersion, ToolCollection, ToolResult
+from tools import TOOL_GROUPS_BY_VERSION, ToolVersion, ToolCollection, ToolProgress, ToolResult, capture_stats, close_bash_sessions, close_display_connections, line_index_stats, listing_stats, run_stats, settle_stats, warm_bash_sessions
 print("Tool groups loaded:", TOOL_GROUPS_BY_VERSION)
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 import asyncio
 import json
-from storage import save_base64_image, get_image_url
+from storage import get_image_url, image_uploader, screenshot_markdown, upload_stats
 
 
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY", "")
@@ -90,6 +91,8 @@ async def run_agent_task(user_input: str, session_messages: list, model: str = "
     
     result_blocks = []
     websocket_tasks = []
+    # screenshots being uploaded, which fill in their place in result_blocks
+    upload_tasks = []
 
     async def main():
         messages = to_agent_messages(session_messages) + [
@@ -102,8 +105,9 @@ async def run_agent_task(user_input: str, session_messages: list, model: str = "
             if block["type"] == "text" and block.get("text"):
                 result_blocks.append(block["text"])
                 print(f"[AGENT] Added text block to result_blocks. Total blocks: {len(result_blocks)}")
-                # Send over WebSocket if available
-                if websocket:
+                # Send over WebSocket if available; when streaming, the text already
+                # reached the client as content_block_delta events
+                if websocket and not stream_deltas:
                     print(f"[AGENT] Creating WebSocket task for text block")
                     # Create task and store it
                     task = asyncio.create_task(send_websocket_block(websocket, block, "output_callback"))
@@ -131,38 +135,96 @@ async def run_agent_task(user_input: str, session_messages: list, model: str = "
                     print(f"[AGENT] WebSocket task created. Total tasks: {len(websocket_tasks)}")
 
 
+        # Forward token-level deltas so the chat shows output before the turn ends
+        stream_deltas = websocket is not None
+
+        # Deltas go out in order through a single sender, without logging every token
+        delta_queue = asyncio.Queue()
+
+        def stream_callback(event):
+            delta_queue.put_nowait(event)
+
+        async def send_deltas():
+            connected = True
+            while (event := await delta_queue.get()) is not None:
+                if not connected:
+                    continue
+                try:
+                    await websocket.send_json(event)
+                except Exception as e:
+                    # keep draining the queue, but stop sending to a closed socket
+                    print(f"[WEBSOCKET] Send error while streaming deltas: {e}")
+                    connected = False
+
         tool_version = "computer_use_20250429"
         print(f"[AGENT] Using tool version: {tool_version}")
 
 
         def tool_output_callback(result, block_id): 
-            # Save image data if present, store in MinIO and send URL
-            if result.base64_image:
-                try:
-                    # Save image to MinIO and get object name
-                    object_name = save_base64_image(result.base64_image)
-                    if object_name:
-                        # Get URL for the image
-                        image_url = get_image_url(object_name)
-                        if image_url:
-                            result_blocks.append(f"![Screenshot]({image_url})")  # Add image URL in markdown format
-                        else:
-                            print("[AGENT] Failed to generate image URL")
-                            result_blocks.append("[ERROR GENERATING IMAGE URL]")
+            # Partial output of a tool that is still running; only shown live
+            if isinstance(result, ToolProgress):
+                if websocket:
+                    progress_block = {
+                        "type": "tool_progress",
+                        "tool_use_id": block_id,
+                        "output": result.output,
+                        "error": result.error,
+                    }
+                    task = asyncio.create_task(send_websocket_block(websocket, progress_block, "tool_output_callback"))
+                    websocket_tasks.append(task)
+                return
+            # Upload image data if present to MinIO in the background; the tool result
+            # is sent with its URL once the upload is done
+            if image_data := result.image_bytes():
+                # keep the screenshot's place among the results until its URL is known
+                result_index = len(result_blocks)
+                result_blocks.append("[UPLOADING SCREENSHOT]")
+                # awaited by sampling_loop, which waits only while the upload queue is full
+                return queue_screenshot(result, image_data, block_id, result_index)
+            send_tool_result(result, block_id, None)
+
+        async def queue_screenshot(result, image_data, block_id, result_index):
+            try:
+                upload = await image_uploader.submit(image_data)
+            except Exception as e:
+                print(f"[AGENT] Error queueing screenshot upload: {e}")
+                result_blocks[result_index] = "[ERROR PROCESSING SCREENSHOT]"
+                send_tool_result(result, block_id, None)
+                return
+            upload_tasks.append(asyncio.create_task(finish_screenshot(upload, result, block_id, result_index)))
+
+        async def finish_screenshot(upload, result, block_id, result_index):
+            image_url = thumbnail_url = None
+            try:
+                # Wait for the upload and get the object names
+                stored = await upload
+                if stored:
+                    # Get URLs for the image and its thumbnail
+                    image_url = get_image_url(stored.object_name)
+                    thumbnail_url = get_image_url(stored.thumbnail_name)
+                    if image_url and thumbnail_url:
+                        # Add the thumbnail, linked to the image, in markdown format
+                        result_blocks[result_index] = screenshot_markdown(image_url, thumbnail_url)
                     else:
-                        print("[AGENT] Failed to save image to MinIO")
-                        result_blocks.append("[ERROR SAVING SCREENSHOT]")
-                except Exception as e:
-                    print(f"[AGENT] Error handling image: {e}")
-                    result_blocks.append("[ERROR PROCESSING SCREENSHOT]")
+                        print("[AGENT] Failed to generate image URL")
+                        result_blocks[result_index] = "[ERROR GENERATING IMAGE URL]"
+                else:
+                    print("[AGENT] Failed to save image to MinIO")
+                    result_blocks[result_index] = "[ERROR SAVING SCREENSHOT]"
+            except Exception as e:
+                print(f"[AGENT] Error handling image: {e}")
+                result_blocks[result_index] = "[ERROR PROCESSING SCREENSHOT]"
+            send_tool_result(result, block_id, image_url, thumbnail_url)
 
+        def send_tool_result(result, block_id, image_url, thumbnail_url=None):
             # Send tool result over WebSocket if available
             if websocket:
                 # Convert ToolResult to dictionary to make it JSON serializable
                 result_dict = {
                     "output": result.output,
                     "error": result.error,
-                    "image_url": image_url if 'image_url' in locals() else None,
+                    "image_url": image_url,
+                    "thumbnail_url": thumbnail_url,
                     "system": result.system
                 }
                 tool_result_block = {
@@ -174,6 +236,7 @@ async def run_agent_task(user_input: str, session_messages: list, model: str = "
                 task = asyncio.create_task(send_websocket_block(websocket, tool_result_block, "tool_output_callback"))
                 websocket_tasks.append(task)
                 print(f"[AGENT] WebSocket task created for tool_result. Total tasks: {len(websocket_tasks)}")
+
         def api_response_callback(request, response, exc): 
             if exc:
                 print(f"[AGENT] API_ERROR: {exc}")
@@ -181,20 +244,41 @@ async def run_agent_task(user_input: str, session_messages: list, model: str = "
                 print(f"[AGENT] API_SUCCESS: {response.status_code if response else 'No response'}")
 
         print(f"[AGENT] Starting sampling_loop...")
-        await sampling_loop(
-            model=model,
-            provider=APIProvider.ANTHROPIC,
-            system_prompt_suffix="",
-            messages=messages,
-            output_callback=output_callback,
-            tool_output_callback=tool_output_callback,
-            api_response_callback=api_response_callback,
-            api_key=ANTHROPIC_API_KEY,
-            tool_version=tool_version,
-        )
+        delta_sender = asyncio.create_task(send_deltas()) if stream_deltas else None
+        try:
+            await sampling_loop(
+                model=model,
+                provider=APIProvider.ANTHROPIC,
+                system_prompt_suffix="",
+                messages=messages,
+                output_callback=output_callback,
+                tool_output_callback=tool_output_callback,
+                api_response_callback=api_response_callback,
+                api_key=ANTHROPIC_API_KEY,
+                tool_version=tool_version,
+                stream_callback=stream_callback if stream_deltas else None,
+                stream_tool_output=stream_deltas,
+            )
+        finally:
+            if delta_sender:
+                # the deltas queued so far are still sent
+                delta_queue.put_nowait(None)
+                await delta_sender
         print(f"[AGENT] sampling_loop completed")
+        print(f"[AGENT] API client stats: {client_stats()}")
+        stats = settle_stats()
+        print(f"[AGENT] Screen settle stats: {stats} ({stats.saved_seconds_per_action:.2f}s saved per action)")
+        print(f"[AGENT] Output capture stats: {capture_stats()}")
+        print(f"[AGENT] Command run stats: {run_stats()}")
+        print(f"[AGENT] Directory listing stats: {listing_stats()}")
+        print(f"[AGENT] Line index stats: {line_index_stats()}")
 
     await main()
+
+    # The final result needs the URLs of all screenshots
+    if upload_tasks:
+        await asyncio.gather(*upload_tasks)
+    print(f"[AGENT] Screenshot upload stats: {upload_stats()}")
     
     # Wait for all WebSocket tasks to complete
     if websocket_tasks:
@@ -209,6 +293,17 @@ async def run_agent_task(user_input: str, session_messages: list, model: str = "
     
     return final_result
 
+async def start_agent():
+    """Start bash sessions ahead of the first bash tool call"""
+    warm_bash_sessions()
+
+async def shutdown_agent():
+    """Release the pooled API clients, bash sessions and X connections held by this process, and finish the queued uploads"""
+    await close_clients()
+    await close_bash_sessions()
+    close_display_connections()
+    await image_uploader.close()
+
 async def send_websocket_block(websocket, block, source=None):
     """Helper function to send a block over WebSocket with proper error handling"""
     print(f"[WEBSOCKET] Attempting to send block: {block}, from {source}")
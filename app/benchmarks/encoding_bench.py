@@ -0,0 +1,98 @@
+"""
+Compare the encode time and size of the formats screenshots can be stored in, on
+1024x768 desktop captures. The captures are PNGs at compression level 1, as the
+computer tool takes them.
+
+Without --images, synthetic desktops are drawn: windows of text, a terminal, a
+gradient wallpaper and a photo. Run from app/, e.g.
+`python -m benchmarks.encoding_bench -n 10 --images capture1.png capture2.png`.
+"""
+
+import argparse
+import random
+import statistics
+import time
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from encoding import encode_image
+
+SIZE = (1024, 768)
+VARIANTS = [
+    ("png", None),
+    ("png8", None),
+    ("webp", 60),
+    ("webp", 80),
+    ("webp", 95),
+    ("jpeg", 70),
+    ("jpeg", 85),
+]
+
+
+def _as_capture(image: Image.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def synthetic_desktop(seed: int) -> bytes:
+    rng = random.Random(seed)
+    image = Image.new("RGB", SIZE)
+    draw = ImageDraw.Draw(image)
+    # wallpaper
+    for y in range(SIZE[1]):
+        draw.line([(0, y), (SIZE[0], y)], fill=(30, 60 + y // 8, 120 + y // 10))
+    # a photo in a browser window
+    draw.rectangle([40, 40, 620, 500], fill=(250, 250, 250), outline=(120, 120, 120))
+    draw.rectangle([40, 40, 620, 70], fill=(220, 220, 225))
+    noise = Image.effect_noise((540, 240), 60).convert("RGB")
+    photo = Image.blend(noise, Image.new("RGB", noise.size, (200, 140, 80)), 0.5)
+    image.paste(photo.filter(ImageFilter.GaussianBlur(2)), (60, 90))
+    for line in range(8):
+        draw.text((60, 345 + line * 18), " ".join(
+            rng.choice(["lorem", "ipsum", "dolor", "sit", "amet", "screenshot"])
+            for _ in range(12)
+        ), fill=(20, 20, 20))
+    # a terminal
+    draw.rectangle([400, 300, 1000, 720], fill=(25, 25, 25), outline=(90, 90, 90))
+    for line in range(22):
+        draw.text((410, 310 + line * 18), f"$ ls -la /var/log/{rng.randint(0, 1 << 30):x}", fill=(200, 230, 200))
+    # the taskbar
+    draw.rectangle([0, SIZE[1] - 28, SIZE[0], SIZE[1]], fill=(45, 45, 48))
+    for icon in range(6):
+        draw.rectangle([8 + icon * 32, SIZE[1] - 24, 28 + icon * 32, SIZE[1] - 4], fill=(rng.randrange(256), 140, 200))
+    return _as_capture(image)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=5, help="encodes per image and variant")
+    parser.add_argument("--images", nargs="*", help="PNG captures to encode instead of synthetic ones")
+    args = parser.parse_args()
+
+    if args.images:
+        captures = [_as_capture(Image.open(path).convert("RGB").resize(SIZE)) for path in args.images]
+    else:
+        captures = [synthetic_desktop(seed) for seed in range(3)]
+    capture_size = statistics.mean(len(capture) for capture in captures)
+    print(f"{len(captures)} captures, {capture_size / 1024:.0f} KiB on average")
+
+    for image_format, quality in VARIANTS:
+        latencies, sizes = [], []
+        for capture in captures:
+            for _ in range(args.n):
+                start = time.perf_counter()
+                encoded = encode_image(capture, image_format, quality)
+                latencies.append(time.perf_counter() - start)
+            sizes.append(len(encoded.data))
+        name = image_format if quality is None else f"{image_format} q{quality}"
+        size = statistics.mean(sizes)
+        print(
+            f"{name:>10}: median {statistics.median(latencies) * 1000:6.1f} ms, "
+            f"{size / 1024:6.0f} KiB ({size / capture_size:4.0%} of the capture)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os
+import time
+from dataclasses import dataclass
+from io import BytesIO
+
+from PIL import Image
+
+# Formats screenshots can be stored in for the UI and the chat history
+FORMATS = {
+    # the capture as it is, lossless
+    "png": ("image/png", "png"),
+    # reduced to a 256 color palette; lossless for most of a desktop, small for flat UI
+    "png8": ("image/png", "png"),
+    "webp": ("image/webp", "webp"),
+    "jpeg": ("image/jpeg", "jpg"),
+}
+
+SCREENSHOT_FORMAT = os.getenv("SCREENSHOT_FORMAT", "webp").lower()
+# Quality of the lossy formats, from 0 to 100
+SCREENSHOT_QUALITY = int(os.getenv("SCREENSHOT_QUALITY", "80"))
+# Width of the thumbnails shown in the chat timeline, in pixels
+THUMBNAIL_WIDTH = int(os.getenv("THUMBNAIL_WIDTH", "320"))
+
+if SCREENSHOT_FORMAT not in FORMATS:
+    print(f"Unknown SCREENSHOT_FORMAT {SCREENSHOT_FORMAT!r}, storing screenshots as png")
+    SCREENSHOT_FORMAT = "png"
+
+
+@dataclass(frozen=True)
+class EncodedImage:
+    """An image encoded for storage"""
+    data: bytes
+    content_type: str
+    extension: str
+    # time spent encoding
+    seconds: float = 0.0
+
+
+def _encode(image: Image.Image, image_format: str, quality: int) -> EncodedImage:
+    start = time.perf_counter()
+    content_type, extension = FORMATS[image_format]
+    output = BytesIO()
+    if image_format == "png":
+        image.save(output, "PNG")
+    elif image_format == "png8":
+        # the fast octree quantizer, the median cut default takes far longer
+        image.quantize(256, method=Image.Quantize.FASTOCTREE).save(output, "PNG")
+    elif image_format == "webp":
+        # method 2 encodes in about half the time of the default 4, to about the
+        # same size on desktop captures
+        image.save(output, "WEBP", quality=quality, method=2)
+    else:
+        image.save(output, "JPEG", quality=quality)
+    return EncodedImage(output.getvalue(), content_type, extension, time.perf_counter() - start)
+
+
+def encode_image(png: bytes, image_format: str | None = None, quality: int | None = None) -> EncodedImage:
+    """
+    Encode a PNG screenshot in one of FORMATS, by default SCREENSHOT_FORMAT; a png is
+    kept as it is
+    """
+    image_format = SCREENSHOT_FORMAT if image_format is None else image_format
+    quality = SCREENSHOT_QUALITY if quality is None else quality
+    if image_format == "png":
+        content_type, extension = FORMATS[image_format]
+        return EncodedImage(png, content_type, extension)
+    with Image.open(BytesIO(png)) as image:
+        return _encode(image.convert("RGB"), image_format, quality)
+
+
+def encode_screenshot(png: bytes) -> tuple[EncodedImage, EncodedImage]:
+    """
+    Encode a PNG screenshot for storage like encode_image, and a thumbnail of it
+    THUMBNAIL_WIDTH wide, decoding it only once
+    """
+    with Image.open(BytesIO(png)) as image:
+        image = image.convert("RGB")
+    if SCREENSHOT_FORMAT == "png":
+        content_type, extension = FORMATS["png"]
+        encoded = EncodedImage(png, content_type, extension)
+    else:
+        encoded = _encode(image, SCREENSHOT_FORMAT, SCREENSHOT_QUALITY)
+    width = min(THUMBNAIL_WIDTH, image.width)
+    size = (width, max(1, round(image.height * width / image.width)))
+    thumbnail = image.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return encoded, _encode(thumbnail, SCREENSHOT_FORMAT, SCREENSHOT_QUALITY)
@@ -6,14 +6,19 @@ from typing import List
 from models import Session as ChatSession, Message, Base
 from db import engine, get_db
 from datetime import datetime
-from agent import run_agent_task, run_agent_task_stream
+from agent import run_agent_task, run_agent_task_stream, start_agent, shutdown_agent
 
 
 app = FastAPI()
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     Base.metadata.create_all(bind=engine)
+    await start_agent()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await shutdown_agent()
 
 @app.get("/")
 def root():
@@ -1,11 +1,16 @@
 import os
-import uuid
-import base64
 import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from minio import Minio
 from minio.error import S3Error
 from io import BytesIO
 from datetime import timedelta
+from encoding import FORMATS, SCREENSHOT_FORMAT, encode_screenshot
 
 # Get MinIO configuration from environment variables
 MINIO_HOST = os.getenv("MINIO_HOST", "localhost")
@@ -14,6 +19,14 @@ MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
 MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "minioadmin")
 MINIO_BUCKET = os.getenv("MINIO_BUCKET", "screenshots")
 EXTERNAL_URL = os.getenv("EXTERNAL_URL", "http://localhost:8080").rstrip('/')
+# Screenshots waiting for an upload; once this many are queued, the agent waits
+UPLOAD_QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", "8"))
+# Uploads running at once, each in a thread of its own
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+# Screenshots remembered as uploaded, so that identical ones aren't uploaded again
+UPLOAD_DEDUP_CACHE_SIZE = int(os.getenv("UPLOAD_DEDUP_CACHE_SIZE", "1024"))
+# Also store screenshots as captured (lossless PNG), when they are stored in a lossy format
+SCREENSHOT_KEEP_LOSSLESS = os.getenv("SCREENSHOT_KEEP_LOSSLESS", "false").lower() in ("1", "true", "yes")
 
 # Initialize MinIO client with the internal service name for storage operations
 minio_client = Minio(
@@ -45,28 +58,116 @@ try:
 except S3Error as e:
     print(f"Error initializing MinIO bucket: {e}")
 
-def save_base64_image(base64_data: str) -> str:
+@dataclass
+class UploadStats:
+    """Counters describing screenshot uploads and how long the agent waited for them"""
+    uploads: int = 0
+    failures: int = 0
+    bytes_uploaded: int = 0
+    # size of the screenshots as captured, before encoding
+    bytes_captured: int = 0
+    encode_seconds: float = 0.0
+    # screenshots identical to one uploaded recently, which weren't uploaded again
+    duplicates: int = 0
+    bytes_saved: int = 0
+    upload_seconds: float = 0.0
+    # time spent waiting for room in a full upload queue
+    queue_wait_seconds: float = 0.0
+
+
+_stats = UploadStats()
+
+
+def upload_stats() -> UploadStats:
+    """Return a snapshot of the upload counters"""
+    return UploadStats(**vars(_stats))
+
+
+class RecentUploads:
+    """
+    The object names uploaded most recently with their sizes, least recently used ones
+    are forgotten first. Uploads run in threads, so it is locked.
+    """
+
+    def __init__(self, size: int | None = None):
+        self.size = UPLOAD_DEDUP_CACHE_SIZE if size is None else size
+        self._names = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, object_name: str) -> int | None:
+        """The size the object was uploaded with, or None if it wasn't recently"""
+        with self._lock:
+            if object_name not in self._names:
+                return None
+            self._names.move_to_end(object_name)
+            return self._names[object_name]
+
+    def add(self, object_name: str, size: int):
+        with self._lock:
+            self._names[object_name] = size
+            self._names.move_to_end(object_name)
+            while len(self._names) > self.size:
+                self._names.popitem(last=False)
+
+
+recent_uploads = RecentUploads()
+
+
+def _put_image(object_name: str, image_data: bytes, content_type: str):
+    minio_client.put_object(
+        MINIO_BUCKET,
+        object_name,
+        BytesIO(image_data),
+        length=len(image_data),
+        content_type=content_type,
+        # the same name always holds the same image
+        metadata={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+    _stats.bytes_uploaded += len(image_data)
+
+
+@dataclass(frozen=True)
+class StoredImage:
+    """The object names of a stored screenshot and of its thumbnail"""
+    object_name: str
+    thumbnail_name: str
+
+
+def save_image(image_data: bytes) -> StoredImage | None:
     """
-    Save a base64 encoded image to MinIO and return its object name/path
+    Save a PNG screenshot to MinIO in SCREENSHOT_FORMAT, with a thumbnail of it, and
+    return their object names/paths. The names are the hash of the screenshot, so one
+    already uploaded recently isn't encoded or uploaded again
     """
     try:
-        # Generate a unique object name
-        object_name = f"screenshot_{uuid.uuid4().hex}.png"
-        
-        # Convert base64 to bytes
-        image_data = base64.b64decode(base64_data)
-        image_stream = BytesIO(image_data)
-        
-        # Upload to MinIO
-        minio_client.put_object(
-            MINIO_BUCKET,
-            object_name,
-            image_stream,
-            length=len(image_data),
-            content_type="image/png"
+        # Name the objects after their content
+        digest = hashlib.sha256(image_data).hexdigest()
+        content_type, extension = FORMATS[SCREENSHOT_FORMAT]
+        stored = StoredImage(
+            object_name=f"screenshot_{digest}.{extension}",
+            thumbnail_name=f"screenshot_{digest}_thumb.{extension}",
         )
-        
-        return object_name
+        _stats.bytes_captured += len(image_data)
+        if (size := recent_uploads.get(stored.object_name)) is not None:
+            _stats.duplicates += 1
+            _stats.bytes_saved += size
+            return stored
+
+        # Encode for display and upload to MinIO, the thumbnail first since the chat
+        # shows it first
+        encoded, thumbnail = encode_screenshot(image_data)
+        _stats.encode_seconds += encoded.seconds + thumbnail.seconds
+        _put_image(stored.thumbnail_name, thumbnail.data, content_type)
+        _put_image(stored.object_name, encoded.data, content_type)
+        size = len(thumbnail.data) + len(encoded.data)
+        # The capture as it is, if the stored one isn't; under a name of its own, as
+        # png8 screenshots are .png too
+        if SCREENSHOT_KEEP_LOSSLESS and SCREENSHOT_FORMAT != "png":
+            _put_image(f"screenshot_{digest}_lossless.png", image_data, "image/png")
+            size += len(image_data)
+        recent_uploads.add(stored.object_name, size)
+
+        return stored
     except S3Error as e:
         print(f"Error saving image to MinIO: {e}")
         return None
@@ -80,4 +181,75 @@ def get_image_url(object_name: str) -> str:
         return f"{EXTERNAL_URL}/minio/{MINIO_BUCKET}/{object_name}"
     except Exception as e:
         print(f"Error generating URL: {e}")
-        return None 
\ No newline at end of file
+        return None
+
+
+def screenshot_markdown(image_url: str, thumbnail_url: str) -> str:
+    """
+    Markdown for a screenshot in the chat history: its thumbnail, linked to the full
+    image (the frontend's parseScreenshotLine reads it back)
+    """
+    return f"[![Screenshot]({thumbnail_url})]({image_url})"
+
+
+class ImageUploader:
+    """
+    Uploads screenshots to MinIO in the background. A bounded queue feeds a pool of
+    workers, each running the blocking MinIO client in a thread, so the event loop
+    never waits on an upload; callers only wait while the queue is full.
+    """
+
+    def __init__(self, save=None, workers: int | None = None, queue_size: int | None = None):
+        self.save = save_image if save is None else save
+        self.workers = UPLOAD_WORKERS if workers is None else workers
+        self.queue_size = UPLOAD_QUEUE_SIZE if queue_size is None else queue_size
+        self._queue = None
+        self._tasks = []
+
+    async def submit(self, image_data: bytes) -> asyncio.Future:
+        """
+        Queue a PNG screenshot for upload, waiting while the queue is full. The uploader
+        takes the bytes over, so the caller must not change them; the returned future
+        resolves to the StoredImage, or None if the upload failed.
+        """
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        future = asyncio.get_running_loop().create_future()
+        start = time.monotonic()
+        await self._queue.put((image_data, future))
+        _stats.queue_wait_seconds += time.monotonic() - start
+        return future
+
+    async def _work(self):
+        while True:
+            image_data, future = await self._queue.get()
+            start = time.monotonic()
+            try:
+                stored = await asyncio.to_thread(self.save, image_data)
+            except Exception as e:
+                print(f"Error uploading image: {e}")
+                stored = None
+            finally:
+                _stats.upload_seconds += time.monotonic() - start
+                self._queue.task_done()
+            if stored is None:
+                _stats.failures += 1
+            else:
+                _stats.uploads += 1
+            if not future.done():
+                future.set_result(stored)
+
+    async def close(self):
+        """Finish the queued uploads and stop the workers"""
+        if self._queue is None:
+            return
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._queue = None
+        self._tasks = []
+
+
+image_uploader = ImageUploader()
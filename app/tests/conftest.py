@@ -0,0 +1,30 @@
+import os
+import sys
+from unittest import mock
+
+import minio
+import pytest
+
+# the app's modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# storage sets up its bucket on import; there is no MinIO server for it to talk to
+with (
+    mock.patch.object(minio.Minio, "bucket_exists", return_value=True),
+    mock.patch.object(minio.Minio, "set_bucket_policy"),
+):
+    import storage
+
+
+@pytest.fixture
+def minio_client():
+    """
+    A stub of the MinIO client, whose put_object calls record the uploads, with no
+    screenshot remembered as uploaded yet
+    """
+    client = mock.Mock()
+    with (
+        mock.patch.object(storage, "minio_client", client),
+        mock.patch.object(storage, "recent_uploads", storage.RecentUploads()),
+    ):
+        yield client
@@ -0,0 +1,84 @@
+from io import BytesIO
+from unittest import mock
+
+import pytest
+from PIL import Image
+
+import encoding
+from encoding import FORMATS, encode_image, encode_screenshot
+
+
+def screenshot(width: int = 200, height: int = 100) -> bytes:
+    """A PNG with some detail, so that lossy formats have something to lose"""
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize(
+    "image_format, content_type, extension, pil_format",
+    [
+        ("png", "image/png", "png", "PNG"),
+        ("png8", "image/png", "png", "PNG"),
+        ("webp", "image/webp", "webp", "WEBP"),
+        ("jpeg", "image/jpeg", "jpg", "JPEG"),
+    ],
+)
+def test_encode_image_formats(image_format, content_type, extension, pil_format):
+    encoded = encode_image(screenshot(), image_format)
+    assert (encoded.content_type, encoded.extension) == (content_type, extension)
+    assert FORMATS[image_format] == (content_type, extension)
+    with Image.open(BytesIO(encoded.data)) as image:
+        assert image.format == pil_format
+        assert image.size == (200, 100)
+
+
+def test_encode_image_keeps_png_as_it_is():
+    png = screenshot()
+    assert encode_image(png, "png").data == png
+
+
+def test_encode_image_png8_is_a_palette_png():
+    encoded = encode_image(screenshot(), "png8")
+    with Image.open(BytesIO(encoded.data)) as image:
+        assert image.mode == "P"
+        assert len(image.getcolors(256)) <= 256
+
+
+@pytest.mark.parametrize("image_format", ["webp", "jpeg"])
+def test_encode_image_quality(image_format):
+    png = screenshot()
+    low = encode_image(png, image_format, quality=10)
+    high = encode_image(png, image_format, quality=95)
+    assert len(low.data) < len(high.data)
+
+
+def test_encode_image_defaults_to_the_configured_format_and_quality():
+    png = screenshot()
+    with (
+        mock.patch.object(encoding, "SCREENSHOT_FORMAT", "jpeg"),
+        mock.patch.object(encoding, "SCREENSHOT_QUALITY", 10),
+    ):
+        encoded = encode_image(png)
+    assert encoded.content_type == "image/jpeg"
+    assert encoded.data == encode_image(png, "jpeg", quality=10).data
+
+
+@pytest.mark.parametrize(
+    "size, thumbnail_size",
+    [
+        ((1024, 768), (320, 240)),
+        ((1366, 768), (320, 180)),
+        # never scaled up
+        ((200, 100), (200, 100)),
+    ],
+)
+def test_encode_screenshot_thumbnail(size, thumbnail_size):
+    with mock.patch.object(encoding, "THUMBNAIL_WIDTH", 320):
+        encoded, thumbnail = encode_screenshot(screenshot(*size))
+    with Image.open(BytesIO(encoded.data)) as image:
+        assert image.size == size
+    with Image.open(BytesIO(thumbnail.data)) as image:
+        assert image.size == thumbnail_size
+        assert image.format == Image.open(BytesIO(encoded.data)).format
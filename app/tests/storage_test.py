@@ -0,0 +1,240 @@
+import asyncio
+import threading
+import time
+from io import BytesIO
+from unittest import mock
+
+import pytest
+from PIL import Image
+
+import encoding
+import storage
+from storage import (
+    ImageUploader,
+    RecentUploads,
+    S3Error,
+    save_image,
+    screenshot_markdown,
+)
+
+
+def png(color: str) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (64, 48), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def put_names(minio_client) -> list[str]:
+    return [call.args[1] for call in minio_client.put_object.call_args_list]
+
+
+@pytest.mark.asyncio
+async def test_uploads_resolve_in_submission_order():
+    saved = []
+
+    def save(image_data):
+        saved.append(image_data)
+        return f"stored {image_data.decode()}"
+
+    uploader = ImageUploader(save=save, workers=1, queue_size=2)
+    uploads = [await uploader.submit(f"{i}".encode()) for i in range(5)]
+    assert await asyncio.gather(*uploads) == [f"stored {i}" for i in range(5)]
+    assert saved == [f"{i}".encode() for i in range(5)]
+    await uploader.close()
+
+
+@pytest.mark.asyncio
+async def test_submit_waits_while_the_queue_is_full():
+    started = threading.Event()
+    release = threading.Event()
+
+    def save(image_data):
+        started.set()
+        release.wait(5)
+        return image_data
+
+    uploader = ImageUploader(save=save, workers=1, queue_size=2)
+    # one upload for the worker, and two that fill the queue
+    uploads = [await uploader.submit(b"first")]
+    await asyncio.to_thread(started.wait, 5)
+    uploads += [await uploader.submit(b"second"), await uploader.submit(b"third")]
+
+    before = storage.upload_stats()
+    waiting = asyncio.create_task(uploader.submit(b"fourth"))
+    await asyncio.sleep(0.1)
+    assert not waiting.done()
+
+    release.set()
+    uploads.append(await asyncio.wait_for(waiting, 5))
+    assert await asyncio.gather(*uploads) == [b"first", b"second", b"third", b"fourth"]
+    assert storage.upload_stats().queue_wait_seconds - before.queue_wait_seconds >= 0.1
+    await uploader.close()
+
+
+@pytest.mark.asyncio
+async def test_workers_upload_concurrently():
+    # every upload waits until all workers are uploading at once
+    barrier = threading.Barrier(3)
+
+    def save(image_data):
+        barrier.wait(5)
+        return image_data
+
+    uploader = ImageUploader(save=save, workers=3, queue_size=3)
+    uploads = [await uploader.submit(bytes([i])) for i in range(3)]
+    assert await asyncio.gather(*uploads) == [bytes([i]) for i in range(3)]
+    await uploader.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_upload_resolves_to_none_without_blocking_the_loop():
+    release = threading.Event()
+
+    def save(image_data):
+        if image_data == b"broken":
+            # only the event loop, running meanwhile, lets this upload go on
+            if not release.wait(5):
+                raise TimeoutError("the event loop was blocked")
+            raise ConnectionError("MinIO is unreachable")
+        return image_data
+
+    before = storage.upload_stats()
+    uploader = ImageUploader(save=save, workers=1, queue_size=2)
+    failed = await uploader.submit(b"broken")
+    await asyncio.sleep(0.05)
+    release.set()
+    assert await asyncio.wait_for(failed, 5) is None
+    # the worker goes on with the next upload
+    assert await (await uploader.submit(b"fine")) == b"fine"
+    assert storage.upload_stats().failures == before.failures + 1
+    await uploader.close()
+
+
+@pytest.mark.asyncio
+async def test_close_finishes_queued_uploads():
+    def save(image_data):
+        time.sleep(0.05)
+        return image_data
+
+    uploader = ImageUploader(save=save, workers=1, queue_size=3)
+    uploads = [await uploader.submit(bytes([i])) for i in range(3)]
+    await uploader.close()
+    assert all(upload.done() for upload in uploads)
+
+
+def test_saving_the_same_screenshot_twice_uploads_it_once(minio_client):
+    before = storage.upload_stats()
+    first = save_image(png("red"))
+    second = save_image(png("red"))
+    assert first is not None and second == first
+    assert put_names(minio_client) == [first.thumbnail_name, first.object_name]
+    after = storage.upload_stats()
+    assert after.duplicates == before.duplicates + 1
+    assert after.bytes_saved > before.bytes_saved
+
+
+def test_recent_uploads_forget_the_least_recently_used():
+    recent = RecentUploads(size=2)
+    recent.add("a", 1)
+    recent.add("b", 2)
+    assert recent.get("a") == 1
+    recent.add("c", 3)
+    assert recent.get("b") is None
+    assert recent.get("a") == 1
+    assert recent.get("c") == 3
+
+
+def test_screenshots_forgotten_as_uploaded_are_uploaded_again(minio_client):
+    with mock.patch.object(storage, "recent_uploads", RecentUploads(size=1)):
+        red = save_image(png("red"))
+        blue = save_image(png("blue"))
+        assert save_image(png("red")) == red
+    assert put_names(minio_client) == [
+        red.thumbnail_name,
+        red.object_name,
+        blue.thumbnail_name,
+        blue.object_name,
+        red.thumbnail_name,
+        red.object_name,
+    ]
+
+
+def test_screenshot_is_uploaded_again_after_a_failed_put(minio_client):
+    error = S3Error(
+        code="InternalError",
+        message="put failed",
+        resource=None,
+        request_id=None,
+        host_id=None,
+        response=mock.Mock(),
+    )
+    minio_client.put_object.side_effect = [error, None, None]
+    assert save_image(png("red")) is None
+    stored = save_image(png("red"))
+    assert stored is not None
+    assert put_names(minio_client) == [
+        stored.thumbnail_name,
+        stored.thumbnail_name,
+        stored.object_name,
+    ]
+
+
+@pytest.mark.parametrize("image_format", ["png8", "webp"])
+def test_lossless_copy_is_stored_under_a_name_of_its_own(minio_client, image_format):
+    with (
+        mock.patch.object(storage, "SCREENSHOT_FORMAT", image_format),
+        mock.patch.object(storage, "SCREENSHOT_KEEP_LOSSLESS", True),
+        mock.patch.object(encoding, "SCREENSHOT_FORMAT", image_format),
+    ):
+        stored = save_image(png("red"))
+    names = put_names(minio_client)
+    assert len(set(names)) == 3
+    assert names[:2] == [stored.thumbnail_name, stored.object_name]
+    assert names[2].endswith("_lossless.png")
+    lossless = minio_client.put_object.call_args_list[2]
+    assert lossless.args[2].getvalue() == png("red")
+    assert lossless.kwargs["content_type"] == "image/png"
+
+
+def test_no_lossless_copy_of_png_screenshots(minio_client):
+    with (
+        mock.patch.object(storage, "SCREENSHOT_FORMAT", "png"),
+        mock.patch.object(storage, "SCREENSHOT_KEEP_LOSSLESS", True),
+        mock.patch.object(encoding, "SCREENSHOT_FORMAT", "png"),
+    ):
+        stored = save_image(png("red"))
+    assert put_names(minio_client) == [stored.thumbnail_name, stored.object_name]
+
+
+def test_save_image_uploads_the_screenshot_and_its_thumbnail(minio_client):
+    image_data = BytesIO()
+    Image.new("RGB", (1024, 768), "red").save(image_data, "PNG")
+    with (
+        mock.patch.object(storage, "SCREENSHOT_FORMAT", "webp"),
+        mock.patch.object(encoding, "SCREENSHOT_FORMAT", "webp"),
+        mock.patch.object(encoding, "THUMBNAIL_WIDTH", 320),
+    ):
+        stored = save_image(image_data.getvalue())
+    assert stored.object_name.startswith("screenshot_")
+    assert stored.object_name.endswith(".webp")
+    assert stored.thumbnail_name == stored.object_name.replace(".webp", "_thumb.webp")
+    uploads = {
+        call.args[1]: (call.args[2].getvalue(), call.kwargs["content_type"])
+        for call in minio_client.put_object.call_args_list
+    }
+    assert uploads.keys() == {stored.object_name, stored.thumbnail_name}
+    for name, size in [
+        (stored.object_name, (1024, 768)),
+        (stored.thumbnail_name, (320, 240)),
+    ]:
+        data, content_type = uploads[name]
+        assert content_type == "image/webp"
+        with Image.open(BytesIO(data)) as image:
+            assert image.size == size
+
+
+def test_screenshot_markdown_links_the_thumbnail_to_the_image():
+    assert (
+        screenshot_markdown("http://x/full.webp", "http://x/thumb.webp")
+        == "[![Screenshot](http://x/thumb.webp)](http://x/full.webp)"
+    )
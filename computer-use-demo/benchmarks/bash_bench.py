@@ -0,0 +1,46 @@
+"""
+Measure per-command latency of the bash tool's session for tiny and multi-megabyte
+outputs.
+
+Run from computer-use-demo/, e.g. `python -m benchmarks.bash_bench -n 20`.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from computer_use_demo.tools.bash import BashTool20250124
+
+COMMANDS = {
+    "echo": "echo hi",
+    "1 MB": "head -c 750000 /dev/zero | base64",
+    "10 MB": "head -c 7500000 /dev/zero | base64",
+}
+
+
+async def bench(tool: BashTool20250124, name: str, command: str, n: int):
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        await tool(command=command)
+        latencies.append(time.perf_counter() - start)
+    print(
+        f"{name:>8}: median {statistics.median(latencies) * 1000:8.1f} ms, "
+        f"max {max(latencies) * 1000:8.1f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=10, help="runs per command")
+    args = parser.parse_args()
+
+    tool = BashTool20250124()
+    await tool(command="true")  # start the session
+    for name, command in COMMANDS.items():
+        await bench(tool, name, command, args.n)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
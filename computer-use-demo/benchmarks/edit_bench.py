@@ -0,0 +1,66 @@
+"""
+Compare str_replace and insert on large files edited on disk against editing them as
+text, for 1 MB and 100 MB files.
+
+Run from computer-use-demo/, e.g. `python -m benchmarks.edit_bench -n 3`.
+"""
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+from computer_use_demo.tools.edit import EditTool20250124
+
+SIZES = {"1 MB": 1_000_000, "100 MB": 100_000_000}
+LINE = "{:09} the quick brown fox jumps over the lazy dog\n"
+
+
+async def bench(name: str, path: Path, n: int, on_disk: bool):
+    tool = EditTool20250124()
+    lines = path.stat().st_size // len(LINE.format(0))
+    threshold = 0 if on_disk else 1 << 60
+    latencies = {"str_replace": [], "insert": []}
+    with patch("computer_use_demo.tools.largefile.LARGE_FILE_BYTES", threshold):
+        for i in range(n):
+            target = lines // 2 + i
+            start = time.perf_counter()
+            await tool(
+                command="str_replace",
+                path=str(path),
+                old_str=LINE.format(target)[:9],
+                new_str=f"edited {i}",
+            )
+            latencies["str_replace"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            await tool(
+                command="insert", path=str(path), insert_line=target, new_str="new"
+            )
+            latencies["insert"].append(time.perf_counter() - start)
+    for command, values in latencies.items():
+        print(
+            f"{name:>7} {'on disk' if on_disk else 'as text':>8} {command:>12}: "
+            f"median {statistics.median(values) * 1000:9.1f} ms"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=3, help="edits per variant")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, size in SIZES.items():
+            path = Path(tmp) / "file.txt"
+            lines = size // len(LINE.format(0))
+            text = "".join(LINE.format(i) for i in range(lines))
+            for on_disk in (True, False):
+                path.write_text(text)
+                await bench(name, path, args.n, on_disk)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,52 @@
+"""
+Compare input actions per second of the xdotool subprocess path against the
+persistent in-process XTEST channel.
+
+Run from computer-use-demo/ inside the desktop container, e.g.
+`python -m benchmarks.input_bench -n 200`.
+"""
+
+import argparse
+import asyncio
+import time
+
+from computer_use_demo.tools.computer import ComputerTool20250124
+from computer_use_demo.tools.xinput import XInputError, XTestInput
+
+
+async def bench(name: str, tool: ComputerTool20250124, n: int):
+    commands = [
+        f"{tool.xdotool} mousemove --sync {100 + i % 50} {100 + i % 50}"
+        for i in range(n)
+    ]
+    await tool.shell(commands[0], take_screenshot=False)  # warm up
+    start = time.perf_counter()
+    for command in commands:
+        await tool.shell(command, take_screenshot=False)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:>8}: {n / elapsed:9.1f} actions/s, "
+        f"{elapsed / n * 1e6:9.1f} us/action"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=100, help="actions per backend")
+    args = parser.parse_args()
+
+    xdotool = ComputerTool20250124()
+    xdotool._input = False  # force the subprocess path
+    await bench("xdotool", xdotool, args.n)
+
+    xtest = ComputerTool20250124()
+    try:
+        xtest._input = XTestInput(xtest.display_num)
+    except XInputError as e:
+        print(f"{'xtest':>8}: unavailable ({e})")
+        return
+    await bench("xtest", xtest, args.n)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
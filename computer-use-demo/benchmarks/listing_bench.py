@@ -0,0 +1,69 @@
+"""
+Compare directory views through `find` against the in-process walker, cold and
+cached, on a generated tree of 100k files.
+
+Run from computer-use-demo/, e.g. `python -m benchmarks.listing_bench -n 20`.
+"""
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from computer_use_demo.tools.listing import DirectoryListings
+from computer_use_demo.tools.run import run
+
+
+def make_tree(root: Path, directories: int, files: int):
+    for d in range(directories):
+        directory = root / f"dir{d:04}"
+        directory.mkdir()
+        for f in range(files // directories):
+            (directory / f"file{f:05}.txt").touch()
+
+
+async def bench(name: str, view, n: int):
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        await view()
+        latencies.append(time.perf_counter() - start)
+    print(
+        f"{name:>8}: median {statistics.median(latencies) * 1000:8.2f} ms, "
+        f"max {max(latencies) * 1000:8.2f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=10, help="views per variant")
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--directories", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        make_tree(root, args.directories, args.files)
+        # let the tree age past the mtime resolution, so its listing can be cached
+        await asyncio.sleep(1.1)
+
+        async def find():
+            await run(["find", str(root), "-maxdepth", "2", "-not", "-path", r"*/\.*"])
+
+        async def cold():
+            DirectoryListings().list(root)
+
+        listings = DirectoryListings()
+
+        async def cached():
+            listings.list(root)
+
+        await bench("find", find, args.n)
+        await bench("cold", cold, args.n)
+        await bench("cached", cached, args.n)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""
+Compare per-screenshot latency and CPU time of the in-process capture backends (the
+mmap'd Xvfb framebuffer and XGetImage) against the gnome-screenshot/scrot + convert
+subprocess path.
+
+Run from computer-use-demo/ inside the desktop container, e.g.
+`python -m benchmarks.screenshot_bench -n 50`.
+"""
+
+import argparse
+import asyncio
+import resource
+import statistics
+import time
+
+from computer_use_demo.tools.computer import ComputerTool20250124
+from computer_use_demo.tools.screen import (
+    ScreenCaptureError,
+    XlibScreenCapture,
+    XvfbFramebufferCapture,
+    framebuffer_path,
+)
+
+
+def _cpu_seconds() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+async def bench(name: str, tool: ComputerTool20250124, n: int):
+    await tool.screenshot()  # warm up connections and caches
+    latencies = []
+    cpu_start = _cpu_seconds()
+    for _ in range(n):
+        start = time.perf_counter()
+        result = await tool.screenshot()
+        latencies.append(time.perf_counter() - start)
+        assert result.image
+    cpu = (_cpu_seconds() - cpu_start) / n
+    print(
+        f"{name:>12}: median {statistics.median(latencies) * 1000:7.1f} ms, "
+        f"p95 {sorted(latencies)[int(n * 0.95) - 1] * 1000:7.1f} ms, "
+        f"cpu {cpu * 1000:7.1f} ms/screenshot"
+    )
+
+
+def open_framebuffer(tool: ComputerTool20250124) -> XvfbFramebufferCapture:
+    path = framebuffer_path(tool.display_num)
+    if path is None:
+        raise ScreenCaptureError("Xvfb keeps no framebuffer file (no -fbdir)")
+    return XvfbFramebufferCapture(path)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=20, help="screenshots per backend")
+    args = parser.parse_args()
+
+    legacy = ComputerTool20250124()
+    legacy._screen_capture = False  # force the gnome-screenshot/scrot path
+    await bench("subprocess", legacy, args.n)
+
+    backends = {
+        "xlib": lambda tool: XlibScreenCapture(tool.display_num),
+        "framebuffer": open_framebuffer,
+    }
+    for name, open_capture in backends.items():
+        tool = ComputerTool20250124()
+        try:
+            tool._screen_capture = open_capture(tool)
+        except ScreenCaptureError as e:
+            print(f"{name:>12}: unavailable ({e})")
+            continue
+        await bench(name, tool, args.n)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+"""
+Compare views of 100 lines of 1 MB and 100 MB files through their line index against
+reading the whole file as text. The first indexed view builds the index and is shown
+apart from the ones served by it.
+
+Run from computer-use-demo/, e.g. `python -m benchmarks.view_bench -n 5`.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+from computer_use_demo.tools.edit import EditTool20250124
+
+SIZES = {"1 MB": 1_000_000, "100 MB": 100_000_000}
+LINE = "{:09} the quick brown fox jumps over the lazy dog\n"
+
+
+async def bench(name: str, path: Path, n: int, indexed: bool):
+    tool = EditTool20250124()
+    lines = path.stat().st_size // len(LINE.format(0))
+    threshold = 0 if indexed else 1 << 60
+    latencies = []
+    with patch("computer_use_demo.tools.largefile.LARGE_FILE_BYTES", threshold):
+        for i in range(n + indexed):
+            first = (lines - 100) * i // (n + 1) + 1
+            start = time.perf_counter()
+            await tool(command="view", path=str(path), view_range=[first, first + 99])
+            latencies.append(time.perf_counter() - start)
+    if indexed:
+        print(f"{name:>7} {'indexed':>8} first view: {latencies.pop(0) * 1000:9.1f} ms")
+    print(
+        f"{name:>7} {'indexed' if indexed else 'as text':>8}       view: "
+        f"median {statistics.median(latencies) * 1000:9.1f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=5, help="views per variant")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, size in SIZES.items():
+            path = Path(tmp) / "file.txt"
+            lines = size // len(LINE.format(0))
+            path.write_text("".join(LINE.format(i) for i in range(lines)))
+            # indexes of files changed within the last second aren't cached
+            past = time.time() - 10
+            os.utime(path, (past, past))
+            for indexed in (True, False):
+                await bench(name, path, args.n, indexed)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
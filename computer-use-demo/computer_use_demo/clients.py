@@ -0,0 +1,136 @@
+"""
+Process-wide registry of pooled Anthropic API clients.
+
+Constructing a client per request throws away its httpx connection pool (and with it
+the TCP/TLS session and any HTTP/2 connection), so every turn of the sampling loop
+pays a fresh handshake. Clients are instead cached per (provider, api_key, base_url)
+and share one tunable connection pool with keep-alive and, when `h2` is installed,
+HTTP/2.
+"""
+
+import asyncio
+import os
+import weakref
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
+from anthropic import (
+    AsyncAnthropic,
+    AsyncAnthropicBedrock,
+    AsyncAnthropicVertex,
+    DefaultAsyncHttpxClient,
+)
+
+try:
+    import h2  # noqa: F401  # pyright: ignore[reportMissingImports]
+
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+AsyncClient = AsyncAnthropic | AsyncAnthropicBedrock | AsyncAnthropicVertex
+ClientKey = tuple[str, str | None, str | None]
+
+MAX_RETRIES: int = 4
+MAX_CONNECTIONS: int = int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS: int = int(
+    os.getenv("ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS", "20")
+)
+KEEPALIVE_EXPIRY: float = float(os.getenv("ANTHROPIC_KEEPALIVE_EXPIRY", "300"))
+HTTP2_ENABLED: bool = (
+    os.getenv("ANTHROPIC_HTTP2", "1").lower() not in ("0", "false", "no")
+    and _HTTP2_AVAILABLE
+)
+
+
+@dataclass
+class ClientStats:
+    """Counters describing how well clients and connections are being reused."""
+
+    clients_created: int = 0
+    clients_reused: int = 0
+    connections_created: int = 0
+    requests_sent: int = 0
+
+    @property
+    def connections_reused(self) -> int:
+        """Requests that were sent over an already-open connection."""
+        return max(0, self.requests_sent - self.connections_created)
+
+
+_stats = ClientStats()
+
+# httpx/anyio connections are bound to the event loop that opened them, so the
+# registry is partitioned per loop. In the FastAPI app this is a single partition;
+# streamlit runs a fresh loop per rerun and gets a fresh (then closed) partition.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[ClientKey, AsyncClient]]" = weakref.WeakKeyDictionary()
+
+
+async def _trace(event_name: str, info: dict[str, Any]):
+    if event_name in (
+        "connection.connect_tcp.complete",
+        "connection.connect_unix_socket.complete",
+    ):
+        _stats.connections_created += 1
+
+
+async def _on_request(request: httpx.Request):
+    _stats.requests_sent += 1
+    request.extensions["trace"] = _trace
+
+
+def _make_http_client() -> httpx.AsyncClient:
+    return DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        http2=HTTP2_ENABLED,
+        event_hooks={"request": [_on_request]},
+    )
+
+
+def _make_client(
+    provider: str, api_key: str | None, base_url: str | None
+) -> AsyncClient:
+    http_client = _make_http_client()
+    if provider == "anthropic":
+        return AsyncAnthropic(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=MAX_RETRIES,
+            http_client=http_client,
+        )
+    elif provider == "vertex":
+        return AsyncAnthropicVertex(base_url=base_url, http_client=http_client)
+    elif provider == "bedrock":
+        return AsyncAnthropicBedrock(base_url=base_url, http_client=http_client)
+    raise ValueError(f"Unknown API provider: {provider}")
+
+
+def get_client(
+    provider: str, api_key: str | None = None, base_url: str | None = None
+) -> AsyncClient:
+    """Return the pooled client for this provider/credentials, creating it once."""
+    loop_clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    key: ClientKey = (str(provider), api_key, base_url)
+    if (client := loop_clients.get(key)) is not None:
+        _stats.clients_reused += 1
+        return client
+    client = loop_clients[key] = _make_client(str(provider), api_key, base_url)
+    _stats.clients_created += 1
+    return client
+
+
+async def close_clients():
+    """Close every client opened on the running event loop and release its pool."""
+    loop_clients = _clients.pop(asyncio.get_running_loop(), {})
+    for client in loop_clients.values():
+        await client.close()
+
+
+def client_stats() -> ClientStats:
+    """Return a snapshot of the client and connection reuse counters."""
+    return ClientStats(**vars(_stats))
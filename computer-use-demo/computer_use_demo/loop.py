@@ -2,17 +2,16 @@
 Agentic sampling loop that calls the Anthropic API and local implementation of anthropic-defined computer use tools.
 """
 
+import asyncio
+import inspect
 import platform
-from collections.abc import Callable
+from collections.abc import Awaitable, Callable
 from datetime import datetime
 from enum import StrEnum
 from typing import Any, cast
 
 import httpx
 from anthropic import (
-    Anthropic,
-    AnthropicBedrock,
-    AnthropicVertex,
     APIError,
     APIResponseValidationError,
     APIStatusError,
@@ -26,18 +25,32 @@ from anthropic.types.beta import (
     BetaTextBlock,
     BetaTextBlockParam,
     BetaToolResultBlockParam,
+    BetaToolUseBlock,
     BetaToolUseBlockParam,
 )
 
+from clients import (
+    AsyncClient,
+    client_stats as client_stats,
+    close_clients as close_clients,
+    get_client,
+)
 from tools import (
     TOOL_GROUPS_BY_VERSION,
     ToolCollection,
     ToolResult,
+    ToolScheduler,
     ToolVersion,
 )
 
 PROMPT_CACHING_BETA_FLAG = "prompt-caching-2024-07-31"
 
+# raw stream events forwarded to `stream_callback`, serialized as plain dicts:
+# content_block_start announces a block (text, thinking or tool_use with its name),
+# content_block_delta carries a text_delta, input_json_delta or thinking_delta
+STREAMED_EVENT_TYPES = ("content_block_start", "content_block_delta")
+StreamEvent = dict[str, Any]
+
 
 class APIProvider(StrEnum):
     ANTHROPIC = "anthropic"
@@ -74,19 +87,33 @@ async def sampling_loop(
     system_prompt_suffix: str,
     messages: list[BetaMessageParam],
     output_callback: Callable[[BetaContentBlockParam], None],
-    tool_output_callback: Callable[[ToolResult, str], None],
+    tool_output_callback: Callable[[ToolResult, str], Awaitable[None] | None],
     api_response_callback: Callable[
         [httpx.Request, httpx.Response | object | None, Exception | None], None
     ],
     api_key: str,
+    base_url: str | None = None,
     only_n_most_recent_images: int | None = None,
     max_tokens: int = 4096,
     tool_version: ToolVersion,
     thinking_budget: int | None = None,
     token_efficient_tools_beta: bool = False,
+    stream_callback: Callable[[StreamEvent], None] | None = None,
+    stream_tool_output: bool = False,
 ):
     """
     Agentic sampling loop for the assistant/tool interaction of computer use.
+
+    When `stream_callback` is given the Messages streaming API is used, and text,
+    partial tool_use input and thinking deltas are forwarded as they arrive.
+    `output_callback` still receives each complete content block once the turn ends.
+
+    With `stream_tool_output`, tools that support it (bash) also pass `ToolProgress`
+    partial results to `tool_output_callback` while they run, ahead of the final
+    result.
+
+    If `tool_output_callback` returns an awaitable for a final result, it is awaited
+    before the loop goes on, which lets slow consumers of tool output hold it back.
     """
     
     print("TOOL_GROUPS_BY_VERSION keys:")
@@ -105,48 +132,69 @@ async def sampling_loop(
         text=f"{SYSTEM_PROMPT}{' ' + system_prompt_suffix if system_prompt_suffix else ''}",
     )
 
-    while True:
-        enable_prompt_caching = False
-        betas = [tool_group.beta_flag] if tool_group.beta_flag else []
-        if token_efficient_tools_beta:
-            betas.append("token-efficient-tools-2025-02-19")
-        image_truncation_threshold = only_n_most_recent_images or 0
-        if provider == APIProvider.ANTHROPIC:
-            client = Anthropic(api_key=api_key, max_retries=4)
-            enable_prompt_caching = True
-        elif provider == APIProvider.VERTEX:
-            client = AnthropicVertex()
-        elif provider == APIProvider.BEDROCK:
-            client = AnthropicBedrock()
-
-        if enable_prompt_caching:
-            betas.append(PROMPT_CACHING_BETA_FLAG)
-            _inject_prompt_caching(messages)
-            # Because cached reads are 10% of the price, we don't think it's
-            # ever sensible to break the cache by truncating images
-            only_n_most_recent_images = 0
-            # Use type ignore to bypass TypedDict check until SDK types are updated
-            system["cache_control"] = {"type": "ephemeral"}  # type: ignore
-
-        if only_n_most_recent_images:
-            _maybe_filter_to_n_most_recent_images(
-                messages,
-                only_n_most_recent_images,
-                min_removal_threshold=image_truncation_threshold,
+    # tool calls of a turn run concurrently unless they touch the same resource
+    tool_scheduler = ToolScheduler(tool_collection)
+    # scheduled tool runs of the current turn, by tool_use id
+    tool_runs: dict[str, asyncio.Task[ToolResult]] = {}
+
+    def submit_tool_use(tool_use_id: str, name: str, tool_input: dict[str, Any]):
+        progress_callback = (
+            (lambda progress: tool_output_callback(progress, tool_use_id))
+            if stream_tool_output
+            else None
+        )
+        tool_runs[tool_use_id] = tool_scheduler.submit(
+            name=name, tool_input=tool_input, progress_callback=progress_callback
+        )
+
+    def dispatch_tool_use(block: BetaToolUseBlock):
+        submit_tool_use(block.id, block.name, cast(dict[str, Any], block.input))
+
+    try:
+        while True:
+            enable_prompt_caching = False
+            betas = [tool_group.beta_flag] if tool_group.beta_flag else []
+            if token_efficient_tools_beta:
+                betas.append("token-efficient-tools-2025-02-19")
+            image_truncation_threshold = only_n_most_recent_images or 0
+            # clients are pooled per process so the connection survives across turns
+            client = get_client(
+                provider,
+                api_key=api_key if provider == APIProvider.ANTHROPIC else None,
+                base_url=base_url,
             )
-        extra_body = {}
-        if thinking_budget:
-            # Ensure we only send the required fields for thinking
-            extra_body = {
-                "thinking": {"type": "enabled", "budget_tokens": thinking_budget}
-            }
-
-        # Call the API
-        # we use raw_response to provide debug information to streamlit. Your
-        # implementation may be able call the SDK directly with:
-        # `response = client.messages.create(...)` instead.
-        try:
-            raw_response = client.beta.messages.with_raw_response.create(
+            if provider == APIProvider.ANTHROPIC:
+                enable_prompt_caching = True
+
+            if enable_prompt_caching:
+                betas.append(PROMPT_CACHING_BETA_FLAG)
+                _inject_prompt_caching(messages)
+                # Because cached reads are 10% of the price, we don't think it's
+                # ever sensible to break the cache by truncating images
+                only_n_most_recent_images = 0
+                # Use type ignore to bypass TypedDict check until SDK types are updated
+                system["cache_control"] = {"type": "ephemeral"}  # type: ignore
+
+            if only_n_most_recent_images:
+                _maybe_filter_to_n_most_recent_images(
+                    messages,
+                    only_n_most_recent_images,
+                    min_removal_threshold=image_truncation_threshold,
+                )
+            extra_body = {}
+            if thinking_budget:
+                # Ensure we only send the required fields for thinking
+                extra_body = {
+                    "thinking": {"type": "enabled", "budget_tokens": thinking_budget}
+                }
+
+            # Call the API
+            # we use raw_response to provide debug information to streamlit. Your
+            # implementation may be able call the SDK directly with:
+            # `response = await client.messages.create(...)` instead.
+            # The async client is used so that a slow model call never blocks the
+            # event loop shared with other sessions, tools and the web server.
+            request_params: dict[str, Any] = dict(
                 max_tokens=max_tokens,
                 messages=messages,
                 model=model,
@@ -155,44 +203,116 @@ async def sampling_loop(
                 betas=betas,
                 extra_body=extra_body,
             )
-        except (APIStatusError, APIResponseValidationError) as e:
-            api_response_callback(e.request, e.response, e)
-            return messages
-        except APIError as e:
-            api_response_callback(e.request, e.body, e)
-            return messages
-
-        api_response_callback(
-            raw_response.http_response.request, raw_response.http_response, None
-        )
-
-        response = raw_response.parse()
-
-        response_params = _response_to_params(response)
-        messages.append(
-            {
-                "role": "assistant",
-                "content": response_params,
-            }
-        )
-
-        tool_result_content: list[BetaToolResultBlockParam] = []
-        for content_block in response_params:
-            output_callback(content_block)
-            if content_block["type"] == "tool_use":
-                result = await tool_collection.run(
-                    name=content_block["name"],
-                    tool_input=cast(dict[str, Any], content_block["input"]),
-                )
-                tool_result_content.append(
-                    _make_api_tool_result(result, content_block["id"])
-                )
-                tool_output_callback(result, content_block["id"])
+            try:
+                if stream_callback is None:
+                    raw_response = await client.beta.messages.with_raw_response.create(
+                        **request_params
+                    )
+                    api_response_callback(
+                        raw_response.http_response.request,
+                        raw_response.http_response,
+                        None,
+                    )
+                    response = await raw_response.parse()
+                else:
+                    response = await _stream_response(
+                        client,
+                        request_params,
+                        stream_callback,
+                        api_response_callback,
+                        tool_use_callback=dispatch_tool_use,
+                    )
+            except (APIStatusError, APIResponseValidationError) as e:
+                tool_scheduler.cancel()
+                tool_runs.clear()
+                api_response_callback(e.request, e.response, e)
+                return messages
+            except APIError as e:
+                tool_scheduler.cancel()
+                tool_runs.clear()
+                api_response_callback(e.request, e.body, e)
+                return messages
+            except BaseException:
+                tool_scheduler.cancel()
+                tool_runs.clear()
+                raise
+
+            response_params = _response_to_params(response)
+            messages.append(
+                {
+                    "role": "assistant",
+                    "content": response_params,
+                }
+            )
 
-        if not tool_result_content:
-            return messages
+            # schedule every tool call up front (unless already dispatched while
+            # streaming), then collect the results in the order the model made them
+            for content_block in response_params:
+                if (
+                    content_block["type"] == "tool_use"
+                    and content_block["id"] not in tool_runs
+                ):
+                    submit_tool_use(
+                        content_block["id"],
+                        content_block["name"],
+                        cast(dict[str, Any], content_block["input"]),
+                    )
+
+            tool_result_content: list[BetaToolResultBlockParam] = []
+            try:
+                for content_block in response_params:
+                    output_callback(content_block)
+                    if content_block["type"] == "tool_use":
+                        result = await tool_runs.pop(content_block["id"])
+                        tool_result_content.append(
+                            _make_api_tool_result(result, content_block["id"])
+                        )
+                        pending = tool_output_callback(result, content_block["id"])
+                        if inspect.isawaitable(pending):
+                            await pending
+            except BaseException:
+                # don't leave the other tool calls running detached
+                tool_scheduler.cancel()
+                tool_runs.clear()
+                raise
+
+            if not tool_result_content:
+                return messages
+
+            messages.append({"content": tool_result_content, "role": "user"})
+    finally:
+        # tools hold processes and connections, e.g. the bash tool its shell
+        await tool_collection.close()
+
+
+async def _stream_response(
+    client: AsyncClient,
+    request_params: dict[str, Any],
+    stream_callback: Callable[[StreamEvent], None],
+    api_response_callback: Callable[
+        [httpx.Request, httpx.Response | object | None, Exception | None], None
+    ],
+    tool_use_callback: Callable[[BetaToolUseBlock], None] | None = None,
+) -> BetaMessage:
+    """
+    Stream a single model turn, forwarding content block starts and deltas to
+    `stream_callback`, and return the accumulated message.
 
-        messages.append({"content": tool_result_content, "role": "user"})
+    `tool_use_callback` is called with each tool_use block as soon as its input JSON
+    is complete, while the rest of the response is still being generated.
+    """
+    async with client.beta.messages.stream(**request_params) as stream:
+        api_response_callback(stream.response.request, stream.response, None)
+        async for event in stream:
+            if event.type in STREAMED_EVENT_TYPES:
+                stream_callback(cast(StreamEvent, event.model_dump(mode="json")))
+            elif (
+                event.type == "content_block_stop"
+                and event.content_block.type == "tool_use"
+                and tool_use_callback is not None
+            ):
+                tool_use_callback(event.content_block)
+        return await stream.get_final_message()
 
 
 def _maybe_filter_to_n_most_recent_images(
@@ -309,14 +429,15 @@ def _make_api_tool_result(
                     "text": _maybe_prepend_system_tool_result(result, result.output),
                 }
             )
-        if result.base64_image:
+        # tools hand over raw image bytes, which are only encoded here
+        if image_data := result.image_base64():
             tool_result_content.append(
                 {
                     "type": "image",
                     "source": {
                         "type": "base64",
                         "media_type": "image/png",
-                        "data": result.base64_image,
+                        "data": image_data,
                     },
                 }
             )
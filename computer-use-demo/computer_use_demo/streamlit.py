@@ -3,7 +3,6 @@ Entrypoint for streamlit, see https://docs.streamlit.io/
 """
 
 import asyncio
-import base64
 import os
 import subprocess
 import traceback
@@ -27,9 +26,10 @@ from streamlit.delta_generator import DeltaGenerator
 
 from computer_use_demo.loop import (
     APIProvider,
+    close_clients,
     sampling_loop,
 )
-from computer_use_demo.tools import ToolResult, ToolVersion
+from computer_use_demo.tools import ToolResult, ToolVersion, close_bash_sessions
 
 PROVIDER_TO_DEFAULT_MODEL_NAME: dict[APIProvider, str] = {
     APIProvider.ANTHROPIC: "claude-sonnet-4-20250514",
@@ -311,30 +311,36 @@ async def main():
             return
 
         with track_sampling_loop():
-            # run the agent sampling loop with the newest message
-            st.session_state.messages = await sampling_loop(
-                system_prompt_suffix=st.session_state.custom_system_prompt,
-                model=st.session_state.model,
-                provider=st.session_state.provider,
-                messages=st.session_state.messages,
-                output_callback=partial(_render_message, Sender.BOT),
-                tool_output_callback=partial(
-                    _tool_output_callback, tool_state=st.session_state.tools
-                ),
-                api_response_callback=partial(
-                    _api_response_callback,
-                    tab=http_logs,
-                    response_state=st.session_state.responses,
-                ),
-                api_key=st.session_state.api_key,
-                only_n_most_recent_images=st.session_state.only_n_most_recent_images,
-                tool_version=st.session_state.tool_versions,
-                max_tokens=st.session_state.output_tokens,
-                thinking_budget=st.session_state.thinking_budget
-                if st.session_state.thinking
-                else None,
-                token_efficient_tools_beta=st.session_state.token_efficient_tools_beta,
-            )
+            try:
+                # run the agent sampling loop with the newest message
+                st.session_state.messages = await sampling_loop(
+                    system_prompt_suffix=st.session_state.custom_system_prompt,
+                    model=st.session_state.model,
+                    provider=st.session_state.provider,
+                    messages=st.session_state.messages,
+                    output_callback=partial(_render_message, Sender.BOT),
+                    tool_output_callback=partial(
+                        _tool_output_callback, tool_state=st.session_state.tools
+                    ),
+                    api_response_callback=partial(
+                        _api_response_callback,
+                        tab=http_logs,
+                        response_state=st.session_state.responses,
+                    ),
+                    api_key=st.session_state.api_key,
+                    only_n_most_recent_images=st.session_state.only_n_most_recent_images,
+                    tool_version=st.session_state.tool_versions,
+                    max_tokens=st.session_state.output_tokens,
+                    thinking_budget=st.session_state.thinking_budget
+                    if st.session_state.thinking
+                    else None,
+                    token_efficient_tools_beta=st.session_state.token_efficient_tools_beta,
+                )
+            finally:
+                # every streamlit rerun runs on a fresh event loop, so release the
+                # pooled connections and bash sessions opened on this one
+                await close_clients()
+                await close_bash_sessions()
 
 
 def maybe_add_interruption_blocks():
@@ -504,8 +510,8 @@ def _render_message(
                     st.markdown(message.output)
             if message.error:
                 st.error(message.error)
-            if message.base64_image and not st.session_state.hide_images:
-                st.image(base64.b64decode(message.base64_image))
+            if (image := message.image_bytes()) and not st.session_state.hide_images:
+                st.image(image)
         elif isinstance(message, dict):
             if message["type"] == "text":
                 st.write(message["text"])
@@ -1,9 +1,23 @@
-from .base import CLIResult, ToolResult
-from .bash import BashTool20241022, BashTool20250124
-from .collection import ToolCollection
-from .computer import ComputerTool20241022, ComputerTool20250124
+from .base import CLIResult, ToolProgress, ToolResult
+from .bash import (
+    BashTool20241022,
+    BashTool20250124,
+    close_bash_sessions,
+    warm_bash_sessions,
+)
+from .capture import capture_stats
+from .collection import ToolCollection, ToolScheduler
+from .computer import (
+    ComputerTool20241022,
+    ComputerTool20250124,
+    close_display_connections,
+    settle_stats,
+)
 from .edit import EditTool20241022, EditTool20250124, EditTool20250429
 from .groups import TOOL_GROUPS_BY_VERSION, ToolVersion
+from .lineindex import line_index_stats
+from .listing import listing_stats
+from .run import run_stats
 
 __ALL__ = [
     BashTool20241022,
@@ -15,7 +29,17 @@ __ALL__ = [
     EditTool20250124,
     EditTool20250429,
     ToolCollection,
+    ToolProgress,
     ToolResult,
+    ToolScheduler,
     ToolVersion,
     TOOL_GROUPS_BY_VERSION,
+    capture_stats,
+    close_bash_sessions,
+    close_display_connections,
+    line_index_stats,
+    listing_stats,
+    run_stats,
+    settle_stats,
+    warm_bash_sessions,
 ]
@@ -1,13 +1,50 @@
+import base64
 from abc import ABCMeta, abstractmethod
 from dataclasses import dataclass, fields, replace
+from pathlib import PurePosixPath
 from typing import Any
 
 from anthropic.types.beta import BetaToolUnionParam
 
+FS_RESOURCE_PREFIX = "fs:"
+
+
+@dataclass(frozen=True)
+class Resource:
+    """
+    A shared resource touched by a tool call. Calls whose resources conflict are run
+    one after another; all other calls may run concurrently.
+    """
+
+    key: str
+    exclusive: bool = True
+
+    def conflicts_with(self, other: "Resource") -> bool:
+        if not (self.exclusive or other.exclusive):
+            return False
+        if self.key == other.key:
+            return True
+        # filesystem paths also conflict with their ancestors and descendants
+        if self.key.startswith(FS_RESOURCE_PREFIX) and other.key.startswith(
+            FS_RESOURCE_PREFIX
+        ):
+            a = PurePosixPath(self.key.removeprefix(FS_RESOURCE_PREFIX))
+            b = PurePosixPath(other.key.removeprefix(FS_RESOURCE_PREFIX))
+            return a.is_relative_to(b) or b.is_relative_to(a)
+        return False
+
+
+def fs_resource(path: str, exclusive: bool = True) -> Resource:
+    """The resource for a filesystem path."""
+    return Resource(f"{FS_RESOURCE_PREFIX}{path}", exclusive=exclusive)
+
 
 class BaseAnthropicTool(metaclass=ABCMeta):
     """Abstract base class for Anthropic-defined tools."""
 
+    # whether __call__ accepts a `progress_callback` to report partial results through
+    reports_progress: bool = False
+
     @abstractmethod
     def __call__(self, **kwargs) -> Any:
         """Executes the tool with the given arguments."""
@@ -19,6 +56,14 @@ class BaseAnthropicTool(metaclass=ABCMeta):
     ) -> BetaToolUnionParam:
         raise NotImplementedError
 
+    def resources(self, **kwargs) -> set[Resource]:
+        """The resources a call with these arguments touches; by default the whole tool."""
+        return {Resource(f"tool:{self.to_params()['name']}")}
+
+    async def close(self):
+        """Release what the tool holds once its sampling loop is done; by default nothing."""
+        return None
+
 
 @dataclass(kw_only=True, frozen=True)
 class ToolResult:
@@ -28,14 +73,29 @@ class ToolResult:
     error: str | None = None
     base64_image: str | None = None
     system: str | None = None
+    # a PNG image as raw bytes, which tools set instead of `base64_image`; it is only
+    # encoded where base64 is needed, see `image_base64`
+    image: bytes | None = None
 
     def __bool__(self):
         return any(getattr(self, field.name) for field in fields(self))
 
+    def image_base64(self) -> str | None:
+        """The image, base64 encoded."""
+        if self.image is not None:
+            return base64.b64encode(self.image).decode()
+        return self.base64_image
+
+    def image_bytes(self) -> bytes | None:
+        """The image as raw bytes."""
+        if self.image is not None:
+            return self.image
+        if self.base64_image is not None:
+            return base64.b64decode(self.base64_image)
+        return None
+
     def __add__(self, other: "ToolResult"):
-        def combine_fields(
-            field: str | None, other_field: str | None, concatenate: bool = True
-        ):
+        def combine_fields(field: Any, other_field: Any, concatenate: bool = True):
             if field and other_field:
                 if concatenate:
                     return field + other_field
@@ -47,6 +107,7 @@ class ToolResult:
             error=combine_fields(self.error, other.error),
             base64_image=combine_fields(self.base64_image, other.base64_image, False),
             system=combine_fields(self.system, other.system),
+            image=combine_fields(self.image, other.image, False),
         )
 
     def replace(self, **kwargs):
@@ -62,6 +123,10 @@ class ToolFailure(ToolResult):
     """A ToolResult that represents a failure."""
 
 
+class ToolProgress(ToolResult):
+    """Output a still running tool produced since its previous progress report."""
+
+
 class ToolError(Exception):
     """Raised when a tool encounters an error."""
 
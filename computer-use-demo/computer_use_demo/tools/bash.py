@@ -1,8 +1,125 @@
 import asyncio
+import codecs
 import os
-from typing import Any, Literal
+import re
+import signal
+import time
+import weakref
+from collections import deque
+from typing import Any, Callable, Literal
+from uuid import uuid4
 
-from .base import BaseAnthropicTool, CLIResult, ToolError, ToolResult
+from .base import (
+    BaseAnthropicTool,
+    CLIResult,
+    Resource,
+    ToolError,
+    ToolProgress,
+    ToolResult,
+    fs_resource,
+)
+from .capture import OutputCapture
+
+# commands that use the X display, and so are ordered with the computer tool's actions;
+# GUI programs find the display through $DISPLAY, which the shell inherits
+_DISPLAY_COMMAND = re.compile(
+    r"DISPLAY|\b(?:xdotool|xdg-open|xrandr|xset|xclip|xsel|xwd|xprop|xwininfo|wmctrl"
+    r"|scrot|gnome-screenshot|firefox(?:-esr)?|chromium|google-chrome|libreoffice"
+    r"|gedit|xterm|x11vnc)\b"
+)
+
+
+class _SentinelReader:
+    """
+    Reads a pipe of the shell as output arrives and splits it at sentinel lines,
+    looking for the sentinel only in newly read bytes.
+    """
+
+    _chunk_size: int = 64 * 1024
+
+    def __init__(self, stream: asyncio.StreamReader, sentinel: bytes):
+        self._stream = stream
+        self._sentinel = sentinel
+        # bytes read past the last sentinel, e.g. from background jobs
+        self._pending = bytearray()
+
+    async def read_until_sentinel(
+        self,
+        capture: OutputCapture,
+        on_output: Callable[[bytes | bytearray], None] | None = None,
+    ):
+        """
+        Write everything up to the next sentinel, or up to EOF if bash exits, to
+        `capture`, also passing it to `on_output` as it arrives.
+        """
+
+        def emit(data: bytes | bytearray):
+            capture.write(data)
+            if on_output is not None and data:
+                on_output(data)
+
+        # only a possible start of the sentinel is held back between reads; the
+        # buffer is modified in place, so nothing read is lost if this is cancelled
+        buffer = self._pending
+        while (index := buffer.find(self._sentinel)) == -1:
+            if (complete := len(buffer) - self._partial_sentinel_length(buffer)) > 0:
+                emit(buffer[:complete])
+                del buffer[:complete]
+            if not (chunk := await self._stream.read(self._chunk_size)):
+                emit(buffer)
+                buffer.clear()
+                return
+            buffer += chunk
+        emit(buffer[:index])
+        self._pending = buffer[index + len(self._sentinel) :]
+
+    def _partial_sentinel_length(self, buffer: bytearray) -> int:
+        """Length of the longest end of `buffer` that the sentinel starts with."""
+        for length in range(min(len(self._sentinel) - 1, len(buffer)), 0, -1):
+            if buffer.endswith(self._sentinel[:length]):
+                return length
+        return 0
+
+
+class _ProgressReporter:
+    """
+    Collects the output of a running command and reports what's new through a
+    progress callback, at most once per interval.
+    """
+
+    # characters of unreported output kept per stream; older ones are dropped
+    _max_pending: int = 16 * 1024
+
+    def __init__(self, callback: Callable[[ToolProgress], None], interval: float):
+        self._callback = callback
+        self._interval = interval
+        self._pending = {"output": "", "error": ""}
+        self._decoders = {
+            name: codecs.getincrementaldecoder("utf-8")(errors="replace")
+            for name in self._pending
+        }
+
+    def on_stdout(self, data: bytes | bytearray):
+        self._add("output", data)
+
+    def on_stderr(self, data: bytes | bytearray):
+        self._add("error", data)
+
+    def _add(self, name: str, data: bytes | bytearray):
+        text = self._pending[name] + self._decoders[name].decode(data)
+        self._pending[name] = text[-self._max_pending :]
+
+    def flush(self):
+        output, error = self._pending["output"], self._pending["error"]
+        if output or error:
+            self._pending = {"output": "", "error": ""}
+            self._callback(ToolProgress(output=output or None, error=error or None))
+
+    async def report_periodically(self):
+        """Flush every interval until cancelled."""
+        while True:
+            await asyncio.sleep(self._interval)
+            self.flush()
 
 
 class _BashSession:
@@ -12,13 +129,19 @@ class _BashSession:
     _process: asyncio.subprocess.Process
 
     command: str = "/bin/bash"
-    _output_delay: float = 0.2  # seconds
     _timeout: float = 120.0  # seconds
+    # how long an interrupted command gets to stop before the shell is given up on
+    _interrupt_timeout: float = 5.0  # seconds
+    _close_timeout: float = 1.0  # seconds
+    _progress_interval: float = 0.5  # seconds
     _sentinel: str = "<<exit>>"
 
     def __init__(self):
         self._started = False
         self._timed_out = False
+        # the output of a command whose run was cancelled, still being read
+        self._unfinished: asyncio.Future | None = None
+        self._delimiter = f"__BASH_TOOL_{uuid4().hex}__"
 
     async def start(self):
         if self._started:
@@ -33,9 +156,23 @@ class _BashSession:
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
         )
+        # we know these are not None because we created the process with PIPEs
+        assert self._process.stdout
+        assert self._process.stderr
+
+        sentinel_line = f"{self._sentinel}\n".encode()
+        self._stdout = _SentinelReader(self._process.stdout, sentinel_line)
+        self._stderr = _SentinelReader(self._process.stderr, sentinel_line)
 
         self._started = True
 
+    @property
+    def alive(self) -> bool:
+        """Whether the session can still run commands."""
+        return (
+            self._started and self._process.returncode is None and not self._timed_out
+        )
+
     def stop(self):
         """Terminate the bash shell."""
         if not self._started:
@@ -44,8 +181,94 @@ class _BashSession:
             return
         self._process.terminate()
 
-    async def run(self, command: str):
-        """Execute a command in the bash shell."""
+    async def close(self):
+        """
+        Terminate the bash shell along with anything it is still running, and wait for
+        it to exit, releasing its pipes.
+        """
+        self.stop()
+        assert self._process.stdin
+        self._process.stdin.close()
+        # the shell is the leader of its own process group (see start)
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(self._process.pid, sig)
+            except ProcessLookupError:
+                pass
+            try:
+                async with asyncio.timeout(self._close_timeout):
+                    await self._process.wait()
+                return
+            except TimeoutError:
+                continue
+
+    def _interrupt(self):
+        """Send SIGINT to the shell's commands, which stops the one in the foreground."""
+        # background jobs of a non-interactive shell ignore SIGINT, so they keep running
+        try:
+            os.killpg(self._process.pid, signal.SIGINT)
+        except ProcessLookupError:
+            pass
+
+    async def _finish_unfinished(self):
+        """Wait for a command whose run was cancelled to stop, see `run`."""
+        if (reading := self._unfinished) is None:
+            return
+        self._unfinished = None
+        done, _ = await asyncio.wait([reading], timeout=self._interrupt_timeout)
+        if not done:
+            reading.cancel()
+            self._timed_out = True
+
+    def _script(self, command: str) -> bytes:
+        """
+        The input that makes the shell run `command` and then print a sentinel on both
+        pipes, so we know when all of its output (and error output) has been read.
+        """
+        # the command is sourced from a here-document so that the trap can return from
+        # it on an interrupt without ending the shell; the trap is set every time, as
+        # bash doesn't restore it if it returned while waiting for a child process
+        return (
+            f"trap 'return 130 2>/dev/null' INT; . /dev/stdin <<'{self._delimiter}'\n"
+            f"{command}\n"
+            f"{self._delimiter}\n"
+            f"echo '{self._sentinel}'; echo '{self._sentinel}' >&2\n"
+        ).encode()
+
+    async def _read_output(
+        self,
+        stdout: OutputCapture,
+        stderr: OutputCapture,
+        progress: _ProgressReporter | None,
+    ):
+        try:
+            await asyncio.gather(
+                self._stdout.read_until_sentinel(
+                    stdout, progress.on_stdout if progress else None
+                ),
+                self._stderr.read_until_sentinel(
+                    stderr, progress.on_stderr if progress else None
+                ),
+            )
+        finally:
+            stdout.close()
+            stderr.close()
+
+    async def run(
+        self,
+        command: str,
+        progress_callback: Callable[[ToolProgress], None] | None = None,
+        timeout: float | None = None,
+    ):
+        """
+        Execute a command in the bash shell. If given, `progress_callback` receives the
+        output produced so far every `_progress_interval` seconds while it runs.
+
+        A command still running after `timeout` seconds (`_timeout` by default) is
+        interrupted, and its output so far is returned; the shell keeps its working
+        directory, environment and background jobs. The same happens if the run is
+        cancelled, with the next run waiting for the command to stop.
+        """
         if not self._started:
             raise ToolError("Session has not started.")
         if self._process.returncode is not None:
@@ -53,52 +276,169 @@ class _BashSession:
                 system="tool must be restarted",
                 error=f"bash has exited with returncode {self._process.returncode}",
             )
+        await self._finish_unfinished()
         if self._timed_out:
             raise ToolError(
-                f"timed out: bash has not returned in {self._timeout} seconds and must be restarted",
+                "timed out: an interrupted command did not stop and bash must be restarted",
             )
 
-        # we know these are not None because we created the process with PIPEs
         assert self._process.stdin
-        assert self._process.stdout
-        assert self._process.stderr
 
-        # send command to the process
-        self._process.stdin.write(
-            command.encode() + f"; echo '{self._sentinel}'\n".encode()
-        )
+        self._process.stdin.write(self._script(command))
         await self._process.stdin.drain()
 
-        # read output from the process, until the sentinel is found
+        # read output from the process as it arrives, until the sentinels are found,
+        # keeping only the head and tail of large outputs in memory
+        stdout = OutputCapture("bash_stdout")
+        stderr = OutputCapture("bash_stderr")
+        progress = reporting = None
+        if progress_callback is not None:
+            progress = _ProgressReporter(progress_callback, self._progress_interval)
+            reporting = asyncio.create_task(progress.report_periodically())
+        reading = asyncio.ensure_future(self._read_output(stdout, stderr, progress))
+        start = time.monotonic()
+        timeout = self._timeout if timeout is None else timeout
         try:
-            async with asyncio.timeout(self._timeout):
-                while True:
-                    await asyncio.sleep(self._output_delay)
-                    # if we read directly from stdout/stderr, it will wait forever for
-                    # EOF. use the StreamReader buffer directly instead.
-                    output = self._process.stdout._buffer.decode()  # pyright: ignore[reportAttributeAccessIssue]
-                    if self._sentinel in output:
-                        # strip the sentinel and break
-                        output = output[: output.index(self._sentinel)]
-                        break
-        except asyncio.TimeoutError:
-            self._timed_out = True
-            raise ToolError(
-                f"timed out: bash has not returned in {self._timeout} seconds and must be restarted",
-            ) from None
+            done, _ = await asyncio.wait([reading], timeout=timeout)
+            if interrupted := not done:
+                self._interrupt()
+                done, _ = await asyncio.wait([reading], timeout=self._interrupt_timeout)
+            if not done:
+                reading.cancel()
+                self._timed_out = True
+                raise ToolError(
+                    f"timed out: bash has not returned in {timeout} seconds, did not "
+                    "stop when interrupted and must be restarted",
+                )
+        except asyncio.CancelledError:
+            if not reading.done():
+                self._interrupt()
+                self._unfinished = reading
+            raise
+        finally:
+            # whatever wasn't reported yet is part of the final result
+            if reporting is not None:
+                reporting.cancel()
+        reading.result()
+        elapsed = time.monotonic() - start
 
+        output = stdout.text()
         if output.endswith("\n"):
             output = output[:-1]
 
-        error = self._process.stderr._buffer.decode()  # pyright: ignore[reportAttributeAccessIssue]
+        error = stderr.text()
         if error.endswith("\n"):
             error = error[:-1]
 
-        # clear the buffers so that the next output can be read correctly
-        self._process.stdout._buffer.clear()  # pyright: ignore[reportAttributeAccessIssue]
-        self._process.stderr._buffer.clear()  # pyright: ignore[reportAttributeAccessIssue]
+        if not interrupted:
+            return CLIResult(output=output, error=error)
+        return CLIResult(
+            output=output,
+            error=error,
+            system=f"the command was interrupted after running for {elapsed:.1f} "
+            "seconds; the shell and its state were kept",
+        )
+
+
+class _BashSessionPool:
+    """
+    Bash sessions started ahead of time, so that tools and restarts get a ready shell
+    instead of waiting for one to start. Taken sessions are replaced in the background.
+    """
+
+    _probe_timeout: float = 5.0  # seconds
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: deque[_BashSession] = deque()
+        self._warming: list[asyncio.Task[_BashSession]] = []
+
+    async def acquire(self) -> _BashSession:
+        """Take a healthy session from the pool, starting one only if none is ready."""
+        session = None
+        while self._idle and session is None:
+            if (candidate := self._idle.popleft()).alive:
+                session = candidate
+            else:
+                candidate.stop()
+        if session is None and self._warming:
+            # claim the session that started warming first, so it's not pooled
+            task = self._warming.pop(0)
+            try:
+                session = await asyncio.shield(task)
+            except Exception:
+                session = None
+        if session is None:
+            session = await self._start()
+        self.refill()
+        return session
+
+    def refill(self):
+        """Start warming sessions in the background until the pool is full again."""
+        for _ in range(self.size - len(self._idle) - len(self._warming)):
+            task = asyncio.create_task(self._start())
+            task.add_done_callback(self._on_warmed)
+            self._warming.append(task)
+
+    def _on_warmed(self, task: asyncio.Task[_BashSession]):
+        if task not in self._warming:
+            return  # claimed by acquire
+        self._warming.remove(task)
+        if not task.cancelled() and task.exception() is None:
+            self._idle.append(task.result())
+
+    async def _start(self) -> _BashSession:
+        session = _BashSession()
+        try:
+            await session.start()
+            # health check: the shell must be up and answering before it's handed out
+            async with asyncio.timeout(self._probe_timeout):
+                result = await session.run("true")
+            if not session.alive or result.system:
+                raise ToolError("bash session failed its health check")
+        except BaseException:
+            if session._started:
+                session.stop()
+            raise
+        return session
+
+    async def close(self):
+        """Stop all idle and warming sessions."""
+        # warming is bounded by the probe timeout; cancelling a subprocess while it's
+        # being spawned can leave asyncio waiting on it forever, so let it finish
+        warming, self._warming = self._warming, []
+        for session in await asyncio.gather(*warming, return_exceptions=True):
+            if isinstance(session, _BashSession):
+                self._idle.append(session)
+        while self._idle:
+            await self._idle.popleft().close()
+
 
-        return CLIResult(output=output, error=error)
+# number of bash sessions kept warm, per event loop
+SESSION_POOL_SIZE: int = int(os.getenv("BASH_SESSION_POOL_SIZE", "2"))
+
+# subprocess transports are bound to the event loop that started them
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _BashSessionPool]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_pool() -> _BashSessionPool:
+    loop = asyncio.get_running_loop()
+    if (pool := _pools.get(loop)) is None:
+        pool = _pools[loop] = _BashSessionPool(SESSION_POOL_SIZE)
+    return pool
+
+
+def warm_bash_sessions():
+    """Start filling the bash session pool of the running event loop in the background."""
+    _get_pool().refill()
+
+
+async def close_bash_sessions():
+    """Stop the pooled bash sessions of the running event loop."""
+    if (pool := _pools.pop(asyncio.get_running_loop(), None)) is not None:
+        await pool.close()
 
 
 class BashTool20250124(BaseAnthropicTool):
@@ -111,6 +451,7 @@ class BashTool20250124(BaseAnthropicTool):
 
     api_type: Literal["bash_20250124"] = "bash_20250124"
     name: Literal["bash"] = "bash"
+    reports_progress = True
 
     def __init__(self):
         self._session = None
@@ -122,26 +463,44 @@ class BashTool20250124(BaseAnthropicTool):
             "name": self.name,
         }
 
+    def resources(self, command: str | None = None, **kwargs) -> set[Resource]:
+        # commands share one shell, and may read or write anywhere on the filesystem
+        resources = {Resource("bash"), fs_resource("/")}
+        if command and _DISPLAY_COMMAND.search(command):
+            resources.add(Resource("display"))
+        return resources
+
     async def __call__(
-        self, command: str | None = None, restart: bool = False, **kwargs
+        self,
+        command: str | None = None,
+        restart: bool = False,
+        progress_callback: Callable[[ToolProgress], None] | None = None,
+        **kwargs,
     ):
         if restart:
             if self._session:
-                self._session.stop()
-            self._session = _BashSession()
-            await self._session.start()
+                await self._session.close()
+            self._session = await _get_pool().acquire()
 
             return ToolResult(system="tool has been restarted.")
 
         if self._session is None:
-            self._session = _BashSession()
-            await self._session.start()
+            self._session = await _get_pool().acquire()
 
         if command is not None:
-            return await self._session.run(command)
+            return await self._session.run(command, progress_callback)
 
         raise ToolError("no command provided.")
 
+    async def close(self):
+        """
+        Stop the tool's shell. It isn't returned to the pool, as the commands run in it
+        may have changed its directory and environment.
+        """
+        if self._session:
+            session, self._session = self._session, None
+            await session.close()
+
 
 class BashTool20241022(BashTool20250124):
     api_type: Literal["bash_20250124"] = "bash_20250124"  # pyright: ignore[reportIncompatibleVariableOverride]
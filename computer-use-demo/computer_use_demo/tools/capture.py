@@ -0,0 +1,161 @@
+"""Bounded capture of command output, spilling anything that doesn't fit to disk."""
+
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from uuid import uuid4
+
+# bytes of the start and end of an output kept in memory and shown to the model
+HEAD_BYTES: int = int(os.getenv("OUTPUT_CAPTURE_HEAD_BYTES", "8000"))
+TAIL_BYTES: int = int(os.getenv("OUTPUT_CAPTURE_TAIL_BYTES", "8000"))
+# where complete outputs that outgrow the head and tail are written (a tmpfs)
+SPILL_DIR: str = os.getenv("OUTPUT_CAPTURE_SPILL_DIR", "/tmp/outputs/spill")
+# the most bytes the spill files may take together, as the tmpfs is backed by memory;
+# the oldest ones are removed once a new one takes them past it
+SPILL_DIR_MAX_BYTES: int = int(
+    os.getenv("OUTPUT_CAPTURE_SPILL_DIR_MAX_BYTES", str(256 * 1024 * 1024))
+)
+
+
+@dataclass
+class CaptureStats:
+    """Counters describing how much command output was captured and held in memory."""
+
+    captures: int = 0
+    bytes_captured: int = 0
+    bytes_spilled: int = 0
+    spill_files: int = 0
+    spill_files_removed: int = 0
+    # the most output bytes any single capture held in memory at once
+    peak_buffered_bytes: int = 0
+
+
+_stats = CaptureStats()
+
+
+def capture_stats() -> CaptureStats:
+    """Return a snapshot of the output capture counters."""
+    return CaptureStats(**vars(_stats))
+
+
+def _trim_spill_dir(spill_dir: str, keep: Path):
+    """
+    Remove the oldest spill files in `spill_dir` until the rest take at most
+    `SPILL_DIR_MAX_BYTES`, keeping `keep`, the one just written.
+    """
+    files = []
+    with os.scandir(spill_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(".log") and entry.is_file(follow_symlinks=False):
+                info = entry.stat(follow_symlinks=False)
+                files.append((info.st_mtime_ns, info.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= SPILL_DIR_MAX_BYTES:
+            break
+        if path == str(keep):
+            continue
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            # removed by another capture meanwhile
+            pass
+        else:
+            _stats.spill_files_removed += 1
+        total -= size
+
+
+class OutputCapture:
+    """
+    Keeps the head and tail of an output in memory. Once the output outgrows them, all
+    of it is also written to a spill file, which the truncated view points to.
+    """
+
+    def __init__(
+        self,
+        name: str = "output",
+        head_bytes: int | None = None,
+        tail_bytes: int | None = None,
+        spill_dir: str | None = None,
+    ):
+        self.name = name
+        self.head_bytes = HEAD_BYTES if head_bytes is None else head_bytes
+        self.tail_bytes = TAIL_BYTES if tail_bytes is None else tail_bytes
+        self.spill_dir = SPILL_DIR if spill_dir is None else spill_dir
+        self.total_bytes = 0
+        self.peak_bytes = 0
+        self.spill_path: Path | None = None
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._spill_file = None
+        _stats.captures += 1
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_bytes > self.head_bytes + self.tail_bytes
+
+    def write(self, data: bytes | bytearray | memoryview):
+        if not data:
+            return
+        self.total_bytes += len(data)
+        _stats.bytes_captured += len(data)
+        if self._spill_file is not None:
+            self._spill(data)
+        if (room := self.head_bytes - len(self._head)) > 0:
+            self._head += data[:room]
+            data = data[room:]
+        self._tail += data
+        if len(self._tail) > self.tail_bytes:
+            if self._spill_file is None:
+                self._start_spill(data)
+            # deleting from the front of a bytearray doesn't move the rest
+            del self._tail[: len(self._tail) - self.tail_bytes]
+        buffered = len(self._head) + len(self._tail)
+        self.peak_bytes = max(self.peak_bytes, buffered)
+        _stats.peak_buffered_bytes = max(_stats.peak_buffered_bytes, buffered)
+
+    def _start_spill(self, data: bytes | bytearray | memoryview):
+        """Open the spill file and write everything captured so far, up to `data`."""
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self.spill_path = Path(self.spill_dir) / f"{self.name}_{uuid4().hex}.log"
+        self._spill_file = open(self.spill_path, "wb")
+        _stats.spill_files += 1
+        # the tail still holds everything past the head, including `data`
+        self._spill(self._head)
+        self._spill(self._tail)
+
+    def _spill(self, data: bytes | bytearray | memoryview):
+        assert self._spill_file is not None
+        self._spill_file.write(data)
+        _stats.bytes_spilled += len(data)
+
+    def getvalue(self) -> bytes:
+        """The captured bytes; only the head and tail if the output was truncated."""
+        return bytes(self._head + self._tail)
+
+    def text(self) -> str:
+        """
+        The output as text for the model, with a note in place of anything omitted from
+        the middle that says where the full output was saved.
+        """
+        head = self._head.decode(errors="replace")
+        if not self.truncated:
+            return head + self._tail.decode(errors="replace")
+        omitted = self.total_bytes - len(self._head) - len(self._tail)
+        return (
+            f"{head}\n<response clipped><NOTE>{omitted} bytes of output were omitted "
+            f"here. The full output was saved to {self.spill_path}; search inside it "
+            f"with `grep -n` or view parts of it with `sed -n`.</NOTE>\n"
+            f"{self._tail.decode(errors='replace')}"
+        )
+
+    def close(self):
+        """
+        Flush and close the spill file, if any; the in-memory view stays readable. Older
+        spill files are removed if the spill directory outgrew its limit.
+        """
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+            assert self.spill_path is not None
+            _trim_spill_dir(self.spill_dir, self.spill_path)
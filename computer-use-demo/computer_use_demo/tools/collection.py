@@ -1,16 +1,21 @@
 """Collection classes for managing multiple tools."""
 
-from typing import Any
+import asyncio
+from typing import Any, Callable
 
 from anthropic.types.beta import BetaToolUnionParam
 
 from .base import (
     BaseAnthropicTool,
+    Resource,
     ToolError,
     ToolFailure,
+    ToolProgress,
     ToolResult,
 )
 
+ProgressCallback = Callable[[ToolProgress], None]
+
 
 class ToolCollection:
     """A collection of anthropic-defined tools."""
@@ -24,11 +29,93 @@ class ToolCollection:
     ) -> list[BetaToolUnionParam]:
         return [tool.to_params() for tool in self.tools]
 
-    async def run(self, *, name: str, tool_input: dict[str, Any]) -> ToolResult:
+    def resources(self, *, name: str, tool_input: dict[str, Any]) -> set[Resource]:
+        """The shared resources a call to the named tool would touch."""
+        tool = self.tool_map.get(name)
+        if not tool:
+            return set()
+        return tool.resources(**tool_input)
+
+    async def run(
+        self,
+        *,
+        name: str,
+        tool_input: dict[str, Any],
+        progress_callback: ProgressCallback | None = None,
+    ) -> ToolResult:
         tool = self.tool_map.get(name)
         if not tool:
             return ToolFailure(error=f"Tool {name} is invalid")
         try:
+            if progress_callback is not None and tool.reports_progress:
+                return await tool(**tool_input, progress_callback=progress_callback)
             return await tool(**tool_input)
         except ToolError as e:
             return ToolFailure(error=e.message)
+
+    async def close(self):
+        """Close every tool, see `BaseAnthropicTool.close`."""
+        for tool in self.tools:
+            await tool.close()
+
+
+class ToolScheduler:
+    """
+    Runs the tool calls of a turn concurrently, except that a call waits for every
+    earlier call it shares a conflicting resource with (the display, the bash session,
+    a filesystem path), so dependent calls still happen in the order they were made.
+    """
+
+    def __init__(self, tool_collection: ToolCollection):
+        self.tool_collection = tool_collection
+        self._pending: list[tuple[set[Resource], asyncio.Task[ToolResult]]] = []
+
+    def submit(
+        self,
+        *,
+        name: str,
+        tool_input: dict[str, Any],
+        progress_callback: ProgressCallback | None = None,
+    ) -> asyncio.Task[ToolResult]:
+        """
+        Schedule a tool call and return the task that resolves to its result. Tools
+        that report progress pass partial results to `progress_callback` meanwhile.
+        """
+        resources = self.tool_collection.resources(name=name, tool_input=tool_input)
+        self._pending = [(r, task) for r, task in self._pending if not task.done()]
+        blockers = [
+            task
+            for pending_resources, task in self._pending
+            if _conflicts(resources, pending_resources)
+        ]
+        task = asyncio.create_task(
+            self._run_after(blockers, name, tool_input, progress_callback)
+        )
+        self._pending.append((resources, task))
+        return task
+
+    def cancel(self):
+        """Cancel every call that has not finished yet."""
+        for _, task in self._pending:
+            task.cancel()
+        self._pending.clear()
+
+    async def _run_after(
+        self,
+        blockers: list[asyncio.Task[ToolResult]],
+        name: str,
+        tool_input: dict[str, Any],
+        progress_callback: ProgressCallback | None,
+    ) -> ToolResult:
+        if blockers:
+            # only wait for completion; each result is collected by its own caller
+            await asyncio.wait(blockers)
+        if progress_callback is None:
+            return await self.tool_collection.run(name=name, tool_input=tool_input)
+        return await self.tool_collection.run(
+            name=name, tool_input=tool_input, progress_callback=progress_callback
+        )
+
+
+def _conflicts(a: set[Resource], b: set[Resource]) -> bool:
+    return any(x.conflicts_with(y) for x in a for y in b)
@@ -1,23 +1,46 @@
 import asyncio
-import base64
 import os
 import shlex
 import shutil
+import threading
+import time
+from dataclasses import dataclass
 from enum import StrEnum
 from pathlib import Path
-from typing import Literal, TypedDict, cast, get_args
+from typing import Any, Callable, Literal, TypedDict, cast, get_args
 from uuid import uuid4
 
 from anthropic.types.beta import BetaToolComputerUse20241022Param, BetaToolUnionParam
 
-from .base import BaseAnthropicTool, ToolError, ToolResult
+from .base import BaseAnthropicTool, Resource, ToolError, ToolResult
 from .run import run
+from .screen import ScreenCapture, ScreenCaptureError, open_screen_capture
+from .xinput import (
+    InputInterrupted,
+    UnsupportedCommand,
+    XInputError,
+    XTestInput,
+    open_input,
+)
 
 OUTPUT_DIR = "/tmp/outputs"
 
 TYPING_DELAY_MS = 12
 TYPING_GROUP_SIZE = 50
 
+# "xtest" sends xdotool commands in-process over a persistent X connection when the
+# display supports it, "xdotool" always spawns the xdotool binary
+INPUT_BACKEND = os.getenv("COMPUTER_INPUT_BACKEND", "xtest")
+
+# how the post-action screenshot waits for the screen to settle: "stable" samples
+# frames until the screen stops changing, "fixed" always sleeps _screenshot_delay
+SETTLE_MODE = os.getenv("SCREENSHOT_SETTLE_MODE", "stable")
+SETTLE_MIN_DELAY = float(os.getenv("SCREENSHOT_SETTLE_MIN_DELAY", "0.1"))
+SETTLE_MAX_DELAY = float(os.getenv("SCREENSHOT_SETTLE_MAX_DELAY", "2.0"))
+# the screen counts as settled once it has not changed for this long
+SETTLE_QUIET_PERIOD = float(os.getenv("SCREENSHOT_SETTLE_QUIET_PERIOD", "0.3"))
+SETTLE_SAMPLE_INTERVAL = 0.05
+
 Action_20241022 = Literal[
     "key",
     "type",
@@ -79,6 +102,65 @@ class ComputerToolOptions(TypedDict):
     display_number: int | None
 
 
+@dataclass
+class SettleStats:
+    """Time spent waiting for the screen to settle before post-action screenshots."""
+
+    actions: int = 0
+    timeouts: int = 0
+    waited_seconds: float = 0.0
+    # compared to always sleeping the fixed _screenshot_delay
+    saved_seconds: float = 0.0
+
+    @property
+    def saved_seconds_per_action(self) -> float:
+        return self.saved_seconds / self.actions if self.actions else 0.0
+
+
+_settle_stats = SettleStats()
+
+
+def settle_stats() -> SettleStats:
+    """Return a snapshot of the screen settling counters."""
+    return SettleStats(**vars(_settle_stats))
+
+
+# the in-process capture sources and input channels, per display. Each holds an X
+# connection (a capture possibly a framebuffer mapping too), and tools are made anew
+# for every sampling loop, so they share these rather than opening their own.
+_screen_captures: dict[int | None, ScreenCapture] = {}
+_inputs: dict[int | None, XTestInput] = {}
+# tools may be made on the event loops of different threads
+_shared_lock = threading.Lock()
+
+
+def _open_shared(shared: dict, display_num: int | None, open_device: Callable):
+    """The device of `display_num` in `shared`, opened by `open_device` if need be."""
+    with _shared_lock:
+        if (device := shared.get(display_num)) is None:
+            if (device := open_device(display_num)) is not None:
+                shared[display_num] = device
+        return device
+
+
+def _close_shared(shared: dict, display_num: int | None, device: Any):
+    """Close a device that failed, so that the next tool opens a new one."""
+    with _shared_lock:
+        if shared.get(display_num) is device:
+            del shared[display_num]
+    device.close()
+
+
+def close_display_connections():
+    """Close the X connections and framebuffer mappings shared by the computer tools."""
+    with _shared_lock:
+        devices = [*_screen_captures.values(), *_inputs.values()]
+        _screen_captures.clear()
+        _inputs.clear()
+    for device in devices:
+        device.close()
+
+
 def chunks(s: str, chunk_size: int) -> list[str]:
     return [s[i : i + chunk_size] for i in range(0, len(s), chunk_size)]
 
@@ -95,7 +177,19 @@ class BaseComputerTool:
     display_num: int | None
 
     _screenshot_delay = 2.0
+    _settle_mode = SETTLE_MODE
+    _settle_min_delay = SETTLE_MIN_DELAY
+    _settle_max_delay = SETTLE_MAX_DELAY
+    _settle_quiet_period = SETTLE_QUIET_PERIOD
+    _settle_sample_interval = SETTLE_SAMPLE_INTERVAL
     _scaling_enabled = True
+    # None until first used, or after the one in use failed; False once in-process
+    # capture turned out unavailable
+    _screen_capture: ScreenCapture | None | Literal[False] = None
+    # likewise for the in-process input channel
+    _input: XTestInput | None | Literal[False] = (
+        None if INPUT_BACKEND == "xtest" else False
+    )
 
     @property
     def options(self) -> ComputerToolOptions:
@@ -163,6 +257,8 @@ class BaseComputerTool:
                 command_parts = [self.xdotool, f"key -- {text}"]
                 return await self.shell(" ".join(command_parts))
             elif action == "type":
+                if await self._type_in_process(text):
+                    return (await self.screenshot()).replace(output="")
                 results: list[ToolResult] = []
                 for chunk in chunks(text, TYPING_GROUP_SIZE):
                     command_parts = [
@@ -172,11 +268,9 @@ class BaseComputerTool:
                     results.append(
                         await self.shell(" ".join(command_parts), take_screenshot=False)
                     )
-                screenshot_base64 = (await self.screenshot()).base64_image
-                return ToolResult(
+                return (await self.screenshot()).replace(
                     output="".join(result.output or "" for result in results),
                     error="".join(result.error or "" for result in results),
-                    base64_image=screenshot_base64,
                 )
 
         if action in (
@@ -213,6 +307,10 @@ class BaseComputerTool:
 
         raise ToolError(f"Invalid action: {action}")
 
+    def resources(self, **kwargs) -> set[Resource]:
+        # every action drives or captures the same X display
+        return {Resource("display")}
+
     def validate_and_get_coordinates(self, coordinate: tuple[int, int] | None = None):
         if not isinstance(coordinate, list) or len(coordinate) != 2:
             raise ToolError(f"{coordinate} must be a tuple of length 2")
@@ -222,7 +320,10 @@ class BaseComputerTool:
         return self.scale_coordinates(ScalingSource.API, coordinate[0], coordinate[1])
 
     async def screenshot(self):
-        """Take a screenshot of the current screen and return the base64 encoded image."""
+        """Take a screenshot of the current screen and return the PNG image."""
+        if (png := await self._capture_in_process()) is not None:
+            return ToolResult(image=png)
+
         output_dir = Path(OUTPUT_DIR)
         output_dir.mkdir(parents=True, exist_ok=True)
         path = output_dir / f"screenshot_{uuid4().hex}.png"
@@ -244,22 +345,142 @@ class BaseComputerTool:
             )
 
         if path.exists():
-            return result.replace(
-                base64_image=base64.b64encode(path.read_bytes()).decode()
-            )
+            return result.replace(image=path.read_bytes())
         raise ToolError(f"Failed to take screenshot: {result.error}")
 
+    async def _capture_in_process(self) -> bytes | None:
+        """
+        Grab, resize and PNG encode the screen without spawning any process or touching
+        the disk. Returns None when no in-process capture source is available.
+        """
+        if (capture := self._get_screen_capture()) is None:
+            return None
+        size = None
+        if self._scaling_enabled:
+            size = self.scale_coordinates(
+                ScalingSource.COMPUTER, self.width, self.height
+            )
+        try:
+            # grabbing and encoding is CPU bound, keep it off the event loop
+            return await asyncio.to_thread(capture.grab_png, size)
+        except ScreenCaptureError:
+            self._disable_screen_capture()
+            return None
+
+    def _get_screen_capture(self) -> ScreenCapture | None:
+        if self._screen_capture is None:
+            self._screen_capture = (
+                _open_shared(_screen_captures, self.display_num, open_screen_capture)
+                or False
+            )
+        return self._screen_capture or None
+
+    def _disable_screen_capture(self):
+        """Drop a capture that failed; the next call opens a new one."""
+        if self._screen_capture:
+            _close_shared(_screen_captures, self.display_num, self._screen_capture)
+            self._screen_capture = None
+
+    async def _wait_for_settle(self):
+        """
+        Wait for the screen to settle after an action. In "stable" mode, frames are
+        sampled until the screen has not changed for the quiet period, bounded by the
+        minimum and maximum settle delays; otherwise, or when frames cannot be sampled
+        in-process, this sleeps the fixed screenshot delay.
+        """
+        start = time.monotonic()
+        timed_out = False
+        if self._settle_mode != "stable" or self._get_screen_capture() is None:
+            await asyncio.sleep(self._screenshot_delay)
+        else:
+            try:
+                timed_out = not await self._wait_for_stable_screen(start)
+            except ScreenCaptureError:
+                self._disable_screen_capture()
+                remaining = self._screenshot_delay - (time.monotonic() - start)
+                await asyncio.sleep(max(0.0, remaining))
+        waited = time.monotonic() - start
+        _settle_stats.actions += 1
+        _settle_stats.timeouts += timed_out
+        _settle_stats.waited_seconds += waited
+        _settle_stats.saved_seconds += self._screenshot_delay - waited
+
+    async def _wait_for_stable_screen(self, start: float) -> bool:
+        """Sample frame digests until they stop changing. Returns False on timeout."""
+        capture = cast(ScreenCapture, self._screen_capture)
+        deadline = start + self._settle_max_delay
+        await asyncio.sleep(self._settle_min_delay)
+        digest = await asyncio.to_thread(capture.frame_digest)
+        unchanged_since = time.monotonic()
+        while (now := time.monotonic()) - unchanged_since < self._settle_quiet_period:
+            if now >= deadline:
+                return False
+            await asyncio.sleep(min(self._settle_sample_interval, deadline - now))
+            if (latest := await asyncio.to_thread(capture.frame_digest)) != digest:
+                digest = latest
+                unchanged_since = time.monotonic()
+        return True
+
     async def shell(self, command: str, take_screenshot=True) -> ToolResult:
         """Run a shell command and return the output, error, and optionally a screenshot."""
-        _, stdout, stderr = await run(command)
-        base64_image = None
+        if (stdout := await self._send_input_in_process(command)) is not None:
+            stderr = ""
+        else:
+            _, stdout, stderr = await run(command)
 
         if take_screenshot:
-            # delay to let things settle before taking a screenshot
-            await asyncio.sleep(self._screenshot_delay)
-            base64_image = (await self.screenshot()).base64_image
-
-        return ToolResult(output=stdout, error=stderr, base64_image=base64_image)
+            # let things settle before taking a screenshot
+            await self._wait_for_settle()
+            return (await self.screenshot()).replace(output=stdout, error=stderr)
+
+        return ToolResult(output=stdout, error=stderr)
+
+    async def _send_input_in_process(self, command: str) -> str | None:
+        """
+        Run an xdotool command over the persistent XTEST channel instead of spawning
+        xdotool. Returns None when the command has to go through the shell instead.
+        """
+        prefix = f"{self.xdotool} "
+        if not command.startswith(prefix) or (xinput := self._get_input()) is None:
+            return None
+        try:
+            # sending may sleep between events (click/type delays), keep it off the loop
+            return await asyncio.to_thread(xinput.run, command[len(prefix) :])
+        except UnsupportedCommand:
+            return None
+        except XInputError:
+            self._disable_input()
+            return None
+
+    async def _type_in_process(self, text: str) -> bool:
+        """
+        Type the whole text as one stream of XTEST events. Returns False when it has to
+        be typed through xdotool instead.
+        """
+        if (xinput := self._get_input()) is None:
+            return False
+        try:
+            await asyncio.to_thread(xinput.type_text, text)
+            return True
+        except UnsupportedCommand:
+            return False
+        except InputInterrupted as e:
+            self._disable_input()
+            # part of the text may have been typed, so retrying could duplicate it
+            raise ToolError(str(e)) from e
+        except XInputError:
+            self._disable_input()
+            return False
+
+    def _get_input(self) -> XTestInput | None:
+        if self._input is None:
+            self._input = _open_shared(_inputs, self.display_num, open_input) or False
+        return self._input or None
+
+    def _disable_input(self):
+        if self._input:
+            _close_shared(_inputs, self.display_num, self._input)
+        self._input = False
 
     def scale_coordinates(self, source: ScalingSource, x: int, y: int):
         """Scale coordinates to a target maximum resolution."""
@@ -1,9 +1,28 @@
-from collections import defaultdict
+import asyncio
+import mmap
 from pathlib import Path
-from typing import Any, Literal, get_args
-
-from .base import BaseAnthropicTool, CLIResult, ToolError, ToolResult
-from .run import maybe_truncate, run
+from typing import Any, Callable, Literal, get_args
+
+from .base import (
+    BaseAnthropicTool,
+    CLIResult,
+    Resource,
+    ToolError,
+    ToolResult,
+    fs_resource,
+)
+from .history import EditHistory, file_stamp
+from .largefile import (
+    count_lines,
+    line_start,
+    lines_after,
+    lines_before,
+    map_large_file,
+    splice,
+)
+from .lineindex import LineIndex, invalidate_line_index, line_index
+from .listing import invalidate_listings, list_directory
+from .run import MAX_RESPONSE_LEN, maybe_truncate
 
 Command_20250124 = Literal[
     "view",
@@ -22,7 +41,152 @@ Command_20250429 = Literal[
 SNIPPET_LINES: int = 4
 
 
-class EditTool20250124(BaseAnthropicTool):
+class _LargeFileEdits:
+    """
+    str_replace and insert for large files, which are edited on disk (see
+    `map_large_file`), and views through line indexes; shared by the edit tools.
+    """
+
+    _file_history: EditHistory
+    _make_output: Callable[..., str]
+
+    def _str_replace_on_disk(
+        self,
+        path: Path,
+        data: mmap.mmap,
+        old_str: str,
+        new_str: str | None,
+        stamp: tuple[int, int, int] | None,
+    ):
+        """str_replace for a large file, which is edited on disk; see `map_large_file`."""
+        old_str = old_str.expandtabs()
+        new_str = new_str.expandtabs() if new_str is not None else ""
+        old, new = old_str.encode(), new_str.encode()
+
+        # Check if old_str is unique in the file, in a single pass over it
+        offset = data.find(old)
+        if offset == -1:
+            raise ToolError(
+                f"No replacement was performed, old_str `{old_str}` did not appear verbatim in {path}."
+            )
+        if data.find(old, offset + len(old)) != -1:
+            raise ToolError(
+                f"No replacement was performed. Multiple occurrences of old_str `{old_str}` in lines {self._lines_containing(data, old)}. Please ensure it is unique"
+            )
+
+        # Create a snippet of the edited section, from the bytes around the replacement
+        replacement_line = count_lines(data, offset)
+        start_line = max(0, replacement_line - SNIPPET_LINES)
+        snippet = (
+            data[lines_before(data, offset, replacement_line - start_line) : offset]
+            + new
+            + data[
+                offset + len(old) : lines_after(data, offset + len(old), SNIPPET_LINES)
+            ]
+        ).decode()
+
+        self._write_on_disk(path, data, offset, old, new, stamp)
+
+        # Prepare the success message
+        success_msg = f"The file {path} has been edited. "
+        success_msg += self._make_output(
+            snippet, f"a snippet of {path}", start_line + 1
+        )
+        success_msg += "Review the changes and make sure they are as expected. Edit the file again if necessary."
+
+        return CLIResult(output=success_msg)
+
+    def _insert_on_disk(
+        self,
+        path: Path,
+        data: mmap.mmap,
+        insert_line: int,
+        new_str: str,
+        stamp: tuple[int, int, int] | None,
+    ):
+        """insert for a large file, which is edited on disk; see `map_large_file`."""
+        new_str = new_str.expandtabs()
+        n_lines_file = count_lines(data, len(data)) + 1
+
+        if insert_line < 0 or insert_line > n_lines_file:
+            raise ToolError(
+                f"Invalid `insert_line` parameter: {insert_line}. It should be within the range of lines of the file: {[0, n_lines_file]}"
+            )
+
+        start = line_start(data, max(0, insert_line - SNIPPET_LINES)) or 0
+        if insert_line == n_lines_file:
+            # after the last line, which has no line break of its own
+            offset = len(data)
+            inserted = b"\n" + new_str.encode()
+            before = data[start:].decode().split("\n")
+            after = []
+        else:
+            offset = line_start(data, insert_line) or 0
+            inserted = new_str.encode() + b"\n"
+            before = (
+                data[start : offset - 1].decode().split("\n") if insert_line else []
+            )
+            end = lines_after(data, offset, SNIPPET_LINES - 1)
+            after = data[offset:end].decode().split("\n")
+        snippet_lines = before + new_str.split("\n") + after
+
+        self._write_on_disk(path, data, offset, b"", inserted, stamp)
+
+        success_msg = f"The file {path} has been edited. "
+        success_msg += self._make_output(
+            "\n".join(snippet_lines),
+            "a snippet of the edited file",
+            max(1, insert_line - SNIPPET_LINES + 1),
+        )
+        success_msg += "Review the changes and make sure they are as expected (correct indentation, no duplicate lines, etc). Edit the file again if necessary."
+        return CLIResult(output=success_msg)
+
+    def _lines_containing(self, data: mmap.mmap, needle: bytes) -> list[int]:
+        """The numbers of the lines that contain `needle`, like a search line by line."""
+        if not needle:
+            return list(range(1, count_lines(data, len(data)) + 2))
+        lines: list[int] = []
+        if b"\n" in needle:
+            return lines
+        position = line = 0
+        while (occurrence := data.find(needle, position)) != -1:
+            line += data[position:occurrence].count(b"\n")
+            lines.append(line + 1)
+            # continue on the next line
+            position = lines_after(data, occurrence, 0) + 1
+            line += 1
+        return lines
+
+    def _write_on_disk(
+        self,
+        path: Path,
+        data: mmap.mmap,
+        offset: int,
+        removed: bytes,
+        inserted: bytes,
+        stamp: tuple[int, int, int] | None,
+    ):
+        """Splice `inserted` into the file in place of `removed`, and record the edit."""
+        try:
+            splice(path, data, offset, len(removed), inserted)
+        except Exception as e:
+            raise ToolError(f"Ran into {e} while trying to write to {path}") from None
+        finally:
+            invalidate_listings(path)
+            invalidate_line_index(path)
+        self._file_history.push_on_disk(path, offset, removed, inserted, stamp)
+
+    def _read_indexed(self, index: LineIndex, init_line: int, final_line: int):
+        """Read lines of an indexed file, as many as the output can show."""
+        try:
+            return index.read(init_line, final_line, max_chars=MAX_RESPONSE_LEN)
+        except ToolError:
+            raise
+        except Exception as e:
+            raise ToolError(f"Ran into {e} while trying to read {index.path}") from None
+
+
+class EditTool20250124(_LargeFileEdits, BaseAnthropicTool):
     """
     An filesystem editor tool that allows the agent to view, create, and edit files.
     The tool parameters are defined by Anthropic and are not editable.
@@ -31,10 +195,10 @@ class EditTool20250124(BaseAnthropicTool):
     api_type: Literal["text_editor_20250124"] = "text_editor_20250124"
     name: Literal["str_replace_editor"] = "str_replace_editor"
 
-    _file_history: dict[Path, list[str]]
+    _file_history: EditHistory
 
     def __init__(self):
-        self._file_history = defaultdict(list)
+        self._file_history = EditHistory()
         super().__init__()
 
     def to_params(self) -> Any:
@@ -43,6 +207,14 @@ class EditTool20250124(BaseAnthropicTool):
             "type": self.api_type,
         }
 
+    def resources(
+        self, *, command: str | None = None, path: str | None = None, **kwargs
+    ) -> set[Resource]:
+        if not isinstance(path, str):
+            return super().resources()
+        # views only read the path, so they may run alongside each other
+        return {fs_resource(path, exclusive=command != "view")}
+
     async def __call__(
         self,
         *,
@@ -63,7 +235,7 @@ class EditTool20250124(BaseAnthropicTool):
             if file_text is None:
                 raise ToolError("Parameter `file_text` is required for command: create")
             self.write_file(_path, file_text)
-            self._file_history[_path].append(file_text)
+            self._file_history.push(_path, file_text, file_text)
             return ToolResult(output=f"File created successfully at: {_path}")
         elif command == "str_replace":
             if old_str is None:
@@ -119,22 +291,25 @@ class EditTool20250124(BaseAnthropicTool):
                     "The `view_range` parameter is not allowed when `path` points to a directory."
                 )
 
-            _, stdout, stderr = await run(
-                rf"find {path} -maxdepth 2 -not -path '*/\.*'"
-            )
+            stdout, stderr = await asyncio.to_thread(list_directory, path)
             if not stderr:
                 stdout = f"Here's the files and directories up to 2 levels deep in {path}, excluding hidden items:\n{stdout}\n"
             return CLIResult(output=stdout, error=stderr)
 
-        file_content = self.read_file(path)
+        # large files are read through an index of their lines, only as far as needed
+        index = await asyncio.to_thread(line_index, path)
+        file_content = self.read_file(path) if index is None else ""
         init_line = 1
         if view_range:
             if len(view_range) != 2 or not all(isinstance(i, int) for i in view_range):
                 raise ToolError(
                     "Invalid `view_range`. It should be a list of two integers."
                 )
-            file_lines = file_content.split("\n")
-            n_lines_file = len(file_lines)
+            if index is None:
+                file_lines = file_content.split("\n")
+                n_lines_file = len(file_lines)
+            else:
+                n_lines_file = index.lines
             init_line, final_line = view_range
             if init_line < 1 or init_line > n_lines_file:
                 raise ToolError(
@@ -149,10 +324,14 @@ class EditTool20250124(BaseAnthropicTool):
                     f"Invalid `view_range`: {view_range}. Its second element `{final_line}` should be larger or equal than its first `{init_line}`"
                 )
 
-            if final_line == -1:
+            if index is not None:
+                file_content = self._read_indexed(index, init_line, final_line)
+            elif final_line == -1:
                 file_content = "\n".join(file_lines[init_line - 1 :])
             else:
                 file_content = "\n".join(file_lines[init_line - 1 : final_line])
+        elif index is not None:
+            file_content = self._read_indexed(index, 1, -1)
 
         return CLIResult(
             output=self._make_output(file_content, str(path), init_line=init_line)
@@ -160,6 +339,11 @@ class EditTool20250124(BaseAnthropicTool):
 
     def str_replace(self, path: Path, old_str: str, new_str: str | None):
         """Implement the str_replace command, which replaces old_str with new_str in the file content"""
+        stamp = file_stamp(path)
+        with map_large_file(path) as data:
+            if data is not None:
+                return self._str_replace_on_disk(path, data, old_str, new_str, stamp)
+
         # Read the file content
         file_content = self.read_file(path).expandtabs()
         old_str = old_str.expandtabs()
@@ -189,7 +373,7 @@ class EditTool20250124(BaseAnthropicTool):
         self.write_file(path, new_file_content)
 
         # Save the content to history
-        self._file_history[path].append(file_content)
+        self._file_history.push(path, file_content, new_file_content, stamp)
 
         # Create a snippet of the edited section
         replacement_line = file_content.split(old_str)[0].count("\n")
@@ -208,6 +392,11 @@ class EditTool20250124(BaseAnthropicTool):
 
     def insert(self, path: Path, insert_line: int, new_str: str):
         """Implement the insert command, which inserts new_str at the specified line in the file content."""
+        stamp = file_stamp(path)
+        with map_large_file(path) as data:
+            if data is not None:
+                return self._insert_on_disk(path, data, insert_line, new_str, stamp)
+
         file_text = self.read_file(path).expandtabs()
         new_str = new_str.expandtabs()
         file_text_lines = file_text.split("\n")
@@ -234,7 +423,7 @@ class EditTool20250124(BaseAnthropicTool):
         snippet = "\n".join(snippet_lines)
 
         self.write_file(path, new_file_text)
-        self._file_history[path].append(file_text)
+        self._file_history.push(path, file_text, new_file_text, stamp)
 
         success_msg = f"The file {path} has been edited. "
         success_msg += self._make_output(
@@ -247,10 +436,9 @@ class EditTool20250124(BaseAnthropicTool):
 
     def undo_edit(self, path: Path):
         """Implement the undo_edit command."""
-        if not self._file_history[path]:
+        if (old_text := self._file_history.pop(path)) is None:
             raise ToolError(f"No edit history found for {path}.")
 
-        old_text = self._file_history[path].pop()
         self.write_file(path, old_text)
 
         return CLIResult(
@@ -270,6 +458,9 @@ class EditTool20250124(BaseAnthropicTool):
             path.write_text(file)
         except Exception as e:
             raise ToolError(f"Ran into {e} while trying to write to {path}") from None
+        finally:
+            invalidate_listings(path)
+            invalidate_line_index(path)
 
     def _make_output(
         self,
@@ -295,7 +486,7 @@ class EditTool20250124(BaseAnthropicTool):
         )
 
 
-class EditTool20250429(BaseAnthropicTool):
+class EditTool20250429(_LargeFileEdits, BaseAnthropicTool):
     """
     An filesystem editor tool that allows the agent to view, create, and edit files.
     The tool parameters are defined by Anthropic and are not editable.
@@ -307,10 +498,10 @@ class EditTool20250429(BaseAnthropicTool):
     name: Literal["str_replace_based_edit_tool"] = "str_replace_based_edit_tool"
     # name: Literal["text_editor_20250429"] = "text_editor_20250429"
 
-    _file_history: dict[Path, list[str]]
+    _file_history: EditHistory
 
     def __init__(self):
-        self._file_history = defaultdict(list)
+        self._file_history = EditHistory()
         super().__init__()
 
     def to_params(self) -> Any:
@@ -319,6 +510,14 @@ class EditTool20250429(BaseAnthropicTool):
             "type": self.api_type,
         }
 
+    def resources(
+        self, *, command: str | None = None, path: str | None = None, **kwargs
+    ) -> set[Resource]:
+        if not isinstance(path, str):
+            return super().resources()
+        # views only read the path, so they may run alongside each other
+        return {fs_resource(path, exclusive=command != "view")}
+
     async def __call__(
         self,
         *,
@@ -339,7 +538,7 @@ class EditTool20250429(BaseAnthropicTool):
             if file_text is None:
                 raise ToolError("Parameter `file_text` is required for command: create")
             self.write_file(_path, file_text)
-            self._file_history[_path].append(file_text)
+            self._file_history.push(_path, file_text, file_text)
             return ToolResult(output=f"File created successfully at: {_path}")
         elif command == "str_replace":
             if old_str is None:
@@ -394,22 +593,25 @@ class EditTool20250429(BaseAnthropicTool):
                     "The `view_range` parameter is not allowed when `path` points to a directory."
                 )
 
-            _, stdout, stderr = await run(
-                rf"find {path} -maxdepth 2 -not -path '*/\.*'"
-            )
+            stdout, stderr = await asyncio.to_thread(list_directory, path)
             if not stderr:
                 stdout = f"Here's the files and directories up to 2 levels deep in {path}, excluding hidden items:\n{stdout}\n"
             return CLIResult(output=stdout, error=stderr)
 
-        file_content = self.read_file(path)
+        # large files are read through an index of their lines, only as far as needed
+        index = await asyncio.to_thread(line_index, path)
+        file_content = self.read_file(path) if index is None else ""
         init_line = 1
         if view_range:
             if len(view_range) != 2 or not all(isinstance(i, int) for i in view_range):
                 raise ToolError(
                     "Invalid `view_range`. It should be a list of two integers."
                 )
-            file_lines = file_content.split("\n")
-            n_lines_file = len(file_lines)
+            if index is None:
+                file_lines = file_content.split("\n")
+                n_lines_file = len(file_lines)
+            else:
+                n_lines_file = index.lines
             init_line, final_line = view_range
             if init_line < 1 or init_line > n_lines_file:
                 raise ToolError(
@@ -424,10 +626,14 @@ class EditTool20250429(BaseAnthropicTool):
                     f"Invalid `view_range`: {view_range}. Its second element `{final_line}` should be larger or equal than its first `{init_line}`"
                 )
 
-            if final_line == -1:
+            if index is not None:
+                file_content = self._read_indexed(index, init_line, final_line)
+            elif final_line == -1:
                 file_content = "\n".join(file_lines[init_line - 1 :])
             else:
                 file_content = "\n".join(file_lines[init_line - 1 : final_line])
+        elif index is not None:
+            file_content = self._read_indexed(index, 1, -1)
 
         return CLIResult(
             output=self._make_output(file_content, str(path), init_line=init_line)
@@ -435,6 +641,11 @@ class EditTool20250429(BaseAnthropicTool):
 
     def str_replace(self, path: Path, old_str: str, new_str: str | None):
         """Implement the str_replace command, which replaces old_str with new_str in the file content"""
+        stamp = file_stamp(path)
+        with map_large_file(path) as data:
+            if data is not None:
+                return self._str_replace_on_disk(path, data, old_str, new_str, stamp)
+
         # Read the file content
         file_content = self.read_file(path).expandtabs()
         old_str = old_str.expandtabs()
@@ -464,7 +675,7 @@ class EditTool20250429(BaseAnthropicTool):
         self.write_file(path, new_file_content)
 
         # Save the content to history
-        self._file_history[path].append(file_content)
+        self._file_history.push(path, file_content, new_file_content, stamp)
 
         # Create a snippet of the edited section
         replacement_line = file_content.split(old_str)[0].count("\n")
@@ -483,6 +694,11 @@ class EditTool20250429(BaseAnthropicTool):
 
     def insert(self, path: Path, insert_line: int, new_str: str):
         """Implement the insert command, which inserts new_str at the specified line in the file content."""
+        stamp = file_stamp(path)
+        with map_large_file(path) as data:
+            if data is not None:
+                return self._insert_on_disk(path, data, insert_line, new_str, stamp)
+
         file_text = self.read_file(path).expandtabs()
         new_str = new_str.expandtabs()
         file_text_lines = file_text.split("\n")
@@ -509,7 +725,7 @@ class EditTool20250429(BaseAnthropicTool):
         snippet = "\n".join(snippet_lines)
 
         self.write_file(path, new_file_text)
-        self._file_history[path].append(file_text)
+        self._file_history.push(path, file_text, new_file_text, stamp)
 
         success_msg = f"The file {path} has been edited. "
         success_msg += self._make_output(
@@ -535,6 +751,9 @@ class EditTool20250429(BaseAnthropicTool):
             path.write_text(file)
         except Exception as e:
             raise ToolError(f"Ran into {e} while trying to write to {path}") from None
+        finally:
+            invalidate_listings(path)
+            invalidate_line_index(path)
 
     def _make_output(
         self,
@@ -0,0 +1,257 @@
+"""Undo history of the edit tool, kept as reverse diffs within a memory budget."""
+
+import os
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .base import ToolError
+
+# memory the history of all files may take; least recently edited files go first
+MAX_BYTES: int = int(os.getenv("EDIT_HISTORY_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# characters compared at once when looking for where two texts differ
+_CHUNK: int = 64 * 1024
+
+
+def file_stamp(path: Path) -> tuple[int, int, int] | None:
+    """What changes whenever `path` is written to or replaced; None if it's missing."""
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return info.st_ino, info.st_size, info.st_mtime_ns
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    limit = min(len(a), len(b))
+    # a[:start] == b[:start]; whole chunks are compared first, then the first one that
+    # differs is bisected
+    start = 0
+    while start < limit:
+        end = min(start + _CHUNK, limit)
+        if a[start:end] == b[start:end]:
+            start = end
+            continue
+        while end - start > 1:
+            middle = (start + end) // 2
+            if a[start:middle] == b[start:middle]:
+                start = middle
+            else:
+                end = middle
+        return start
+    return limit
+
+
+def _common_suffix_length(a: str, b: str, limit: int) -> int:
+    # like _common_prefix_length, from the ends of the texts
+    start = 0
+    while start < limit:
+        end = min(start + _CHUNK, limit)
+        if a[len(a) - end : len(a) - start] == b[len(b) - end : len(b) - start]:
+            start = end
+            continue
+        while end - start > 1:
+            middle = (start + end) // 2
+            if (
+                a[len(a) - middle : len(a) - start]
+                == b[len(b) - middle : len(b) - start]
+            ):
+                start = middle
+            else:
+                end = middle
+        return start
+    return limit
+
+
+@dataclass
+class _Edit:
+    """
+    Turns the text after an edit back into the text before it; the content of edits
+    made on disk is in bytes, with byte offsets.
+    """
+
+    prefix: int
+    suffix: int
+    # what the edit replaced, between the unchanged prefix and suffix
+    replaced: str | bytes
+    # the text after the edit, when it isn't the text before the next one (the file
+    # was changed by other means in between)
+    after: str | bytes | None = None
+
+    @classmethod
+    def between(cls, before: str, after: str) -> "_Edit":
+        prefix = _common_prefix_length(before, after)
+        suffix = _common_suffix_length(
+            before, after, min(len(before), len(after)) - prefix
+        )
+        return cls(prefix, suffix, before[prefix : len(before) - suffix])
+
+    def undo(self, after: str | bytes) -> str:
+        if isinstance(self.replaced, bytes):
+            after = after.encode() if isinstance(after, str) else after
+            before = (
+                after[: self.prefix] + self.replaced + after[len(after) - self.suffix :]
+            )
+            return before.decode()
+        after = after.decode() if isinstance(after, bytes) else after
+        return after[: self.prefix] + self.replaced + after[len(after) - self.suffix :]
+
+    @property
+    def size(self) -> int:
+        size = sys.getsizeof(self) + sys.getsizeof(self.replaced)
+        return size + (sys.getsizeof(self.after) if self.after is not None else 0)
+
+
+@dataclass
+class _FileHistory:
+    # the file's text after its latest edit, unless that was made on disk
+    text: str | None
+    edits: list[_Edit] = field(default_factory=list)
+    # the file's stamp after its latest edit, if that was made on disk
+    stamp: tuple[int, int, int] | None = None
+
+    @property
+    def size(self) -> int:
+        return sys.getsizeof(self.text) + sum(edit.size for edit in self.edits)
+
+    def text_after(self, edit: _Edit, path: Path) -> str | bytes:
+        """The text `edit` resulted in."""
+        if edit.after is not None:
+            return edit.after
+        if self.text is not None:
+            return self.text
+        # the latest edit was made on disk, so the file still has its result unless
+        # something else changed it since
+        if file_stamp(path) != self.stamp:
+            raise ToolError(
+                f"{path} was changed since its last edit, which can no longer be undone."
+            )
+        return path.read_bytes()
+
+
+class EditHistory:
+    """
+    The texts files had before each edit, for undoing edits in reverse order. Only the
+    text after the latest edit of a file is kept whole; each edit is a reverse diff
+    from the text after it. Once the history outgrows `max_bytes`, the files edited
+    least recently are forgotten, and then the oldest edits of the latest one.
+    """
+
+    def __init__(self, max_bytes: int | None = None):
+        self.max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+        self._files: OrderedDict[Path, _FileHistory] = OrderedDict()
+
+    @property
+    def size(self) -> int:
+        """Approximate bytes of memory the history takes."""
+        return sum(history.size for history in self._files.values())
+
+    def push(
+        self,
+        path: Path,
+        before: str,
+        after: str,
+        stamp: tuple[int, int, int] | None = None,
+    ):
+        """
+        Record an edit of `path` from `before` to `after`. `stamp` is the file's stamp
+        when `before` was read, if it existed.
+        """
+        if (history := self._files.get(path)) is None:
+            history = self._files[path] = _FileHistory(after)
+        else:
+            if history.text is None:
+                if stamp is not None and stamp == history.stamp:
+                    history.edits[-1].after = before.encode()
+                else:
+                    # what the edit on disk resulted in is gone
+                    history.edits.clear()
+            elif history.text != before:
+                # changed since its last edit, which can't be undone from `before`
+                history.edits[-1].after = history.text
+            history.text = after
+            history.stamp = None
+            self._files.move_to_end(path)
+        history.edits.append(_Edit.between(before, after))
+        self._evict()
+
+    def push_on_disk(
+        self,
+        path: Path,
+        offset: int,
+        removed: bytes,
+        inserted: bytes,
+        stamp_before: tuple[int, int, int] | None,
+    ):
+        """
+        Record an edit made on disk, which replaced `removed` at byte `offset` of
+        `path` with `inserted`. Only the bytes it changed are kept; undoing it reads
+        the file back.
+        """
+        if (stamp := file_stamp(path)) is None:
+            return
+        edit = _Edit(offset, stamp[1] - offset - len(inserted), removed)
+        if (history := self._files.get(path)) is None:
+            history = self._files[path] = _FileHistory(None)
+        else:
+            if history.text is not None:
+                history.edits[-1].after = history.text
+            elif stamp_before != history.stamp:
+                history.edits.clear()
+            history.text = None
+            self._files.move_to_end(path)
+        history.stamp = stamp
+        history.edits.append(edit)
+        self._evict()
+
+    def pop(self, path: Path) -> str | None:
+        """The text of `path` before its latest edit, which is forgotten; None if none."""
+        if (history := self._files.get(path)) is None:
+            return None
+        try:
+            before = history.edits[-1].undo(history.text_after(history.edits[-1], path))
+        except UnicodeDecodeError as e:
+            # checked before the file is written, so that it is left as it is
+            del self._files[path]
+            raise ToolError(f"Ran into {e} while trying to read {path}") from None
+        except ToolError:
+            del self._files[path]
+            raise
+        history.edits.pop()
+        if history.edits:
+            history.text = before
+            history.stamp = None
+            self._files.move_to_end(path)
+        else:
+            del self._files[path]
+        return before
+
+    def versions(self, path: Path) -> list[str]:
+        """The texts of `path` before each of its edits, oldest first."""
+        if (history := self._files.get(path)) is None:
+            return []
+        versions: list[str] = []
+        for edit in reversed(history.edits):
+            if edit.after is None and versions:
+                after: str | bytes = versions[-1]
+            else:
+                after = history.text_after(edit, path)
+            versions.append(edit.undo(after))
+        return versions[::-1]
+
+    def clear(self):
+        self._files.clear()
+
+    def _evict(self):
+        size = self.size
+        while size > self.max_bytes and len(self._files) > 1:
+            _, history = self._files.popitem(last=False)
+            size -= history.size
+        if size <= self.max_bytes or not self._files:
+            return
+        # the latest edit of the file edited last stays undoable
+        history = next(reversed(self._files.values()))
+        while size > self.max_bytes and len(history.edits) > 1:
+            size -= history.edits.pop(0).size
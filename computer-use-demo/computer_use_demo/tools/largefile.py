@@ -0,0 +1,143 @@
+"""
+Edits of large text files made on disk, without decoding, splitting or copying the
+whole file in memory.
+"""
+
+import codecs
+import locale
+import mmap
+import os
+import stat
+import tempfile
+from collections.abc import Iterator
+from contextlib import contextmanager, suppress
+from pathlib import Path
+
+# files at least this big are edited on disk, smaller ones as text
+LARGE_FILE_BYTES: int = int(os.getenv("EDIT_LARGE_FILE_BYTES", str(512 * 1024)))
+# bytes searched at once when counting lines
+_CHUNK: int = 1024 * 1024
+
+
+def utf8_locale() -> bool:
+    """Whether files are read as UTF-8, so that their bytes can be used as they are."""
+    return codecs.lookup(locale.getpreferredencoding(False)).name == "utf-8"
+
+
+@contextmanager
+def map_large_file(path: Path) -> Iterator[mmap.mmap | None]:
+    """
+    Map `path` read-only if it is a large file that the edit tool's text handling
+    leaves byte for byte unchanged: UTF-8, without tabs (which it expands) or carriage
+    returns (which it translates). Yields None for any other file.
+    """
+    if not utf8_locale():
+        yield None
+        return
+    try:
+        file = open(path, "rb")
+    except OSError:
+        yield None
+        return
+    with file:
+        info = os.fstat(file.fileno())
+        # replacing a file with more than one link would split it from the others
+        if (
+            not stat.S_ISREG(info.st_mode)
+            or info.st_size < LARGE_FILE_BYTES
+            or info.st_nlink > 1
+        ):
+            yield None
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if not _plain_utf8(data):
+                yield None
+                return
+            yield data
+
+
+def _plain_utf8(data: mmap.mmap) -> bool:
+    """Whether `data` is valid UTF-8 without tabs or carriage returns."""
+    # decoding checks the text is valid, edits that slice it would fail otherwise
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        for start in range(0, len(data), _CHUNK):
+            chunk = data[start : start + _CHUNK]
+            if b"\t" in chunk or b"\r" in chunk:
+                return False
+            decoder.decode(chunk)
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def count_lines(data: mmap.mmap, end: int) -> int:
+    """The number of line breaks before offset `end`."""
+    return sum(
+        data[start : min(start + _CHUNK, end)].count(b"\n")
+        for start in range(0, end, _CHUNK)
+    )
+
+
+def line_start(data: mmap.mmap, line: int) -> int | None:
+    """The offset at which 0-based `line` starts, or None if there are fewer lines."""
+    start = 0
+    while line:
+        chunk = data[start : start + _CHUNK]
+        if (breaks := chunk.count(b"\n")) < line:
+            if len(chunk) < _CHUNK:
+                return None
+            line -= breaks
+            start += len(chunk)
+            continue
+        offset = -1
+        for _ in range(line):
+            offset = chunk.find(b"\n", offset + 1)
+        return start + offset + 1
+    return start
+
+
+def lines_before(data: mmap.mmap, offset: int, lines: int) -> int:
+    """The start of the line `lines` lines above the one `offset` is on."""
+    position = offset
+    for _ in range(lines + 1):
+        if (position := data.rfind(b"\n", 0, position)) == -1:
+            return 0
+    return position + 1
+
+
+def lines_after(data: mmap.mmap, offset: int, lines: int) -> int:
+    """The end of the line `lines` lines below the one `offset` is on."""
+    position = offset - 1
+    for _ in range(lines + 1):
+        if (position := data.find(b"\n", position + 1)) == -1:
+            return len(data)
+    return position
+
+
+def splice(path: Path, data: mmap.mmap, offset: int, removed: int, inserted: bytes):
+    """
+    Replace `removed` bytes at `offset` of the mapped file `path` with `inserted`. The
+    new content is written to a temporary file that then replaces the file, so readers
+    never see it half written.
+    """
+    # a link is replaced by a new file; its target is what has to change
+    target = os.path.realpath(path)
+    info = os.stat(target)
+    fd, temporary = tempfile.mkstemp(
+        prefix=f".{os.path.basename(target)}.", dir=os.path.dirname(target)
+    )
+    try:
+        with os.fdopen(fd, "wb") as file, memoryview(data) as view:
+            file.write(view[:offset])
+            file.write(inserted)
+            file.write(view[offset + removed :])
+            os.fchmod(file.fileno(), stat.S_IMODE(info.st_mode))
+            with suppress(PermissionError):
+                os.fchown(file.fileno(), info.st_uid, info.st_gid)
+        os.replace(temporary, target)
+    except BaseException:
+        with suppress(OSError):
+            os.unlink(temporary)
+        raise
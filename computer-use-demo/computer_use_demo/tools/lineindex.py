@@ -0,0 +1,216 @@
+"""
+Indexes of where the lines of large files start, so that the edit tool can view a range
+of lines without reading the whole file.
+"""
+
+import bisect
+import codecs
+import mmap
+import os
+import stat
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from . import largefile
+from .base import ToolError
+
+# indexes kept in the cache, least recently used ones are dropped first
+CACHE_SIZE: int = int(os.getenv("LINE_INDEX_CACHE_SIZE", "16"))
+# bytes between the offsets the index records; finding a line scans at most this many
+_STRIDE: int = 64 * 1024
+# a file changed within this long after its mtime may keep the same stamp (the same
+# rule as for directory listings), so indexes of files changed this recently aren't
+# cached
+_MTIME_RESOLUTION_NS: int = 1_000_000_000
+# a UTF-8 character is at most 4 bytes
+_BYTES_PER_CHAR: int = 4
+
+
+@dataclass
+class LineIndexStats:
+    """Counters describing line indexes and how often the cache served them."""
+
+    lookups: int = 0
+    cache_hits: int = 0
+    builds: int = 0
+    bytes_indexed: int = 0
+    build_seconds: float = 0.0
+
+
+_stats = LineIndexStats()
+
+
+def line_index_stats() -> LineIndexStats:
+    """Return a snapshot of the line index counters."""
+    return LineIndexStats(**vars(_stats))
+
+
+def _stamp(info: os.stat_result) -> tuple[int, int, int]:
+    return info.st_ino, info.st_size, info.st_mtime_ns
+
+
+@dataclass
+class LineIndex:
+    """
+    Where the lines of a file start, as the number of line breaks before every
+    `_STRIDE`-th byte of it. Only made for files that read back as the same text as
+    their bytes decode to: UTF-8, without carriage returns (which reading translates).
+    """
+
+    path: Path
+    stamp: tuple[int, int, int]
+    # the number of lines, as splitting the text at line breaks counts them
+    lines: int
+    # breaks[i] is the number of line breaks before byte i * _STRIDE
+    breaks: array
+
+    def read(self, first: int, last: int, max_chars: int | None = None) -> str:
+        """
+        Lines `first` to `last` of the file, numbered from 1 and inclusive; `last` may
+        be -1 for the end of the file. With `max_chars`, only as many bytes are read as
+        that many characters may take, and one more character.
+        """
+        with open(self.path, "rb") as file:
+            if _stamp(os.fstat(file.fileno())) != self.stamp:
+                raise ToolError(
+                    f"{self.path} was changed while it was being read. View it again."
+                )
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                start = self._line_start(data, first - 1)
+                if last == -1 or last >= self.lines:
+                    end = len(data)
+                else:
+                    # before the line break that ends line `last`
+                    end = self._line_start(data, last) - 1
+                if max_chars:
+                    end = min(end, start + (max_chars + 1) * _BYTES_PER_CHAR)
+                # a character cut off at the end is left out, not an error
+                return codecs.getincrementaldecoder("utf-8")().decode(data[start:end])
+
+    def _line_start(self, data: mmap.mmap, line: int) -> int:
+        """The offset at which 0-based `line` starts."""
+        if line == 0:
+            return 0
+        # the break that ends the line before is in the last stride with fewer breaks
+        # before it than `line`
+        stride = bisect.bisect_left(self.breaks, line) - 1
+        position = stride * _STRIDE - 1
+        for _ in range(line - self.breaks[stride]):
+            position = data.find(b"\n", position + 1)
+        return position + 1
+
+
+def _build(path: Path) -> tuple[tuple[int, int, int], LineIndex | None] | None:
+    """
+    Scan `path` for its line breaks. Returns the file's stamp with its index, or with
+    None if it can't be indexed; None if it couldn't be read at all.
+    """
+    try:
+        file = open(path, "rb")
+    except OSError:
+        return None
+    with file:
+        stamp = _stamp(os.fstat(file.fileno()))
+        if stamp[1] == 0:
+            return stamp, None
+        breaks = array("q")
+        lines = 0
+        # decoding checks the text is valid, reading it as text would fail otherwise
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for start in range(0, len(data), _STRIDE):
+                chunk = data[start : start + _STRIDE]
+                if b"\r" in chunk:
+                    return stamp, None
+                try:
+                    decoder.decode(chunk)
+                except UnicodeDecodeError:
+                    return stamp, None
+                breaks.append(lines)
+                lines += chunk.count(b"\n")
+        try:
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return stamp, None
+    _stats.builds += 1
+    _stats.bytes_indexed += stamp[1]
+    return stamp, LineIndex(path, stamp, lines + 1, breaks)
+
+
+class LineIndexes:
+    """
+    Line indexes of large files, cached while the files' inode, size and mtime stay the
+    same. Files that can't be indexed are remembered as such, so they aren't scanned
+    again.
+    """
+
+    def __init__(self, cache_size: int | None = None):
+        self.cache_size = CACHE_SIZE if cache_size is None else cache_size
+        self._cache: OrderedDict[str, tuple[tuple[int, int, int], LineIndex | None]] = (
+            OrderedDict()
+        )
+        # indexes are made in worker threads
+        self._lock = threading.Lock()
+
+    def get(self, path: Path) -> LineIndex | None:
+        """The index of `path`, or None if it isn't a large text file that can be indexed."""
+        if not largefile.utf8_locale():
+            return None
+        try:
+            info = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(info.st_mode) or info.st_size < largefile.LARGE_FILE_BYTES:
+            return None
+        key = str(path)
+        with self._lock:
+            _stats.lookups += 1
+            if (cached := self._cache.get(key)) is not None and cached[0] == _stamp(
+                info
+            ):
+                self._cache.move_to_end(key)
+                _stats.cache_hits += 1
+                return cached[1]
+            self._cache.pop(key, None)
+            start = time.monotonic()
+            built = _build(path)
+            _stats.build_seconds += time.monotonic() - start
+            if built is None:
+                return None
+            if time.time_ns() - built[0][2] > _MTIME_RESOLUTION_NS:
+                self._cache[key] = built
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return built[1]
+
+    def invalidate(self, path: Path):
+        """Drop the index of `path`, e.g. after the tool wrote to it."""
+        with self._lock:
+            self._cache.pop(str(path), None)
+
+
+_indexes: LineIndexes | None = None
+_indexes_lock = threading.Lock()
+
+
+def _get_indexes() -> LineIndexes:
+    global _indexes
+    with _indexes_lock:
+        if _indexes is None:
+            _indexes = LineIndexes()
+        return _indexes
+
+
+def line_index(path: Path) -> LineIndex | None:
+    """The index of `path` from the shared cache, see `LineIndexes.get`."""
+    return _get_indexes().get(path)
+
+
+def invalidate_line_index(path: Path):
+    """Drop the cached index of `path`, after it was changed."""
+    if _indexes is not None:
+        _indexes.invalidate(path)
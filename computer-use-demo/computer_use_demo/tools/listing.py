@@ -0,0 +1,273 @@
+"""
+In-process directory listings for the edit tool, cached until the listed directories
+change.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+# entries shown per listing; the walk stops once this many were found
+MAX_ENTRIES: int = int(os.getenv("DIRECTORY_LISTING_MAX_ENTRIES", "500"))
+# listings kept in the cache, least recently used ones are dropped first
+CACHE_SIZE: int = int(os.getenv("DIRECTORY_LISTING_CACHE_SIZE", "64"))
+# directory mtimes closer than this to a scan may not show changes made right after it
+# (the same rule git uses for its index), so such listings are not cached
+_MTIME_RESOLUTION_NS: int = 1_000_000_000
+
+# inotify(7) events that change the names in a directory, or the directory itself
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ONLYDIR = 0x1000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+@dataclass
+class ListingStats:
+    """Counters describing directory listings and how often the cache served them."""
+
+    listings: int = 0
+    cache_hits: int = 0
+    entries_scanned: int = 0
+    scan_seconds: float = 0.0
+
+
+_stats = ListingStats()
+
+
+def listing_stats() -> ListingStats:
+    """Return a snapshot of the directory listing counters."""
+    return ListingStats(**vars(_stats))
+
+
+class _Inotify:
+    """Reports which watched directories changed, through Linux inotify."""
+
+    _mask = (
+        _IN_CREATE
+        | _IN_DELETE
+        | _IN_MOVED_FROM
+        | _IN_MOVED_TO
+        | _IN_DELETE_SELF
+        | _IN_MOVE_SELF
+        | _IN_ONLYDIR
+    )
+    # watches are a per-user resource, leave most of them to other programs
+    _max_watches: int = 4096
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("libc not found")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._paths: dict[int, str] = {}
+        self._watches: dict[str, int] = {}
+
+    def watch(self, path: str) -> bool:
+        """Start watching a directory; False if it can't be, e.g. out of watches."""
+        if path in self._watches:
+            return True
+        if len(self._watches) >= self._max_watches:
+            return False
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self._mask)
+        if wd < 0 or self._paths.get(wd, path) != path:
+            # the same directory under another path can't be told apart
+            return False
+        self._paths[wd] = path
+        self._watches[path] = wd
+        return True
+
+    def changed(self) -> set[str] | None:
+        """
+        The watched directories that changed since the last call, or None if the
+        kernel dropped events and any of them may have.
+        """
+        changed: set[str] = set()
+        lost = False
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size + length
+                if mask & _IN_Q_OVERFLOW:
+                    lost = True
+                if (path := self._paths.get(wd)) is None:
+                    continue
+                changed.add(path)
+                if mask & _IN_IGNORED:
+                    # the directory is gone, and so is its watch
+                    del self._paths[wd]
+                    del self._watches[path]
+        return None if lost else changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+@dataclass
+class _Listing:
+    text: str
+    errors: str
+    # the directories that were read, with their mtime if they aren't watched
+    directories: dict[str, int | None]
+
+
+class DirectoryListings:
+    """
+    Lists directories like `find <path> -maxdepth <depth> -not -path '*/\\.*'`, and
+    caches the listings. A listing is served from the cache while none of the
+    directories it read changed, which inotify reports where available and their mtimes
+    show otherwise.
+    """
+
+    def __init__(self, max_entries: int | None = None, cache_size: int | None = None):
+        self.max_entries = MAX_ENTRIES if max_entries is None else max_entries
+        self.cache_size = CACHE_SIZE if cache_size is None else cache_size
+        self._cache: OrderedDict[tuple[str, int], _Listing] = OrderedDict()
+        # listings are made in worker threads
+        self._lock = threading.Lock()
+        try:
+            self._inotify: _Inotify | None = _Inotify()
+        except (OSError, AttributeError):
+            self._inotify = None
+
+    def list(self, path: Path, depth: int = 2) -> tuple[str, str]:
+        """The listing of `path` and the errors met making it, one per line."""
+        key = (str(path), depth)
+        with self._lock:
+            _stats.listings += 1
+            self._drop_changed()
+            if (listing := self._cache.get(key)) is not None and self._unchanged(
+                listing
+            ):
+                self._cache.move_to_end(key)
+                _stats.cache_hits += 1
+                return listing.text, listing.errors
+            self._cache.pop(key, None)
+            listing, cacheable = self._scan(str(path), depth)
+            if cacheable:
+                self._cache[key] = listing
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return listing.text, listing.errors
+
+    def invalidate(self, path: Path):
+        """Drop listings that include `path`, e.g. after the tool created it."""
+        directories = {str(path), str(path.parent)}
+        with self._lock:
+            for key, listing in list(self._cache.items()):
+                if not directories.isdisjoint(listing.directories):
+                    del self._cache[key]
+
+    def _drop_changed(self):
+        if self._inotify is None:
+            return
+        if (changed := self._inotify.changed()) is None:
+            self._cache.clear()
+            return
+        for key, listing in list(self._cache.items()):
+            if not changed.isdisjoint(listing.directories):
+                del self._cache[key]
+
+    def _unchanged(self, listing: _Listing) -> bool:
+        for directory, mtime in listing.directories.items():
+            if mtime is None:
+                continue  # watched, so a change would have dropped the listing
+            try:
+                if os.stat(directory).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def _scan(self, root: str, depth: int) -> tuple[_Listing, bool]:
+        """Walk `root` like find does, returning the listing and whether to cache it."""
+        start = time.monotonic()
+        scan_time = time.time_ns()
+        lines = [root]
+        errors: list[str] = []
+        directories: dict[str, int | None] = {}
+        cacheable = True
+
+        def walk(directory: str, level: int) -> bool:
+            """List `directory` below its own line; False once the listing is full."""
+            nonlocal cacheable
+            # watch before reading, so that no change after the read goes unnoticed
+            watched = self._inotify is not None and self._inotify.watch(directory)
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+                with os.scandir(directory) as scan:
+                    entries = sorted(
+                        (entry for entry in scan if not entry.name.startswith(".")),
+                        key=lambda entry: entry.name,
+                    )
+            except OSError as e:
+                errors.append(f"Cannot read {directory}: {e.strerror}")
+                cacheable = False
+                return True
+            directories[directory] = None if watched else mtime
+            if not watched:
+                cacheable = cacheable and scan_time - mtime > _MTIME_RESOLUTION_NS
+            for entry in entries:
+                if len(lines) > self.max_entries:
+                    return False
+                lines.append(entry.path)
+                # like find, symbolic links to directories aren't followed
+                if level + 1 < depth and entry.is_dir(follow_symlinks=False):
+                    if not walk(entry.path, level + 1):
+                        return False
+            return True
+
+        complete = walk(root, 0)
+        text = "\n".join(lines) + "\n"
+        if not complete:
+            text += (
+                f"<NOTE>The listing was stopped after {self.max_entries} entries. "
+                "View a subdirectory, or search with `find` or `ls` in bash, to see "
+                "more.</NOTE>\n"
+            )
+        _stats.entries_scanned += len(lines) - 1
+        _stats.scan_seconds += time.monotonic() - start
+        return _Listing(text, "\n".join(errors), directories), cacheable
+
+
+_listings: DirectoryListings | None = None
+_listings_lock = threading.Lock()
+
+
+def _get_listings() -> DirectoryListings:
+    global _listings
+    with _listings_lock:
+        if _listings is None:
+            _listings = DirectoryListings()
+        return _listings
+
+
+def list_directory(path: Path, depth: int = 2) -> tuple[str, str]:
+    """List `path` up to `depth` levels deep through the shared listing cache."""
+    return _get_listings().list(path, depth)
+
+
+def invalidate_listings(path: Path):
+    """Drop cached listings that include `path`, after it was created or changed."""
+    if _listings is not None:
+        _listings.invalidate(path)
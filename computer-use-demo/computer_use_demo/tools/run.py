@@ -1,10 +1,21 @@
 """Utility to run shell commands asynchronously with a timeout."""
 
 import asyncio
+import os
+import shlex
+import signal
+import time
+from collections.abc import Sequence
+from dataclasses import dataclass
 
 TRUNCATED_MESSAGE: str = "<response clipped><NOTE>To save on context only part of this file has been shown to you. You should retry this tool after you have searched inside the file with `grep -n` in order to find the line numbers of what you are looking for.</NOTE>"
 MAX_RESPONSE_LEN: int = 16000
 
+# a UTF-8 character is at most 4 bytes, so this many bytes always decode to at least
+# `truncate_after` characters
+_BYTES_PER_CHAR: int = 4
+_CHUNK_SIZE: int = 64 * 1024
+
 
 def maybe_truncate(content: str, truncate_after: int | None = MAX_RESPONSE_LEN):
     """Truncate content and append a notice if content exceeds the specified length."""
@@ -15,28 +26,125 @@ def maybe_truncate(content: str, truncate_after: int | None = MAX_RESPONSE_LEN):
     )
 
 
-async def run(
-    cmd: str,
+@dataclass
+class RunStats:
+    """Counters describing the commands started by `run`."""
+
+    commands: int = 0
+    seconds: float = 0.0
+    bytes_read: int = 0
+    # output read past the truncation budget, and dropped without being kept
+    bytes_discarded: int = 0
+
+
+_stats = RunStats()
+
+
+def run_stats() -> RunStats:
+    """Return a snapshot of the command counters."""
+    return RunStats(**vars(_stats))
+
+
+@dataclass(frozen=True)
+class CommandResult:
+    """The outcome of a command, with its (possibly truncated) output."""
+
+    returncode: int
+    stdout: str
+    stderr: str
+    # sizes of the complete outputs, before truncation
+    stdout_bytes: int
+    stderr_bytes: int
+    duration: float  # seconds
+
+
+async def _read_stream(stream: asyncio.StreamReader, limit: int | None):
+    """
+    Read `stream` to EOF, keeping only the first `limit` bytes; the rest is read and
+    dropped so the process never blocks on a full pipe.
+    """
+    kept = bytearray()
+    total = 0
+    while chunk := await stream.read(_CHUNK_SIZE):
+        total += len(chunk)
+        if limit is None:
+            kept += chunk
+        elif len(kept) < limit:
+            kept += chunk[: limit - len(kept)]
+    _stats.bytes_read += total
+    _stats.bytes_discarded += total - len(kept)
+    return bytes(kept), total
+
+
+async def run_command(
+    cmd: str | Sequence[str],
     timeout: float | None = 120.0,  # seconds
     truncate_after: int | None = MAX_RESPONSE_LEN,
-):
-    """Run a shell command asynchronously with a timeout."""
-    process = await asyncio.create_subprocess_shell(
-        cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+) -> CommandResult:
+    """
+    Run a command asynchronously with a timeout, through the shell if `cmd` is a
+    string and directly if it is a sequence of arguments. Output is read as it arrives
+    and only as much as `truncate_after` characters need is kept in memory.
+    """
+    # in a session of its own, so that a timeout can kill everything it started
+    options = dict(
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,
     )
+    if isinstance(cmd, str):
+        process = await asyncio.create_subprocess_shell(cmd, **options)
+    else:
+        process = await asyncio.create_subprocess_exec(*cmd, **options)
+    # we know these are not None because we created the process with PIPEs
+    assert process.stdout
+    assert process.stderr
+    _stats.commands += 1
+    start = time.monotonic()
+    limit = None if not truncate_after else truncate_after * _BYTES_PER_CHAR
 
     try:
-        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
-        return (
-            process.returncode or 0,
-            maybe_truncate(stdout.decode(), truncate_after=truncate_after),
-            maybe_truncate(stderr.decode(), truncate_after=truncate_after),
+        (stdout, stdout_bytes), (stderr, stderr_bytes), _ = await asyncio.wait_for(
+            asyncio.gather(
+                _read_stream(process.stdout, limit),
+                _read_stream(process.stderr, limit),
+                process.wait(),
+            ),
+            timeout=timeout,
         )
     except asyncio.TimeoutError as exc:
         try:
-            process.kill()
+            os.killpg(process.pid, signal.SIGKILL)
         except ProcessLookupError:
             pass
+        await process.wait()
+        if not isinstance(cmd, str):
+            cmd = shlex.join(cmd)
         raise TimeoutError(
             f"Command '{cmd}' timed out after {timeout} seconds"
         ) from exc
+    finally:
+        _stats.seconds += time.monotonic() - start
+
+    return CommandResult(
+        returncode=process.returncode or 0,
+        stdout=maybe_truncate(
+            stdout.decode(errors="replace"), truncate_after=truncate_after
+        ),
+        stderr=maybe_truncate(
+            stderr.decode(errors="replace"), truncate_after=truncate_after
+        ),
+        stdout_bytes=stdout_bytes,
+        stderr_bytes=stderr_bytes,
+        duration=time.monotonic() - start,
+    )
+
+
+async def run(
+    cmd: str | Sequence[str],
+    timeout: float | None = 120.0,  # seconds
+    truncate_after: int | None = MAX_RESPONSE_LEN,
+):
+    """Run a command asynchronously with a timeout, see `run_command`."""
+    result = await run_command(cmd, timeout=timeout, truncate_after=truncate_after)
+    return result.returncode, result.stdout, result.stderr
@@ -0,0 +1,305 @@
+"""In-process screen capture, so screenshots don't spawn a capture and a resize process."""
+
+import io
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from abc import ABCMeta, abstractmethod
+from collections.abc import Iterator
+from contextlib import suppress
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    from Xlib import X, display as xdisplay
+except ImportError:
+    X = xdisplay = None
+
+# zlib level for in-memory PNG encoding; lower is faster and larger
+PNG_COMPRESS_LEVEL: int = int(os.getenv("SCREENSHOT_PNG_COMPRESS_LEVEL", "1"))
+
+# directory Xvfb was started with `-fbdir` on (see image/xvfb_startup.sh); unless set,
+# it is read from the command line of the Xvfb serving the display
+XVFB_FBDIR: str | None = os.getenv("XVFB_FBDIR")
+
+# XWDFileHeader: 25 big-endian CARD32 fields, followed by the window name
+_XWD_HEADER = struct.Struct(">25I")
+_XWD_COLOR_SIZE = 12
+_XWD_VERSION = 7
+_XWD_ZPIXMAP = 2
+
+
+class ScreenCaptureError(Exception):
+    """Raised when a frame cannot be captured in-process."""
+
+
+def encode_png(image: "Image.Image", size: tuple[int, int] | None = None) -> bytes:
+    """Resize a frame (ignoring aspect ratio, like `convert -resize WxH!`) and encode it as PNG."""
+    if size is not None and image.size != size:
+        image = image.resize(size, Image.Resampling.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+    return buffer.getvalue()
+
+
+class ScreenCapture(metaclass=ABCMeta):
+    """A source of frames of the X display."""
+
+    @abstractmethod
+    def grab(self) -> "Image.Image":
+        """Return the current contents of the screen."""
+        ...
+
+    def grab_png(self, size: tuple[int, int] | None = None) -> bytes:
+        """Capture the screen and return it PNG encoded, resized to `size` if given."""
+        return encode_png(self.grab(), size)
+
+    def frame_digest(self) -> int:
+        """
+        Return a cheap checksum of the current frame, for telling whether the screen
+        changed between two samples.
+        """
+        return zlib.crc32(self.grab().tobytes())
+
+    @abstractmethod
+    def close(self):
+        """Release any resources held by the capture source."""
+        ...
+
+
+class XlibScreenCapture(ScreenCapture):
+    """Reads the root window with XGetImage over one persistent X connection."""
+
+    def __init__(self, display_num: int | None):
+        if Image is None or xdisplay is None:
+            raise ScreenCaptureError("Pillow and python-xlib are required")
+        try:
+            self._display = xdisplay.Display(
+                f":{display_num}" if display_num is not None else None
+            )
+        except Exception as e:
+            raise ScreenCaptureError(f"Cannot connect to the X display: {e}") from e
+        self._root = self._display.screen().root
+        # python-xlib connections are not thread safe and grabs run in worker threads
+        self._lock = threading.Lock()
+
+    def _get_image(self) -> tuple[tuple[int, int], bytes]:
+        with self._lock:
+            try:
+                geometry = self._root.get_geometry()
+                width, height = geometry.width, geometry.height
+                raw = self._root.get_image(0, 0, width, height, X.ZPixmap, 0xFFFFFFFF)
+            except Exception as e:
+                # python-xlib's XError and ConnectionClosedError, or the socket's OSError
+                raise ScreenCaptureError(f"Cannot read the screen: {e}") from e
+        if raw.depth != 24 or len(raw.data) != width * height * 4:
+            raise ScreenCaptureError(f"Unsupported screen depth {raw.depth}")
+        return (width, height), raw.data
+
+    def grab(self) -> "Image.Image":
+        size, data = self._get_image()
+        return Image.frombuffer("RGB", size, data, "raw", "BGRX", 0, 1)
+
+    def frame_digest(self) -> int:
+        # checksum the raw pixels rather than paying for a decode
+        return zlib.crc32(self._get_image()[1])
+
+    def close(self):
+        self._display.close()
+
+
+class XvfbFramebufferCapture(ScreenCapture):
+    """
+    Maps the XWD framebuffer file Xvfb keeps up to date with `-fbdir`, so frames are
+    read straight from shared memory without any X request, subprocess or copy.
+    """
+
+    def __init__(self, path: str):
+        if Image is None:
+            raise ScreenCaptureError("Pillow is required")
+        self.path = path
+        # grabs run in worker threads, and may find the file has to be mapped again
+        self._lock = threading.Lock()
+        self._map()
+
+    def _map(self):
+        try:
+            with open(self.path, "rb") as f:
+                info = os.fstat(f.fileno())
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise ScreenCaptureError(f"Cannot map {self.path}: {e}") from e
+        self._stamp = (info.st_ino, info.st_size)
+        try:
+            self._parse_header()
+        except ScreenCaptureError:
+            self._mmap.close()
+            raise
+
+    def _check_mapping(self):
+        """
+        Map the file again if it is no longer the one mapped, as when Xvfb restarted
+        and made a new one; the old mapping would go on showing the last frame.
+        """
+        try:
+            info = os.stat(self.path)
+        except OSError as e:
+            raise ScreenCaptureError(f"Cannot read {self.path}: {e}") from e
+        with self._lock:
+            if (info.st_ino, info.st_size) == self._stamp:
+                return
+            mapped = self._mmap
+            try:
+                self._map()
+            finally:
+                # frames still being read keep the old mapping open until they're done
+                with suppress(BufferError):
+                    mapped.close()
+
+    def _parse_header(self):
+        if len(self._mmap) < _XWD_HEADER.size:
+            raise ScreenCaptureError("Framebuffer file is too small")
+        (
+            header_size,
+            version,
+            pixmap_format,
+            depth,
+            width,
+            height,
+            _xoffset,
+            byte_order,
+            _bitmap_unit,
+            _bitmap_bit_order,
+            _bitmap_pad,
+            bits_per_pixel,
+            bytes_per_line,
+            _visual_class,
+            red_mask,
+            _green_mask,
+            blue_mask,
+            _bits_per_rgb,
+            _colormap_entries,
+            ncolors,
+            *_,
+        ) = _XWD_HEADER.unpack_from(self._mmap)
+        if version != _XWD_VERSION or pixmap_format != _XWD_ZPIXMAP:
+            raise ScreenCaptureError("Framebuffer file is not a ZPixmap XWD file")
+        if depth != 24 or bits_per_pixel != 32 or bytes_per_line != width * 4:
+            raise ScreenCaptureError(f"Unsupported framebuffer depth {depth}")
+        # pixels are 32 bit words in the server's byte order
+        if (red_mask, blue_mask) == (0xFF0000, 0xFF) and byte_order == 0:
+            self._rawmode = "BGRX"
+        elif (red_mask, blue_mask) == (0xFF0000, 0xFF) and byte_order == 1:
+            self._rawmode = "XRGB"
+        else:
+            raise ScreenCaptureError("Unsupported framebuffer pixel layout")
+        self._offset = header_size + ncolors * _XWD_COLOR_SIZE
+        self.size = (width, height)
+        if len(self._mmap) < self._offset + bytes_per_line * height:
+            raise ScreenCaptureError("Framebuffer file is truncated")
+
+    def _pixels(self) -> memoryview:
+        width, height = self.size
+        try:
+            pixels = memoryview(self._mmap)
+        except ValueError as e:  # the mapping was closed
+            raise ScreenCaptureError(f"Cannot read {self.path}: {e}") from e
+        return pixels[self._offset : self._offset + width * height * 4]
+
+    def _mapped_frame(self) -> "Image.Image":
+        """
+        The framebuffer as an image backed directly by the mapping. Its channels are
+        in storage order, i.e. (B, G, R, X) when labelled as RGBX.
+        """
+        return Image.frombuffer(
+            "RGBX",
+            self.size,
+            self._pixels(),
+            "raw",
+            "RGBX",
+            0,
+            1,
+        )
+
+    def grab(self) -> "Image.Image":
+        return self.grab_frame(None)
+
+    def grab_frame(self, size: tuple[int, int] | None) -> "Image.Image":
+        """Read the framebuffer, resized to `size` if given, as an RGB image."""
+        self._check_mapping()
+        frame = self._mapped_frame()
+        if size is not None and size != frame.size:
+            # resizing is channel agnostic, so do it before reordering channels to
+            # only touch the full size frame once, straight from the mapping
+            frame = frame.resize(size, Image.Resampling.BILINEAR)
+        channels = frame.split()
+        order = (2, 1, 0) if self._rawmode == "BGRX" else (1, 2, 3)
+        return Image.merge("RGB", [channels[i] for i in order])
+
+    def grab_png(self, size: tuple[int, int] | None = None) -> bytes:
+        return encode_png(self.grab_frame(size))
+
+    def frame_digest(self) -> int:
+        self._check_mapping()
+        pixels = self._pixels()
+        try:
+            return zlib.crc32(pixels)
+        finally:
+            pixels.release()
+
+    def close(self):
+        self._mmap.close()
+
+
+def _command_lines() -> Iterator[list[str]]:
+    """The arguments of the running processes, of those that can be read."""
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                args = f.read().split(b"\0")
+        except OSError:
+            continue
+        yield [arg.decode(errors="replace") for arg in args if arg]
+
+
+def framebuffer_path(display_num: int | None, screen: int = 0) -> str | None:
+    """
+    The framebuffer file Xvfb keeps of `screen` of the display with `-fbdir`, or None
+    if the display isn't served by an Xvfb that keeps one.
+    """
+    if XVFB_FBDIR is not None:
+        return os.path.join(XVFB_FBDIR, f"Xvfb_screen{screen}")
+    if display_num is not None:
+        display = f":{display_num}"
+    elif match := re.match(r"[^:]*(:\d+)", os.getenv("DISPLAY", "")):
+        display = match.group(1)
+    else:
+        return None
+    for args in _command_lines():
+        if not args or os.path.basename(args[0]) != "Xvfb" or display not in args:
+            continue
+        if "-fbdir" in args[:-1]:
+            fbdir = args[args.index("-fbdir") + 1]
+            return os.path.join(fbdir, f"Xvfb_screen{screen}")
+    return None
+
+
+def open_screen_capture(display_num: int | None) -> ScreenCapture | None:
+    """Return the best available in-process capture source, or None if there is none."""
+    if (path := framebuffer_path(display_num)) is not None:
+        try:
+            return XvfbFramebufferCapture(path)
+        except ScreenCaptureError:
+            pass
+    try:
+        return XlibScreenCapture(display_num)
+    except ScreenCaptureError:
+        return None
@@ -0,0 +1,424 @@
+"""
+In-process X input over the XTEST extension, so mouse and keyboard actions don't
+spawn a shell and an xdotool process per call.
+
+The computer tool builds xdotool command lines; `parse_xdotool` turns the subset of
+xdotool it uses into a script that `XTestInput` replays over one persistent X
+connection. Anything outside that subset raises `UnsupportedCommand` so the caller
+can fall back to running xdotool itself.
+"""
+
+import shlex
+import threading
+import time
+
+try:
+    from Xlib import XK, X, display as xdisplay
+except ImportError:
+    X = XK = xdisplay = None
+
+# keysym names xdotool accepts on top of the X ones
+KEYSYM_ALIASES = {
+    "alt": "Alt_L",
+    "ctrl": "Control_L",
+    "control": "Control_L",
+    "meta": "Meta_L",
+    "super": "Super_L",
+    "shift": "Shift_L",
+}
+
+# characters whose keysym is not their code point
+CHARACTER_KEYSYMS = {"\n": "Return", "\r": "Return", "\t": "Tab", "\b": "BackSpace"}
+
+# xdotool's defaults, in milliseconds
+DEFAULT_CLICK_DELAY_MS = 100
+DEFAULT_TYPE_DELAY_MS = 12
+
+# bulk typing sends this many characters between round trips to the server
+TYPE_BATCH_SIZE = 64
+# bounds of the adaptive pause between batches, in seconds
+TYPE_BATCH_DELAY_MIN = 0.001
+TYPE_BATCH_DELAY_MAX = 0.05
+# time given to clients to pick up a keyboard mapping change before using it
+REMAP_SETTLE_DELAY = 0.05
+
+XDOTOOL_COMMANDS = frozenset(
+    {
+        "mousemove",
+        "mousedown",
+        "mouseup",
+        "click",
+        "key",
+        "keydown",
+        "keyup",
+        "type",
+        "sleep",
+        "getmouselocation",
+    }
+)
+
+Command = tuple[str, dict]
+
+
+class XInputError(Exception):
+    """Raised when input cannot be sent in-process."""
+
+
+class UnsupportedCommand(XInputError):
+    """Raised for xdotool commands that must be run by xdotool itself."""
+
+
+class InputInterrupted(XInputError):
+    """Raised when sending failed part way, after some of the input was sent."""
+
+
+def _take_options(
+    args: list[str], allowed: dict[str, bool]
+) -> tuple[dict[str, str | bool], list[str]]:
+    """Split leading `--option [value]` arguments off, `allowed` maps option to takes-value."""
+    options: dict[str, str | bool] = {}
+    while args and args[0].startswith("--") and args[0] != "--":
+        option = args.pop(0)[2:]
+        if option not in allowed:
+            raise UnsupportedCommand(f"Unsupported option --{option}")
+        if allowed[option]:
+            if not args:
+                raise UnsupportedCommand(f"Missing value for --{option}")
+            options[option] = args.pop(0)
+        else:
+            options[option] = True
+    return options, args
+
+
+def _take_rest(args: list[str]) -> tuple[list[str], list[str]]:
+    """Take variadic arguments, up to the next chained command (or all of them after --)."""
+    if args and args[0] == "--":
+        return args[1:], []
+    for i, arg in enumerate(args):
+        if arg in XDOTOOL_COMMANDS:
+            return args[:i], args[i:]
+    return args, []
+
+
+def _int(value: str | bool) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError) as e:
+        raise UnsupportedCommand(f"Expected an integer, got {value!r}") from e
+
+
+def parse_xdotool(command: str) -> list[Command]:
+    """Parse the arguments of a (possibly chained) xdotool invocation."""
+    try:
+        args = shlex.split(command)
+    except ValueError as e:
+        raise UnsupportedCommand(str(e)) from e
+    commands: list[Command] = []
+    while args:
+        name, args = args[0], args[1:]
+        if name == "mousemove":
+            options, args = _take_options(args, {"sync": False})
+            if len(args) < 2:
+                raise UnsupportedCommand("mousemove needs x and y")
+            commands.append((name, {"x": _int(args[0]), "y": _int(args[1])}))
+            args = args[2:]
+        elif name in ("mousedown", "mouseup"):
+            if not args:
+                raise UnsupportedCommand(f"{name} needs a button")
+            commands.append((name, {"button": _int(args[0])}))
+            args = args[1:]
+        elif name == "click":
+            options, args = _take_options(args, {"repeat": True, "delay": True})
+            if not args:
+                raise UnsupportedCommand("click needs a button")
+            commands.append(
+                (
+                    name,
+                    {
+                        "button": _int(args[0]),
+                        "repeat": _int(options.get("repeat", 1)),
+                        "delay": _int(options.get("delay", DEFAULT_CLICK_DELAY_MS)),
+                    },
+                )
+            )
+            args = args[1:]
+        elif name in ("key", "keydown", "keyup"):
+            _, args = _take_options(args, {})
+            keys, args = _take_rest(args)
+            commands.append((name, {"keys": keys}))
+        elif name == "type":
+            options, args = _take_options(args, {"delay": True})
+            texts, args = _take_rest(args)
+            commands.append(
+                (
+                    name,
+                    {
+                        "text": " ".join(texts),
+                        "delay": _int(options.get("delay", DEFAULT_TYPE_DELAY_MS)),
+                    },
+                )
+            )
+        elif name == "sleep":
+            if not args:
+                raise UnsupportedCommand("sleep needs a duration")
+            try:
+                commands.append((name, {"seconds": float(args[0])}))
+            except ValueError as e:
+                raise UnsupportedCommand(f"Invalid duration {args[0]!r}") from e
+            args = args[1:]
+        elif name == "getmouselocation":
+            options, args = _take_options(args, {"shell": False})
+            if not options.get("shell"):
+                raise UnsupportedCommand("Only getmouselocation --shell is supported")
+            commands.append((name, {}))
+        else:
+            raise UnsupportedCommand(f"Unsupported xdotool command {name!r}")
+    return commands
+
+
+class XTestInput:
+    """Replays parsed xdotool commands as XTEST events over one persistent X connection."""
+
+    def __init__(self, display_num: int | None):
+        if xdisplay is None:
+            raise XInputError("python-xlib is required")
+        try:
+            self._display = xdisplay.Display(
+                f":{display_num}" if display_num is not None else None
+            )
+        except Exception as e:
+            raise XInputError(f"Cannot connect to the X display: {e}") from e
+        if not self._display.has_extension("XTEST"):
+            self._display.close()
+            raise XInputError("The X server does not support XTEST")
+        self._root = self._display.screen().root
+        # python-xlib connections are not thread safe and scripts run in worker threads
+        self._lock = threading.Lock()
+        self._spare_keycodes: list[int] | None = None
+
+    def run(self, command: str) -> str:
+        """
+        Run the arguments of an xdotool invocation and return what xdotool would have
+        printed. Commands are fully resolved before any event is sent, so an
+        `UnsupportedCommand` never leaves an action half done.
+        """
+        with self._lock:
+            try:
+                steps = [
+                    self._compile(name, args) for name, args in parse_xdotool(command)
+                ]
+            except UnsupportedCommand:
+                raise
+            except Exception as e:
+                # keymap lookups go to the server too
+                raise XInputError(f"Looking up keys failed: {e}") from e
+            try:
+                output = "".join(step() for script in steps for step in script)
+                # wait for the server to have processed everything, like `--sync`
+                self._display.sync()
+                return output
+            except Exception as e:
+                raise XInputError(f"Sending input failed: {e}") from e
+
+    def type_text(self, text: str):
+        """
+        Type text as one stream of XTEST key events, pausing only between batches for
+        as long as the server needs to keep up. Characters missing from the keymap are
+        temporarily mapped onto spare keycodes, so any text can be typed. Failing once
+        keys were sent raises `InputInterrupted`.
+        """
+        with self._lock:
+            try:
+                segments = self._plan_typing(text)
+            except UnsupportedCommand:
+                raise
+            except Exception as e:
+                raise XInputError(f"Looking up keys failed: {e}") from e
+            try:
+                for remap, keycodes in segments:
+                    self._remap(remap)
+                    try:
+                        self._type_keycodes(keycodes)
+                    finally:
+                        if remap:
+                            # let clients translate the keys typed with the borrowed
+                            # mapping before handing the keycodes back
+                            time.sleep(REMAP_SETTLE_DELAY)
+                            self._remap(dict.fromkeys(remap, 0))
+            except Exception as e:
+                raise InputInterrupted(f"Typing failed: {e}") from e
+
+    def close(self):
+        self._display.close()
+
+    def _plan_typing(self, text: str) -> list[tuple[dict[int, int], list[list[int]]]]:
+        """
+        Split text into segments of (spare keycode -> keysym remapping, keycodes to
+        press per character), starting a new segment whenever the spare keycodes run
+        out. Raises UnsupportedCommand before anything is sent if text can't be typed.
+        """
+        segments: list[tuple[dict[int, int], list[list[int]]]] = [({}, [])]
+        assigned: dict[int, int] = {}  # keysym -> spare keycode in this segment
+        for char in text:
+            keysym = self._char_keysym(char)
+            try:
+                keycodes = self._keycodes_for_keysym(keysym)
+            except UnsupportedCommand:
+                if keysym not in assigned:
+                    spare = self._get_spare_keycodes()
+                    if not spare:
+                        raise
+                    if len(assigned) == len(spare):
+                        segments.append(({}, []))
+                        assigned = {}
+                    assigned[keysym] = spare[len(assigned)]
+                    segments[-1][0][assigned[keysym]] = keysym
+                keycodes = [assigned[keysym]]
+            segments[-1][1].append(keycodes)
+        return segments
+
+    def _get_spare_keycodes(self) -> list[int]:
+        """Keycodes with no keysyms bound, which can be borrowed while typing."""
+        if self._spare_keycodes is None:
+            info = self._display.display.info
+            first, last = info.min_keycode, info.max_keycode
+            mapping = self._display.get_keyboard_mapping(first, last - first + 1)
+            self._spare_keycodes = [
+                first + i for i, keysyms in enumerate(mapping) if not any(keysyms)
+            ]
+        return self._spare_keycodes
+
+    def _remap(self, remap: dict[int, int]):
+        if not remap:
+            return
+        for keycode, keysym in remap.items():
+            self._display.change_keyboard_mapping(keycode, [(keysym, keysym)])
+        self._display.sync()
+        time.sleep(REMAP_SETTLE_DELAY)
+
+    def _type_keycodes(self, keycodes: list[list[int]]):
+        delay = TYPE_BATCH_DELAY_MIN
+        for start in range(0, len(keycodes), TYPE_BATCH_SIZE):
+            for chord in keycodes[start : start + TYPE_BATCH_SIZE]:
+                for code in chord:
+                    self._fake(X.KeyPress, code)
+                for code in reversed(chord):
+                    self._fake(X.KeyRelease, code)
+            sent = time.perf_counter()
+            self._display.sync()
+            round_trip = time.perf_counter() - sent
+            # a slow round trip means the server and the clients reading the keys are
+            # falling behind, so back off; otherwise speed back up
+            if round_trip > delay:
+                delay = min(TYPE_BATCH_DELAY_MAX, delay * 2)
+            else:
+                delay = max(TYPE_BATCH_DELAY_MIN, delay / 2)
+            time.sleep(delay)
+
+    def _compile(self, name: str, args: dict) -> list:
+        if name == "mousemove":
+            return [lambda: self._motion(args["x"], args["y"])]
+        if name in ("mousedown", "mouseup"):
+            return [lambda: self._button(args["button"], name == "mousedown")]
+        if name == "click":
+            steps = []
+            for i in range(args["repeat"]):
+                if i:
+                    steps.append(self._sleeper(args["delay"] / 1000))
+                steps.append(lambda: self._button(args["button"], True))
+                steps.append(lambda: self._button(args["button"], False))
+            return steps
+        if name in ("key", "keydown", "keyup"):
+            steps = []
+            for sequence in args["keys"]:
+                keycodes = self._keycodes_for_sequence(sequence)
+                if name != "keyup":
+                    steps += [self._key_step(code, True) for code in keycodes]
+                if name != "keydown":
+                    steps += [
+                        self._key_step(code, False) for code in reversed(keycodes)
+                    ]
+            return steps
+        if name == "type":
+            steps = []
+            for i, char in enumerate(args["text"]):
+                if i and args["delay"]:
+                    steps.append(self._sleeper(args["delay"] / 1000))
+                keycodes = self._keycodes_for_char(char)
+                steps += [self._key_step(code, True) for code in keycodes]
+                steps += [self._key_step(code, False) for code in reversed(keycodes)]
+            return steps
+        if name == "sleep":
+            return [self._sleeper(args["seconds"])]
+        if name == "getmouselocation":
+            return [self._mouse_location]
+        raise UnsupportedCommand(f"Unsupported xdotool command {name!r}")
+
+    def _keycodes_for_keysym(self, keysym: int) -> list[int]:
+        """Keycodes to hold for a keysym: its key, plus shift if it is a shifted symbol."""
+        for keycode, index in self._display.keysym_to_keycodes(keysym):
+            if index == 0:
+                return [keycode]
+            if index == 1:
+                return [self._display.keysym_to_keycode(XK.XK_Shift_L), keycode]
+        raise UnsupportedCommand(f"No key for keysym {keysym:#x}")
+
+    def _keycodes_for_sequence(self, sequence: str) -> list[int]:
+        """Keycodes for an xdotool key sequence like `ctrl+shift+t`."""
+        keycodes: list[int] = []
+        for name in sequence.split("+"):
+            keysym = XK.string_to_keysym(KEYSYM_ALIASES.get(name.lower(), name))
+            if not keysym and len(name) == 1:
+                keysym = self._char_keysym(name)
+            if not keysym:
+                raise UnsupportedCommand(f"Unknown key name {name!r}")
+            keycodes += [
+                k for k in self._keycodes_for_keysym(keysym) if k not in keycodes
+            ]
+        return keycodes
+
+    def _char_keysym(self, char: str) -> int:
+        if char in CHARACTER_KEYSYMS:
+            return XK.string_to_keysym(CHARACTER_KEYSYMS[char])
+        code = ord(char)
+        # Latin-1 keysyms equal their code point, the rest of Unicode is offset
+        return (
+            code if 0x20 <= code <= 0x7E or 0xA0 <= code <= 0xFF else 0x01000000 + code
+        )
+
+    def _keycodes_for_char(self, char: str) -> list[int]:
+        return self._keycodes_for_keysym(self._char_keysym(char))
+
+    def _key_step(self, keycode: int, press: bool):
+        return lambda: self._fake(X.KeyPress if press else X.KeyRelease, keycode)
+
+    def _sleeper(self, seconds: float):
+        def sleep() -> str:
+            self._display.flush()
+            time.sleep(seconds)
+            return ""
+
+        return sleep
+
+    def _fake(self, event_type: int, detail: int = 0, x: int = 0, y: int = 0) -> str:
+        self._display.xtest_fake_input(event_type, detail, x=x, y=y)
+        return ""
+
+    def _motion(self, x: int, y: int) -> str:
+        return self._fake(X.MotionNotify, x=x, y=y)
+
+    def _button(self, button: int, press: bool) -> str:
+        return self._fake(X.ButtonPress if press else X.ButtonRelease, button)
+
+    def _mouse_location(self) -> str:
+        pointer = self._root.query_pointer()
+        window = pointer.child.id if pointer.child else self._root.id
+        return f"X={pointer.root_x}\nY={pointer.root_y}\nSCREEN=0\nWINDOW={window}\n"
+
+
+def open_input(display_num: int | None) -> XTestInput | None:
+    """Return an in-process input channel, or None if XTEST is unavailable."""
+    try:
+        return XTestInput(display_num)
+    except XInputError:
+        return None
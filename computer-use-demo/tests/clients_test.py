@@ -0,0 +1,66 @@
+import pytest
+
+# imported under the name the sampling loop imports it by, so that the tests use the
+# same client registry as the loop
+from clients import (
+    ClientStats,
+    client_stats,
+    close_clients,
+    get_client,
+)
+
+from computer_use_demo import loop
+
+
+@pytest.fixture(autouse=True)
+async def cleanup_clients():
+    yield
+    await close_clients()
+
+
+async def test_get_client_reuses_client_for_same_key():
+    before = client_stats()
+    client = get_client("anthropic", api_key="test-key")
+    assert get_client("anthropic", api_key="test-key") is client
+
+    after = client_stats()
+    assert after.clients_created == before.clients_created + 1
+    assert after.clients_reused == before.clients_reused + 1
+
+
+async def test_get_client_separates_keys():
+    client = get_client("anthropic", api_key="key-a")
+    assert get_client("anthropic", api_key="key-b") is not client
+    assert (
+        get_client("anthropic", api_key="key-a", base_url="http://localhost:1234")
+        is not client
+    )
+
+
+async def test_get_client_shares_pool_settings():
+    client = get_client("anthropic", api_key="test-key")
+    pool = client._client._transport._pool  # pyright: ignore[reportAttributeAccessIssue]
+    assert pool._max_connections == 100
+    assert pool._keepalive_expiry == 300
+
+
+async def test_close_clients_drops_registry():
+    client = get_client("anthropic", api_key="test-key")
+    await close_clients()
+    assert client.is_closed()
+    assert get_client("anthropic", api_key="test-key") is not client
+
+
+async def test_get_client_rejects_unknown_provider():
+    with pytest.raises(ValueError, match="Unknown API provider"):
+        get_client("unknown")
+
+
+def test_connections_reused():
+    stats = ClientStats(connections_created=2, requests_sent=10)
+    assert stats.connections_reused == 8
+
+
+def test_loop_uses_the_same_client_registry():
+    assert loop.get_client is get_client
+    assert loop.close_clients is close_clients
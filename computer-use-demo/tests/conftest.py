@@ -3,6 +3,8 @@ from unittest import mock
 
 import pytest
 
+from computer_use_demo.tools.computer import close_display_connections
+
 
 @pytest.fixture(autouse=True)
 def mock_screen_dimensions():
@@ -10,3 +12,10 @@ def mock_screen_dimensions():
         os.environ, {"HEIGHT": "768", "WIDTH": "1024", "DISPLAY_NUM": "1"}
     ):
         yield
+
+
+@pytest.fixture(autouse=True)
+def close_shared_display_connections():
+    # captures and input channels opened by one test are not reused by the next
+    yield
+    close_display_connections()
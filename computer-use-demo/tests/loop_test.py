@@ -1,14 +1,29 @@
+import asyncio
+import time
 from unittest import mock
 
+import pytest
 from anthropic.types import TextBlock, ToolUseBlock
-from anthropic.types.beta import BetaMessage, BetaMessageParam, BetaTextBlockParam
+from anthropic.types.beta import (
+    BetaMessage,
+    BetaMessageParam,
+    BetaRawContentBlockDeltaEvent,
+    BetaRawContentBlockStartEvent,
+    BetaTextBlock,
+    BetaTextBlockParam,
+    BetaTextDelta,
+    BetaToolUseBlock,
+)
 
-from computer_use_demo.loop import APIProvider, sampling_loop
+from computer_use_demo.loop import APIProvider, _make_api_tool_result, sampling_loop
+from computer_use_demo.tools.base import Resource, ToolResult
 
 
 async def test_loop():
     client = mock.Mock()
+    client.beta.messages.with_raw_response.create = mock.AsyncMock()
     client.beta.messages.with_raw_response.create.return_value = mock.Mock()
+    client.beta.messages.with_raw_response.create.return_value.parse = mock.AsyncMock()
     client.beta.messages.with_raw_response.create.return_value.parse.side_effect = [
         mock.Mock(
             spec=BetaMessage,
@@ -23,16 +38,15 @@ async def test_loop():
     ]
 
     tool_collection = mock.AsyncMock()
-    tool_collection.run.return_value = mock.Mock(
-        output="Tool output", error=None, base64_image=None
-    )
+    tool_collection.resources = mock.Mock(return_value=set())
+    tool_collection.run.return_value = ToolResult(output="Tool output")
 
     output_callback = mock.Mock()
     tool_output_callback = mock.Mock()
     api_response_callback = mock.Mock()
 
     with mock.patch(
-        "computer_use_demo.loop.Anthropic", return_value=client
+        "computer_use_demo.loop.get_client", return_value=client
     ), mock.patch(
         "computer_use_demo.loop.ToolCollection", return_value=tool_collection
     ):
@@ -65,3 +79,334 @@ async def test_loop():
         assert output_callback.call_count == 3
         assert tool_output_callback.call_count == 1
         assert api_response_callback.call_count == 2
+        tool_collection.close.assert_awaited_once()
+
+
+async def test_loop_awaits_tool_output_callback():
+    events = []
+
+    async def create(**kwargs):
+        events.append("create")
+        raw_response = mock.Mock()
+        content = (
+            [ToolUseBlock(type="tool_use", id="1", name="computer", input={})]
+            if len(events) == 1
+            else [TextBlock(type="text", text="Done!")]
+        )
+        raw_response.parse = mock.AsyncMock(
+            return_value=mock.Mock(spec=BetaMessage, content=content)
+        )
+        return raw_response
+
+    client = mock.Mock()
+    client.beta.messages.with_raw_response.create = create
+
+    async def run_tool(*, name, tool_input):
+        return ToolResult(output="Tool output")
+
+    tool_collection = mock.Mock()
+    tool_collection.close = mock.AsyncMock()
+    tool_collection.resources.return_value = set()
+    tool_collection.run = run_tool
+
+    async def consume(result, tool_use_id):
+        await asyncio.sleep(0.05)
+        events.append(f"consumed {tool_use_id}")
+
+    with mock.patch(
+        "computer_use_demo.loop.get_client", return_value=client
+    ), mock.patch(
+        "computer_use_demo.loop.ToolCollection", return_value=tool_collection
+    ):
+        await sampling_loop(
+            model="test-model",
+            provider=APIProvider.ANTHROPIC,
+            system_prompt_suffix="",
+            messages=[{"role": "user", "content": "Test message"}],
+            output_callback=mock.Mock(),
+            tool_output_callback=consume,
+            api_response_callback=mock.Mock(),
+            api_key="test-key",
+            tool_version="computer_use_20250124",
+        )
+
+    assert events == ["create", "consumed 1", "create"]
+
+
+async def test_loop_cancels_other_tools_when_a_tool_fails():
+    async def create(**kwargs):
+        raw_response = mock.Mock()
+        raw_response.parse = mock.AsyncMock(
+            return_value=mock.Mock(
+                spec=BetaMessage,
+                content=[
+                    ToolUseBlock(type="tool_use", id="1", name="broken", input={}),
+                    ToolUseBlock(type="tool_use", id="2", name="slow", input={}),
+                ],
+            )
+        )
+        return raw_response
+
+    client = mock.Mock()
+    client.beta.messages.with_raw_response.create = create
+
+    slow_started = asyncio.Event()
+    slow_cancelled = asyncio.Event()
+
+    async def run_tool(*, name, tool_input):
+        if name == "broken":
+            await slow_started.wait()
+            raise RuntimeError("not a ToolError")
+        slow_started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            slow_cancelled.set()
+            raise
+        return ToolResult(output="Tool output")
+
+    tool_collection = mock.Mock()
+    tool_collection.close = mock.AsyncMock()
+    tool_collection.resources.return_value = set()
+    tool_collection.run = run_tool
+
+    with mock.patch(
+        "computer_use_demo.loop.get_client", return_value=client
+    ), mock.patch(
+        "computer_use_demo.loop.ToolCollection", return_value=tool_collection
+    ):
+        with pytest.raises(RuntimeError, match="not a ToolError"):
+            await sampling_loop(
+                model="test-model",
+                provider=APIProvider.ANTHROPIC,
+                system_prompt_suffix="",
+                messages=[{"role": "user", "content": "Test message"}],
+                output_callback=mock.Mock(),
+                tool_output_callback=mock.Mock(),
+                api_response_callback=mock.Mock(),
+                api_key="test-key",
+                tool_version="computer_use_20250124",
+            )
+
+    await asyncio.wait_for(slow_cancelled.wait(), 1)
+    tool_collection.close.assert_awaited_once()
+
+
+async def test_loop_concurrent_sessions_do_not_block_each_other():
+    api_latency = 0.2
+    n_sessions = 5
+
+    async def slow_create(**kwargs):
+        # simulate a slow model call that yields to the event loop
+        await asyncio.sleep(api_latency)
+        raw_response = mock.Mock()
+        raw_response.parse = mock.AsyncMock(
+            return_value=mock.Mock(
+                spec=BetaMessage, content=[TextBlock(type="text", text="Done!")]
+            )
+        )
+        return raw_response
+
+    client = mock.Mock()
+    client.beta.messages.with_raw_response.create = slow_create
+
+    with mock.patch(
+        "computer_use_demo.loop.get_client", return_value=client
+    ), mock.patch(
+        "computer_use_demo.loop.ToolCollection",
+        return_value=mock.MagicMock(close=mock.AsyncMock()),
+    ):
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(
+                sampling_loop(
+                    model="test-model",
+                    provider=APIProvider.ANTHROPIC,
+                    system_prompt_suffix="",
+                    messages=[{"role": "user", "content": f"Session {i}"}],
+                    output_callback=mock.Mock(),
+                    tool_output_callback=mock.Mock(),
+                    api_response_callback=mock.Mock(),
+                    api_key="test-key",
+                    tool_version="computer_use_20250124",
+                )
+                for i in range(n_sessions)
+            )
+        )
+        elapsed = time.perf_counter() - start
+
+    assert all(len(result) == 2 for result in results)
+    # sessions progress in parallel: well under the serial n_sessions * latency
+    assert elapsed < api_latency * n_sessions / 2
+
+
+class FakeStream:
+    """Stand-in for the SDK's async message stream."""
+
+    def __init__(self, events, final_message, event_delay=0.0):
+        self.events = events
+        self.final_message = final_message
+        self.event_delay = event_delay
+        self.response = mock.Mock()
+        self.finished = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return None
+
+    async def __aiter__(self):
+        for event in self.events:
+            await asyncio.sleep(self.event_delay)
+            yield event
+        self.finished = True
+
+    async def get_final_message(self):
+        return self.final_message
+
+
+async def test_loop_streaming():
+    events = [
+        BetaRawContentBlockStartEvent(
+            type="content_block_start",
+            index=0,
+            content_block=BetaTextBlock(type="text", text=""),
+        ),
+        BetaRawContentBlockDeltaEvent(
+            type="content_block_delta",
+            index=0,
+            delta=BetaTextDelta(type="text_delta", text="Hel"),
+        ),
+        BetaRawContentBlockDeltaEvent(
+            type="content_block_delta",
+            index=0,
+            delta=BetaTextDelta(type="text_delta", text="lo"),
+        ),
+        mock.Mock(
+            type="content_block_stop",
+            index=0,
+            content_block=BetaTextBlock(type="text", text="Hello"),
+        ),
+    ]
+    client = mock.Mock()
+    client.beta.messages.stream.return_value = FakeStream(
+        events,
+        mock.Mock(spec=BetaMessage, content=[TextBlock(type="text", text="Hello")]),
+    )
+
+    output_callback = mock.Mock()
+    stream_callback = mock.Mock()
+    api_response_callback = mock.Mock()
+
+    with mock.patch(
+        "computer_use_demo.loop.get_client", return_value=client
+    ), mock.patch(
+        "computer_use_demo.loop.ToolCollection",
+        return_value=mock.MagicMock(close=mock.AsyncMock()),
+    ):
+        result = await sampling_loop(
+            model="test-model",
+            provider=APIProvider.ANTHROPIC,
+            system_prompt_suffix="",
+            messages=[{"role": "user", "content": "Test message"}],
+            output_callback=output_callback,
+            tool_output_callback=mock.Mock(),
+            api_response_callback=api_response_callback,
+            api_key="test-key",
+            tool_version="computer_use_20250124",
+            stream_callback=stream_callback,
+        )
+
+    assert len(result) == 2
+    client.beta.messages.with_raw_response.create.assert_not_called()
+    assert [call.args[0]["type"] for call in stream_callback.call_args_list] == [
+        "content_block_start",
+        "content_block_delta",
+        "content_block_delta",
+    ]
+    assert stream_callback.call_args_list[1].args[0]["delta"] == {
+        "type": "text_delta",
+        "text": "Hel",
+    }
+    output_callback.assert_called_once_with(
+        BetaTextBlockParam(text="Hello", type="text", citations=None)
+    )
+    api_response_callback.assert_called_once()
+
+
+async def test_loop_streaming_dispatches_tools_before_response_ends():
+    tool_uses = [
+        BetaToolUseBlock(
+            type="tool_use", id=str(i), name="bash", input={"command": f"echo {i}"}
+        )
+        for i in range(2)
+    ]
+    stream = FakeStream(
+        [
+            mock.Mock(type="content_block_stop", content_block=tool_uses[0]),
+            mock.Mock(type="content_block_stop", content_block=tool_uses[1]),
+            mock.Mock(type="message_stop"),
+        ],
+        mock.Mock(spec=BetaMessage, content=tool_uses),
+        event_delay=0.05,
+    )
+    client = mock.Mock()
+    client.beta.messages.stream.side_effect = [
+        stream,
+        FakeStream(
+            [],
+            mock.Mock(spec=BetaMessage, content=[TextBlock(type="text", text="Done")]),
+        ),
+    ]
+
+    runs = []
+
+    async def run_tool(*, name, tool_input):
+        runs.append((tool_input["command"], stream.finished))
+        await asyncio.sleep(0.01)
+        return ToolResult(output=tool_input["command"])
+
+    tool_collection = mock.Mock()
+    tool_collection.close = mock.AsyncMock()
+    tool_collection.resources.return_value = {Resource("bash")}
+    tool_collection.run = run_tool
+    tool_output_callback = mock.Mock()
+
+    with mock.patch(
+        "computer_use_demo.loop.get_client", return_value=client
+    ), mock.patch(
+        "computer_use_demo.loop.ToolCollection", return_value=tool_collection
+    ):
+        result = await sampling_loop(
+            model="test-model",
+            provider=APIProvider.ANTHROPIC,
+            system_prompt_suffix="",
+            messages=[{"role": "user", "content": "Test message"}],
+            output_callback=mock.Mock(),
+            tool_output_callback=tool_output_callback,
+            api_response_callback=mock.Mock(),
+            api_key="test-key",
+            tool_version="computer_use_20250124",
+            stream_callback=mock.Mock(),
+        )
+
+    # both tools started while the model was still generating, in order
+    assert runs == [("echo 0", False), ("echo 1", False)]
+    tool_results = result[2]["content"]
+    assert [block["tool_use_id"] for block in tool_results] == ["0", "1"]
+    assert [call.args[1] for call in tool_output_callback.call_args_list] == [
+        "0",
+        "1",
+    ]
+
+
+def test_make_api_tool_result_encodes_raw_images():
+    for result in (ToolResult(image=b"png"), ToolResult(base64_image="cG5n")):
+        block = _make_api_tool_result(result, "1")
+        assert block["content"] == [
+            {
+                "type": "image",
+                "source": {"type": "base64", "media_type": "image/png", "data": "cG5n"},
+            }
+        ]
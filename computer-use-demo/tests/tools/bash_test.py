@@ -1,11 +1,25 @@
+import asyncio
+import time
+from unittest.mock import patch
+
 import pytest
 
-from computer_use_demo.tools.bash import BashTool20241022, BashTool20250124, ToolError
+from computer_use_demo.tools.bash import (
+    BashTool20241022,
+    BashTool20250124,
+    ToolError,
+    ToolProgress,
+    _BashSessionPool,
+    close_bash_sessions,
+)
 
 
 @pytest.fixture(params=[BashTool20241022, BashTool20250124])
-def bash_tool(request):
-    return request.param()
+async def bash_tool(request):
+    tool = request.param()
+    yield tool
+    await tool.close()
+    await close_bash_sessions()
 
 
 @pytest.mark.asyncio
@@ -62,10 +76,175 @@ async def test_bash_tool_non_zero_exit(bash_tool):
 
 @pytest.mark.asyncio
 async def test_bash_tool_timeout(bash_tool):
-    await bash_tool(command="echo 'Hello, World!'")
+    await bash_tool(command="cd /tmp; export KEPT=yes; sleep 30 & echo started")
     bash_tool._session._timeout = 0.1  # Set a very short timeout for testing
-    with pytest.raises(
-        ToolError,
-        match="timed out: bash has not returned in 0.1 seconds and must be restarted",
-    ):
-        await bash_tool(command="sleep 1")
+    start = time.monotonic()
+    result = await bash_tool(command="echo before; sleep 5; echo after")
+    assert time.monotonic() - start < 1
+    assert result.output == "before"
+    assert result.system.startswith("the command was interrupted after running for")
+
+    # the shell survives with its state, and so do its background jobs
+    bash_tool._session._timeout = 5
+    result = await bash_tool(command="echo $PWD $KEPT; jobs -r | wc -l")
+    assert result.output == "/tmp yes\n1"
+    assert not result.system
+
+
+@pytest.mark.asyncio
+async def test_bash_tool_timeout_interrupts_shell_loops(bash_tool):
+    await bash_tool(command="true")
+    bash_tool._session._timeout = 0.1
+    for command in ["while true; do :; done", "for i in 1 2; do sleep 5; done"]:
+        result = await bash_tool(command=command)
+        assert result.system
+    assert (await bash_tool(command="echo ok")).output == "ok"
+
+
+@pytest.mark.asyncio
+async def test_bash_tool_timeout_without_interrupt(bash_tool):
+    await bash_tool(command="true")
+    bash_tool._session._timeout = 0.1
+    bash_tool._session._interrupt_timeout = 0.1
+    with pytest.raises(ToolError, match="must be restarted"):
+        await bash_tool(command="trap '' INT; sleep 1")
+    with pytest.raises(ToolError, match="must be restarted"):
+        await bash_tool(command="echo unreachable")
+
+
+@pytest.mark.asyncio
+async def test_bash_tool_cancelled_command_is_interrupted(bash_tool):
+    await bash_tool(command="true")
+    run = asyncio.create_task(bash_tool(command="sleep 5; echo late"))
+    await asyncio.sleep(0.2)
+    run.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await run
+    start = time.monotonic()
+    result = await bash_tool(command="echo next")
+    assert time.monotonic() - start < 1
+    assert result.output == "next"
+
+
+@pytest.mark.asyncio
+async def test_bash_tool_returns_without_polling_delay(bash_tool):
+    await bash_tool(command="true")
+    start = time.monotonic()
+    for _ in range(10):
+        await bash_tool(command="echo hi")
+    assert (time.monotonic() - start) / 10 < 0.1
+
+
+@pytest.mark.asyncio
+async def test_bash_tool_large_output(bash_tool, tmp_path):
+    with patch("computer_use_demo.tools.capture.SPILL_DIR", str(tmp_path)):
+        result = await bash_tool(command="seq 1 500000")
+    # the model sees the start and the end, and where to find the rest
+    assert result.output.startswith("1\n2\n3\n")
+    assert result.output.endswith("\n499999\n500000")
+    assert len(result.output) < 20000
+    (spill_file,) = tmp_path.iterdir()
+    assert str(spill_file) in result.output
+    lines = spill_file.read_text().split("\n")
+    assert lines[0] == "1"
+    assert lines[-2:] == ["500000", ""]
+    assert len(lines) == 500001
+
+
+@pytest.mark.asyncio
+async def test_bash_tool_output_without_trailing_newline(bash_tool):
+    result = await bash_tool(command="printf out; printf err >&2")
+    assert result.output == "out"
+    assert result.error == "err"
+
+
+@pytest.mark.asyncio
+async def test_bash_tool_reads_all_stderr(bash_tool):
+    result = await bash_tool(command="seq 1 20000 >&2")
+    assert result.error.split("\n")[-1] == "20000"
+    assert result.output == ""
+
+
+@pytest.mark.asyncio
+async def test_bash_tool_close_stops_its_shell(bash_tool):
+    await bash_tool(command="cd /tmp && export LEFT_BEHIND=1")
+    session = bash_tool._session
+    await bash_tool.close()
+    assert bash_tool._session is None
+    assert not session.alive
+
+    # the next command gets a fresh shell, not the one closed
+    result = await bash_tool(command="echo ${LEFT_BEHIND:-unset}")
+    assert result.output.strip() == "unset"
+
+
+@pytest.mark.asyncio
+async def test_bash_session_pool_hands_out_warm_sessions():
+    pool = _BashSessionPool(2)
+    pool.refill()
+    session = await pool.acquire()
+    assert session.alive
+    # the claimed session is replaced in the background
+    await asyncio.sleep(0.5)
+    assert len(pool._idle) == 2
+    assert (await session.run("echo warm")).output == "warm"
+
+    start = time.monotonic()
+    other = await pool.acquire()
+    assert time.monotonic() - start < 0.01
+    assert other is not session
+    await session.close()
+    await other.close()
+    await pool.close()
+    assert not pool._idle
+
+
+@pytest.mark.asyncio
+async def test_bash_session_pool_skips_dead_sessions():
+    pool = _BashSessionPool(1)
+    pool.refill()
+    await asyncio.sleep(0.5)
+    (dead,) = pool._idle
+    await dead.close()
+    session = await pool.acquire()
+    assert session is not dead
+    assert session.alive
+    await session.close()
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_bash_tool_restart_after_timeout(bash_tool):
+    await bash_tool(command="true")
+    bash_tool._session._timeout = 0.1
+    bash_tool._session._interrupt_timeout = 0.1
+    with pytest.raises(ToolError):
+        await bash_tool(command="trap '' INT; sleep 1")
+    await asyncio.sleep(0.2)  # let the pool refill
+    await bash_tool(restart=True)
+    result = await bash_tool(command="echo recovered")
+    assert result.output == "recovered"
+
+
+@pytest.mark.asyncio
+async def test_bash_tool_reports_progress(bash_tool):
+    await bash_tool(command="true")
+    bash_tool._session._progress_interval = 0.05
+    progress = []
+    result = await bash_tool(
+        command="for i in 1 2 3; do echo $i; echo e$i >&2; sleep 0.2; done",
+        progress_callback=progress.append,
+    )
+    assert result.output == "1\n2\n3"
+    assert len(progress) >= 2
+    assert all(isinstance(p, ToolProgress) for p in progress)
+    assert "".join(p.output or "" for p in progress).startswith("1\n2\n")
+    assert "".join(p.error or "" for p in progress).startswith("e1\ne2\n")
+
+
+@pytest.mark.asyncio
+async def test_bash_tool_without_progress_callback(bash_tool):
+    await bash_tool(command="true")
+    bash_tool._session._progress_interval = 0.01
+    result = await bash_tool(command="echo a; sleep 0.05; echo b")
+    assert result.output == "a\nb"
@@ -0,0 +1,73 @@
+import os
+from unittest.mock import patch
+
+from computer_use_demo.tools.capture import OutputCapture, capture_stats
+
+
+def test_capture_small_output(tmp_path):
+    capture = OutputCapture(head_bytes=10, tail_bytes=10, spill_dir=str(tmp_path))
+    capture.write(b"hello ")
+    capture.write(b"world")
+    capture.close()
+    assert not capture.truncated
+    assert capture.text() == "hello world"
+    assert capture.spill_path is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_capture_keeps_head_and_tail(tmp_path):
+    before = capture_stats()
+    capture = OutputCapture(head_bytes=4, tail_bytes=4, spill_dir=str(tmp_path))
+    data = bytes(range(48, 58)) * 100  # "0123456789" * 100
+    for i in range(0, len(data), 7):
+        capture.write(data[i : i + 7])
+    capture.close()
+
+    assert capture.truncated
+    assert capture.total_bytes == 1000
+    assert capture.getvalue() == b"0123" + b"6789"
+    assert capture.peak_bytes <= 4 + 4 + 7
+    assert capture.spill_path.read_bytes() == data
+    text = capture.text()
+    assert text.startswith("0123\n<response clipped>")
+    assert "992 bytes of output were omitted" in text
+    assert str(capture.spill_path) in text
+    assert text.endswith("\n6789")
+
+    after = capture_stats()
+    assert after.captures == before.captures + 1
+    assert after.bytes_captured == before.bytes_captured + 1000
+    assert after.bytes_spilled == before.bytes_spilled + 1000
+    assert after.spill_files == before.spill_files + 1
+
+
+def test_capture_single_large_write(tmp_path):
+    capture = OutputCapture(head_bytes=3, tail_bytes=3, spill_dir=str(tmp_path))
+    capture.write(b"abcdefghij")
+    capture.close()
+    assert capture.getvalue() == b"abchij"
+    assert capture.spill_path.read_bytes() == b"abcdefghij"
+
+
+def test_capture_removes_oldest_spill_files(tmp_path):
+    def spill(data):
+        capture = OutputCapture(head_bytes=1, tail_bytes=1, spill_dir=str(tmp_path))
+        capture.write(data)
+        capture.close()
+        return capture.spill_path
+
+    before = capture_stats()
+    with patch("computer_use_demo.tools.capture.SPILL_DIR_MAX_BYTES", 25):
+        first = spill(b"a" * 10)
+        second = spill(b"b" * 10)
+        os.utime(first, ns=(0, 0))  # older, whatever the mtime resolution
+        assert first.exists() and second.exists()
+        # past the limit, the oldest files go first
+        third = spill(b"c" * 10)
+        assert not first.exists()
+        assert second.read_bytes() == b"b" * 10
+        assert third.read_bytes() == b"c" * 10
+        # the file just written is kept even if it alone is over the limit
+        fourth = spill(b"d" * 30)
+        assert sorted(tmp_path.iterdir()) == [fourth]
+    assert capture_stats().spill_files_removed == before.spill_files_removed + 3
@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+
+from computer_use_demo.tools.base import (
+    Resource,
+    ToolProgress,
+    ToolResult,
+    fs_resource,
+)
+from computer_use_demo.tools.bash import BashTool20250124
+from computer_use_demo.tools.collection import ToolCollection, ToolScheduler
+from computer_use_demo.tools.computer import ComputerTool20250124
+from computer_use_demo.tools.edit import EditTool20250429
+
+
+class FakeTool:
+    """A tool that records when calls start and end."""
+
+    reports_progress = False
+
+    def __init__(self, name, resource_key, events, delay=0.05):
+        self.name = name
+        self.resource_key = resource_key
+        self.events = events
+        self.delay = delay
+
+    def to_params(self):
+        return {"name": self.name}
+
+    def resources(self, **kwargs):
+        return {Resource(kwargs.get("resource", self.resource_key))}
+
+    async def __call__(self, *, label, **kwargs):
+        self.events.append(("start", label))
+        await asyncio.sleep(self.delay)
+        self.events.append(("end", label))
+        return ToolResult(output=label)
+
+
+@pytest.fixture
+def events():
+    return []
+
+
+async def run_calls(scheduler, calls):
+    """Submit (name, tool_input) calls as the sampling loop does, and collect results."""
+    tasks = [
+        scheduler.submit(name=name, tool_input=tool_input) for name, tool_input in calls
+    ]
+    return [await task for task in tasks]
+
+
+@pytest.fixture
+def scheduler(events):
+    return ToolScheduler(
+        ToolCollection(
+            FakeTool("computer", "display", events),  # pyright: ignore[reportArgumentType]
+            FakeTool("bash", "bash", events),  # pyright: ignore[reportArgumentType]
+        )
+    )
+
+
+async def test_independent_calls_run_concurrently(scheduler, events):
+    results = await run_calls(
+        scheduler, [("bash", {"label": "bash"}), ("computer", {"label": "screenshot"})]
+    )
+    assert [result.output for result in results] == ["bash", "screenshot"]
+    assert events[:2] == [("start", "bash"), ("start", "screenshot")]
+
+
+async def test_conflicting_calls_run_in_order(scheduler, events):
+    results = await run_calls(
+        scheduler,
+        [
+            ("bash", {"label": "first"}),
+            ("computer", {"label": "screenshot"}),
+            ("bash", {"label": "second"}),
+        ],
+    )
+    assert [result.output for result in results] == ["first", "screenshot", "second"]
+    assert events.index(("end", "first")) < events.index(("start", "second"))
+
+
+async def test_submit_after_earlier_calls_finished(scheduler, events):
+    first = scheduler.submit(name="bash", tool_input={"label": "first"})
+    await first
+    second = scheduler.submit(name="bash", tool_input={"label": "second"})
+    assert (await second).output == "second"
+
+
+async def test_invalid_tool(scheduler):
+    (result,) = await run_calls(scheduler, [("invalid", {})])
+    assert result.error == "Tool invalid is invalid"
+
+
+async def test_cancel(scheduler, events):
+    task = scheduler.submit(name="bash", tool_input={"label": "slow"})
+    await asyncio.sleep(0)
+    scheduler.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert ("end", "slow") not in events
+
+
+def test_resource_conflicts():
+    assert Resource("display").conflicts_with(Resource("display"))
+    assert not Resource("display").conflicts_with(Resource("bash"))
+    assert fs_resource("/a").conflicts_with(fs_resource("/a/b"))
+    assert fs_resource("/a/b").conflicts_with(fs_resource("/a"))
+    assert not fs_resource("/a/b").conflicts_with(fs_resource("/a/c"))
+    assert not fs_resource("/a", exclusive=False).conflicts_with(
+        fs_resource("/a", exclusive=False)
+    )
+    assert fs_resource("/a", exclusive=False).conflicts_with(fs_resource("/a"))
+
+
+def test_tool_resources():
+    collection = ToolCollection(
+        ComputerTool20250124(), BashTool20250124(), EditTool20250429()
+    )
+    computer = collection.resources(name="computer", tool_input={"action": "key"})
+    bash = collection.resources(name="bash", tool_input={"command": "ls"})
+    view = collection.resources(
+        name="str_replace_based_edit_tool",
+        tool_input={"command": "view", "path": "/tmp/a"},
+    )
+    edit = collection.resources(
+        name="str_replace_based_edit_tool",
+        tool_input={"command": "str_replace", "path": "/tmp/a"},
+    )
+    assert computer == {Resource("display")}
+    assert view == {fs_resource("/tmp/a", exclusive=False)}
+    assert edit == {fs_resource("/tmp/a")}
+    # bash may touch any file, so it is ordered with edits and views
+    assert any(r.conflicts_with(v) for r in bash for v in view)
+    assert not any(r.conflicts_with(c) for r in bash for c in computer)
+    # commands that use the display are ordered with the computer tool
+    for command in ("DISPLAY=:1 xdotool key a", "firefox-esr &", "echo $DISPLAY"):
+        gui = collection.resources(name="bash", tool_input={"command": command})
+        assert Resource("display") in gui
+
+
+class ProgressTool(FakeTool):
+    reports_progress = True
+
+    async def __call__(self, *, label, progress_callback=None, **kwargs):
+        if progress_callback:
+            progress_callback(ToolProgress(output=f"{label} running"))
+        return await super().__call__(label=label)
+
+
+async def test_progress_reaches_reporting_tools_only(events):
+    scheduler = ToolScheduler(
+        ToolCollection(
+            ProgressTool("bash", "bash", events),  # pyright: ignore[reportArgumentType]
+            FakeTool("computer", "display", events),  # pyright: ignore[reportArgumentType]
+        )
+    )
+    progress = []
+    bash = scheduler.submit(
+        name="bash", tool_input={"label": "make"}, progress_callback=progress.append
+    )
+    computer = scheduler.submit(
+        name="computer",
+        tool_input={"label": "screenshot"},
+        progress_callback=progress.append,
+    )
+    assert (await bash).output == "make"
+    assert (await computer).output == "screenshot"
+    assert progress == [ToolProgress(output="make running")]
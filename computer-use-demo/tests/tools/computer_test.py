@@ -1,4 +1,5 @@
-from unittest.mock import AsyncMock, patch
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
@@ -8,7 +9,9 @@ from computer_use_demo.tools.computer import (
     ScalingSource,
     ToolError,
     ToolResult,
+    settle_stats,
 )
+from computer_use_demo.tools.screen import ScreenCaptureError
 
 
 @pytest.fixture(params=[ComputerTool20241022, ComputerTool20250124])
@@ -29,6 +32,7 @@ async def test_computer_tool_mouse_move(computer_tool):
 
 @pytest.mark.asyncio
 async def test_computer_tool_type(computer_tool):
+    computer_tool._input = False  # type through xdotool
     with (
         patch.object(computer_tool, "shell", new_callable=AsyncMock) as mock_shell,
         patch.object(
@@ -138,3 +142,66 @@ async def test_computer_tool_missing_coordinate(computer_tool):
 async def test_computer_tool_missing_text(computer_tool):
     with pytest.raises(ToolError, match="text is required for type"):
         await computer_tool(action="type")
+
+
+def settling_tool(computer_tool, digests):
+    """Configure fast settle timings and a capture whose frame digests follow `digests`."""
+    capture = MagicMock()
+    capture.frame_digest.side_effect = digests
+    computer_tool._screen_capture = capture
+    computer_tool._settle_mode = "stable"
+    computer_tool._screenshot_delay = 2.0
+    computer_tool._settle_min_delay = 0.01
+    computer_tool._settle_max_delay = 0.5
+    computer_tool._settle_quiet_period = 0.05
+    computer_tool._settle_sample_interval = 0.01
+    return capture
+
+
+@pytest.mark.asyncio
+async def test_computer_tool_settles_once_screen_is_stable(computer_tool):
+    # the screen changes for a few samples, then stays put
+    capture = settling_tool(computer_tool, [1, 2, 3] + [4] * 100)
+    before = settle_stats()
+    start = time.monotonic()
+    await computer_tool._wait_for_settle()
+    elapsed = time.monotonic() - start
+    after = settle_stats()
+
+    assert 0.05 <= elapsed < 0.5
+    assert capture.frame_digest.call_count >= 5
+    assert after.actions == before.actions + 1
+    assert after.timeouts == before.timeouts
+    assert after.saved_seconds - before.saved_seconds > 1.5
+
+
+@pytest.mark.asyncio
+async def test_computer_tool_settle_times_out(computer_tool):
+    settling_tool(computer_tool, iter(range(1000)))  # never stops changing
+    before = settle_stats()
+    start = time.monotonic()
+    await computer_tool._wait_for_settle()
+    assert 0.5 <= time.monotonic() - start < 1.0
+    assert settle_stats().timeouts == before.timeouts + 1
+
+
+@pytest.mark.asyncio
+async def test_computer_tool_settle_falls_back_to_fixed_delay(computer_tool):
+    capture = settling_tool(computer_tool, ScreenCaptureError("gone"))
+    computer_tool._screenshot_delay = 0.1
+    start = time.monotonic()
+    await computer_tool._wait_for_settle()
+    assert time.monotonic() - start >= 0.1
+    capture.close.assert_called_once()
+    # the next call opens a new capture
+    assert computer_tool._screen_capture is None
+
+
+@pytest.mark.asyncio
+async def test_computer_tool_fixed_settle_mode(computer_tool):
+    capture = settling_tool(computer_tool, [1])
+    computer_tool._settle_mode = "fixed"
+    with patch("asyncio.sleep", new_callable=AsyncMock) as mock_sleep:
+        await computer_tool._wait_for_settle()
+    mock_sleep.assert_called_once_with(2.0)
+    capture.frame_digest.assert_not_called()
@@ -27,8 +27,8 @@ async def test_view_command(edit_tool):
     # Test viewing a directory
     with patch("pathlib.Path.exists", return_value=True), patch(
         "pathlib.Path.is_dir", return_value=True
-    ), patch("computer_use_demo.tools.edit.run") as mock_run:
-        mock_run.return_value = (None, "file1.txt\nfile2.txt", None)
+    ), patch("computer_use_demo.tools.edit.list_directory") as mock_list:
+        mock_list.return_value = ("file1.txt\nfile2.txt", "")
         result = await edit_tool(command="view", path="/test/dir")
         assert isinstance(result, CLIResult)
         assert result.output
@@ -155,7 +155,9 @@ async def test_str_replace_command(edit_tool):
             old_str="Original",
             new_str="New",
         )
-        assert edit_tool._file_history[Path("/test/file.txt")] == ["Original content"]
+        assert edit_tool._file_history.versions(Path("/test/file.txt")) == [
+            "Original content"
+        ]
 
 
 @pytest.mark.asyncio
@@ -235,7 +237,9 @@ async def test_insert_command(edit_tool):
         await edit_tool(
             command="insert", path="/test/file.txt", insert_line=1, new_str="New Line"
         )
-        assert edit_tool._file_history[Path("/test/file.txt")] == ["Original content"]
+        assert edit_tool._file_history.versions(Path("/test/file.txt")) == [
+            "Original content"
+        ]
 
 
 @pytest.mark.asyncio
@@ -0,0 +1,95 @@
+import gc
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+from computer_use_demo.tools.edit import EditTool20250124
+from computer_use_demo.tools.history import EditHistory
+
+PATH = Path("/test/file.txt")
+
+
+def test_undo_in_reverse_order():
+    history = EditHistory()
+    history.push(PATH, "created", "created")
+    history.push(PATH, "created", "created, then edited")
+    history.push(PATH, "created, then edited", "edited")
+    assert history.versions(PATH) == ["created", "created", "created, then edited"]
+    assert history.pop(PATH) == "created, then edited"
+    assert history.pop(PATH) == "created"
+    assert history.pop(PATH) == "created"
+    assert history.pop(PATH) is None
+
+
+def test_undo_across_outside_changes():
+    history = EditHistory()
+    history.push(PATH, "one", "two")
+    # the file changed by other means before the next edit
+    history.push(PATH, "three", "four")
+    assert history.pop(PATH) == "three"
+    assert history.pop(PATH) == "one"
+
+
+def test_evicts_least_recently_edited_files():
+    history = EditHistory(max_bytes=10_000)
+    history.push(Path("/a"), "a" * 3000, "b" * 3000)
+    history.push(Path("/b"), "a" * 3000, "b" * 3000)
+    history.push(Path("/a"), "b" * 3000, "c" * 3000)
+    assert history.size <= 10_000
+    assert history.pop(Path("/b")) is None
+    assert history.pop(Path("/a")) == "b" * 3000
+
+
+def test_keeps_latest_edit_of_a_file_larger_than_the_budget():
+    history = EditHistory(max_bytes=1000)
+    history.push(PATH, "x" * 5000, "y" * 5000)
+    history.push(PATH, "y" * 5000, "z" * 5000)
+    assert history.pop(PATH) == "y" * 5000
+    assert history.pop(PATH) is None
+
+
+def test_repeated_edits_of_a_large_file_use_little_memory():
+    lines = [
+        f"line {i:07} of a large file that is edited many times" for i in range(40_000)
+    ]
+    text = "\n".join(lines)  # ~2 MB
+    history = EditHistory()
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for i in range(50):
+            edited = text.replace(f"line {i * 800:07} of", f"edited line {i} of")
+            history.push(PATH, text, edited)
+            text = edited
+        del edited
+        gc.collect()
+        retained, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # full copies would retain 50 x 2 MB; the diffs need the latest text and a little
+    assert retained < 1.1 * len(text)
+    assert history.size < 1.1 * len(text)
+
+    for _ in range(50):
+        text = history.pop(PATH)
+    assert text == "\n".join(lines)
+
+
+@pytest.mark.asyncio
+async def test_edit_tool_undoes_edits_of_a_large_file(tmp_path):
+    path = tmp_path / "large.txt"
+    original = "\n".join(f"line {i:07}" for i in range(100_000))
+    path.write_text(original)
+    tool = EditTool20250124()
+    for i in range(5):
+        await tool(
+            command="str_replace",
+            path=str(path),
+            old_str=f"line {i * 1000:07}",
+            new_str=f"edited line {i}",
+        )
+    for _ in range(5):
+        await tool(command="undo_edit", path=str(path))
+    assert path.read_text() == original
@@ -0,0 +1,140 @@
+from unittest.mock import patch
+
+import pytest
+
+from computer_use_demo.tools.base import ToolError
+from computer_use_demo.tools.edit import EditTool20250124, EditTool20250429
+from computer_use_demo.tools.history import EditHistory
+
+TEXT = "\n".join(f"line {i}: value = {i * i}" for i in range(40)) + "\n"
+
+EDITS = [
+    {"command": "str_replace", "old_str": "line 0:", "new_str": "first:"},
+    {"command": "str_replace", "old_str": "line 20: value", "new_str": "a\nb\tc"},
+    {"command": "str_replace", "old_str": "= 1521\n", "new_str": ""},
+    {"command": "str_replace", "old_str": "line 7: value = 49\nline 8"},
+    {"command": "insert", "insert_line": 0, "new_str": "header"},
+    {"command": "insert", "insert_line": 2, "new_str": "two\nlines"},
+    {"command": "insert", "insert_line": 40, "new_str": "before the end"},
+    {"command": "insert", "insert_line": 41, "new_str": "at the end"},
+]
+
+
+async def edit(tmp_path, large: bool, **kwargs):
+    path = tmp_path / ("large.txt" if large else "small.txt")
+    path.write_text(TEXT)
+    tool = EditTool20250124()
+    threshold = 0 if large else 1 << 60
+    with patch("computer_use_demo.tools.largefile.LARGE_FILE_BYTES", threshold):
+        try:
+            result = await tool(path=str(path), **kwargs)
+            output = result.output.replace(str(path), "<path>")
+        except ToolError as e:
+            output = f"error: {e.message}".replace(str(path), "<path>")
+        edited = path.read_text()
+        undone = None
+        if not output.startswith("error"):
+            await tool(command="undo_edit", path=str(path))
+            undone = path.read_text()
+    return output, edited, undone
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "kwargs",
+    EDITS
+    + [
+        {"command": "str_replace", "old_str": "missing", "new_str": ""},
+        {"command": "str_replace", "old_str": "value = 1", "new_str": ""},
+        {"command": "str_replace", "old_str": "\nline 1", "new_str": ""},
+        {"command": "insert", "insert_line": 42, "new_str": "past the end"},
+    ],
+)
+async def test_edits_on_disk_match_edits_as_text(tmp_path, kwargs):
+    on_disk = await edit(tmp_path, large=True, **kwargs)
+    as_text = await edit(tmp_path, large=False, **kwargs)
+    assert on_disk == as_text
+    if on_disk[2] is not None:
+        assert on_disk[2] == TEXT
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("tool_class", [EditTool20250124, EditTool20250429])
+async def test_edits_on_disk_are_atomic_and_keep_the_mode(tmp_path, tool_class):
+    path = tmp_path / "large.txt"
+    path.write_text(TEXT)
+    path.chmod(0o640)
+    link = tmp_path / "link.txt"
+    link.symlink_to(path)
+    tool = tool_class()
+    with patch("computer_use_demo.tools.largefile.LARGE_FILE_BYTES", 0):
+        await tool(
+            command="str_replace", path=str(link), old_str="line 3:", new_str="3:"
+        )
+    assert link.is_symlink()
+    assert path.stat().st_mode & 0o777 == 0o640
+    assert "\n3: value = 9\n" in path.read_text()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["large.txt", "link.txt"]
+
+
+@pytest.mark.asyncio
+async def test_undo_across_edits_on_disk_and_as_text(tmp_path):
+    path = tmp_path / "large.txt"
+    path.write_text(TEXT)
+    tool = EditTool20250124()
+    with patch("computer_use_demo.tools.largefile.LARGE_FILE_BYTES", 0):
+        await tool(
+            command="str_replace", path=str(path), old_str="line 1:", new_str="1:"
+        )
+        await tool(command="insert", path=str(path), insert_line=3, new_str="x")
+    # a tab makes the file an edit as text
+    await tool(command="str_replace", path=str(path), old_str="line 5:", new_str="\t5:")
+    with patch("computer_use_demo.tools.largefile.LARGE_FILE_BYTES", 0):
+        for _ in range(3):
+            await tool(command="undo_edit", path=str(path))
+    assert path.read_text() == TEXT
+
+
+@pytest.mark.asyncio
+async def test_undo_on_disk_after_an_outside_change(tmp_path):
+    path = tmp_path / "large.txt"
+    path.write_text(TEXT)
+    tool = EditTool20250124()
+    with patch("computer_use_demo.tools.largefile.LARGE_FILE_BYTES", 0):
+        await tool(
+            command="str_replace", path=str(path), old_str="line 1:", new_str="1:"
+        )
+        path.write_text("rewritten by something else\n")
+        with pytest.raises(ToolError, match="changed since its last edit"):
+            await tool(command="undo_edit", path=str(path))
+    assert path.read_text() == "rewritten by something else\n"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"command": "str_replace", "old_str": "line 1:", "new_str": "1:"},
+        {"command": "insert", "insert_line": 2, "new_str": "x"},
+    ],
+)
+async def test_edits_of_files_that_are_not_utf8(tmp_path, kwargs):
+    path = tmp_path / "large.txt"
+    content = TEXT.encode().replace(b"line 1:", b"line 1: \xff")
+    path.write_bytes(content)
+    tool = EditTool20250124()
+    with patch("computer_use_demo.tools.largefile.LARGE_FILE_BYTES", 0):
+        with pytest.raises(ToolError, match="while trying to read"):
+            await tool(path=str(path), **kwargs)
+    assert path.read_bytes() == content
+
+
+def test_undo_of_an_edit_that_is_not_utf8(tmp_path):
+    path = tmp_path / "large.txt"
+    path.write_bytes(b"a" + TEXT.encode())
+    history = EditHistory()
+    # as if the edit had replaced a byte that can't be decoded with "a"
+    history.push_on_disk(path, 0, b"\xff", b"a", None)
+    with pytest.raises(ToolError, match="while trying to read"):
+        history.pop(path)
+    assert history.pop(path) is None
@@ -0,0 +1,94 @@
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+
+from computer_use_demo.tools.base import ToolError
+from computer_use_demo.tools.edit import EditTool20250124
+from computer_use_demo.tools.lineindex import LineIndexes, line_index_stats
+
+TEXT = "".join(f"line {i}: {'x' * (i % 7)} ü\n" for i in range(60)) + "\n\nend"
+
+
+async def view(path, large: bool, **kwargs):
+    threshold = 0 if large else 1 << 60
+    with (
+        patch("computer_use_demo.tools.largefile.LARGE_FILE_BYTES", threshold),
+        # strides of a few lines each, so that lines are found across them
+        patch("computer_use_demo.tools.lineindex._STRIDE", 16),
+    ):
+        try:
+            result = await EditTool20250124()(command="view", path=str(path), **kwargs)
+            return result.output
+        except ToolError as e:
+            return f"error: {e.message}"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "view_range",
+    [None, [1, 1], [1, 5], [3, 3], [17, 30], [59, 62], [61, -1], [62, 62], [1, -1]]
+    + [[0, 3], [5, 63], [63, 63], [7, 6], [1]],
+)
+async def test_indexed_views_match_views_as_text(tmp_path, view_range):
+    path = tmp_path / "file.txt"
+    path.write_text(TEXT)
+    kwargs = {} if view_range is None else {"view_range": view_range}
+    indexed = await view(path, large=True, **kwargs)
+    assert indexed == await view(path, large=False, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_indexed_views_read_only_what_can_be_shown(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_text("€" * 20000 + "\n" + "a\n" * 100)
+    for view_range in (None, [1, -1], [1, 2]):
+        kwargs = {} if view_range is None else {"view_range": view_range}
+        indexed = await view(path, large=True, **kwargs)
+        assert indexed == await view(path, large=False, **kwargs)
+        assert "<response clipped>" in indexed
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("text", ["a\r\nb\rc\n" * 10, "a\n" * 10 + "\udcff"])
+async def test_files_that_cant_be_indexed_are_read_as_text(tmp_path, text):
+    path = tmp_path / "file.txt"
+    path.write_bytes(text.encode(errors="surrogateescape"))
+    with patch("computer_use_demo.tools.largefile.LARGE_FILE_BYTES", 0):
+        assert LineIndexes().get(path) is None
+    for view_range in (None, [2, 4]):
+        kwargs = {} if view_range is None else {"view_range": view_range}
+        indexed = await view(path, large=True, **kwargs)
+        assert indexed == await view(path, large=False, **kwargs)
+
+
+def test_indexes_are_cached_until_the_file_changes(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_text(TEXT)
+    # files changed within the mtime resolution aren't cached
+    past = time.time() - 10
+    os.utime(path, (past, past))
+    indexes = LineIndexes()
+    with patch("computer_use_demo.tools.largefile.LARGE_FILE_BYTES", 0):
+        before = line_index_stats()
+        index = indexes.get(path)
+        assert index is not None and index.lines == 63
+        assert indexes.get(path) is index
+        assert line_index_stats().builds == before.builds + 1
+        assert line_index_stats().cache_hits == before.cache_hits + 1
+
+        # the same size, but a new mtime
+        path.write_text(TEXT.replace("line 3:", "LINE 3:"))
+        changed = indexes.get(path)
+        assert changed is not index
+        assert changed is not None and changed.read(4, 4) == "LINE 3: xxx ü"
+
+        os.utime(path, (past, past))
+        index = indexes.get(path)
+        indexes.invalidate(path)
+        assert indexes.get(path) is not index
+
+        path.write_text("a\nb\n")
+        with pytest.raises(ToolError, match="was changed while it was being read"):
+            index.read(1, 1)
@@ -0,0 +1,80 @@
+import os
+import subprocess
+
+import pytest
+
+from computer_use_demo.tools.edit import EditTool20250429
+from computer_use_demo.tools.listing import DirectoryListings, listing_stats
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for directory in ["a/x", "b", ".hidden"]:
+        (tmp_path / directory).mkdir(parents=True)
+    for file in ["a/1.txt", "a/x/deep.txt", "b/2.txt", "top.txt", ".dotfile"]:
+        (tmp_path / file).write_text(file)
+    (tmp_path / "link").symlink_to(tmp_path / "a")
+    # make the tree old enough for its listings to be cached by mtime
+    for directory in [tmp_path, tmp_path / "a", tmp_path / "b"]:
+        os.utime(directory, ns=(0, 0))
+    return tmp_path
+
+
+@pytest.fixture(params=[True, False], ids=["inotify", "mtime"])
+def listings(request):
+    listings = DirectoryListings()
+    if not request.param and listings._inotify is not None:
+        listings._inotify.close()
+        listings._inotify = None
+    return listings
+
+
+def test_listing_matches_find(listings, tree):
+    find = subprocess.run(
+        ["find", str(tree), "-maxdepth", "2", "-not", "-path", r"*/\.*"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    text, errors = listings.list(tree)
+    assert errors == ""
+    assert text.splitlines()[0] == str(tree)
+    assert sorted(text.splitlines()) == sorted(find.splitlines())
+
+
+def test_listing_is_cached_until_the_tree_changes(listings, tree):
+    before = listing_stats()
+    text, _ = listings.list(tree)
+    assert listings.list(tree)[0] == text
+    assert listing_stats().cache_hits == before.cache_hits + 1
+
+    (tree / "b" / "new.txt").write_text("new")
+    if listings._inotify is None:
+        # an unchanged mtime can't show the change, like with a coarse clock
+        os.utime(tree / "b", ns=(1, 1))
+    text, _ = listings.list(tree)
+    assert f"{tree}/b/new.txt" in text
+    assert listing_stats().cache_hits == before.cache_hits + 1
+
+
+def test_listing_is_bounded(tree):
+    text, _ = DirectoryListings(max_entries=3).list(tree)
+    lines = text.splitlines()
+    assert lines[:4] == [str(tree), f"{tree}/a", f"{tree}/a/1.txt", f"{tree}/a/x"]
+    assert "stopped after 3 entries" in lines[4]
+
+
+def test_listing_reports_unreadable_directories(listings, tree):
+    text, errors = listings.list(tree / "missing")
+    assert text == f"{tree / 'missing'}\n"
+    assert errors.startswith(f"Cannot read {tree / 'missing'}")
+
+
+@pytest.mark.asyncio
+async def test_edit_tool_view_sees_its_own_edits(tree):
+    tool = EditTool20250429()
+    result = await tool(command="view", path=str(tree))
+    assert "up to 2 levels deep" in result.output
+    await tool(command="create", path=str(tree / "created.txt"), file_text="hi")
+    result = await tool(command="view", path=str(tree))
+    assert f"{tree}/created.txt" in result.output
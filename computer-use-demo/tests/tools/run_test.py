@@ -0,0 +1,53 @@
+import pytest
+
+from computer_use_demo.tools.run import (
+    MAX_RESPONSE_LEN,
+    TRUNCATED_MESSAGE,
+    run,
+    run_command,
+    run_stats,
+)
+
+
+@pytest.mark.asyncio
+async def test_run_shell_command():
+    assert await run("echo out; echo err >&2; exit 3") == (3, "out\n", "err\n")
+
+
+@pytest.mark.asyncio
+async def test_run_argv_without_shell():
+    # no shell, so nothing is expanded or split
+    result = await run_command(["echo", "$HOME", "a b; c"])
+    assert result.stdout == "$HOME a b; c\n"
+    assert result.stdout_bytes == len(result.stdout)
+    assert result.returncode == 0
+    assert result.duration > 0
+
+
+@pytest.mark.asyncio
+async def test_run_keeps_only_the_truncation_budget():
+    before = run_stats()
+    # 10 MB of output, well past what the pipe holds, has to be drained
+    result = await run_command("head -c 10000000 /dev/zero | tr '\\0' x")
+    assert result.stdout == "x" * MAX_RESPONSE_LEN + TRUNCATED_MESSAGE
+    assert result.stdout_bytes == 10_000_000
+    stats = run_stats()
+    assert stats.commands == before.commands + 1
+    assert stats.bytes_read - before.bytes_read == 10_000_000
+    assert stats.bytes_discarded - before.bytes_discarded >= 9_000_000
+
+
+@pytest.mark.asyncio
+async def test_run_truncates_characters_not_bytes():
+    result = await run_command("printf 'é%.0s' $(seq 20)", truncate_after=10)
+    assert result.stdout == "é" * 10 + TRUNCATED_MESSAGE
+    assert result.stdout_bytes == 40
+
+
+@pytest.mark.asyncio
+async def test_run_timeout():
+    with pytest.raises(TimeoutError, match="Command 'sleep 5' timed out"):
+        await run_command(["sleep", "5"], timeout=0.1)
+    # processes the command started are killed with it, closing the pipes
+    with pytest.raises(TimeoutError):
+        await run_command("sleep 5 & sleep 5", timeout=0.1)
@@ -0,0 +1,351 @@
+import base64
+import io
+import os
+import struct
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from computer_use_demo.tools.computer import (
+    ComputerTool20250124,
+    close_display_connections,
+)
+from computer_use_demo.tools.screen import (
+    ScreenCapture,
+    ScreenCaptureError,
+    XlibScreenCapture,
+    XvfbFramebufferCapture,
+    encode_png,
+    framebuffer_path,
+    open_screen_capture,
+)
+
+Image = pytest.importorskip("PIL.Image")
+
+
+class FakeCapture(ScreenCapture):
+    def __init__(self, image=None, error=None):
+        self.image = image
+        self.error = error
+        self.closed = False
+
+    def grab(self):
+        if self.error:
+            raise self.error
+        return self.image
+
+    def close(self):
+        self.closed = True
+
+
+def test_encode_png_resizes():
+    png = encode_png(Image.new("RGB", (1920, 1080), "red"), (1366, 768))
+    image = Image.open(io.BytesIO(png))
+    assert image.format == "PNG"
+    assert image.size == (1366, 768)
+
+
+def test_xlib_capture_converts_bgrx():
+    pytest.importorskip("Xlib")
+    root = MagicMock()
+    root.get_geometry.return_value = MagicMock(width=2, height=1)
+    # one blue and one red pixel, stored as BGRX
+    root.get_image.return_value = MagicMock(
+        depth=24, data=bytes([255, 0, 0, 0, 0, 0, 255, 0])
+    )
+    with patch("computer_use_demo.tools.screen.xdisplay.Display") as display:
+        display.return_value.screen.return_value.root = root
+        image = XlibScreenCapture(1).grab()
+    assert image.getpixel((0, 0)) == (0, 0, 255)
+    assert image.getpixel((1, 0)) == (255, 0, 0)
+
+
+def test_xlib_capture_errors_are_screen_capture_errors():
+    xerror = pytest.importorskip("Xlib.error")
+    with patch("computer_use_demo.tools.screen.xdisplay.Display") as display:
+        root = display.return_value.screen.return_value.root
+        root.get_geometry.side_effect = xerror.ConnectionClosedError("server")
+        capture = XlibScreenCapture(1)
+        with pytest.raises(ScreenCaptureError, match="Cannot read the screen"):
+            capture.grab()
+        with pytest.raises(ScreenCaptureError):
+            capture.frame_digest()
+
+
+def write_xwd(path, pixels, width, height, version=7, depth=24):
+    """Write an XWD file laid out like Xvfb's `-fbdir` framebuffer (LSBFirst, BGRX)."""
+    name = b"Xvfb main window\x00"
+    ncolors = 256
+    header = struct.pack(
+        ">25I",
+        100 + len(name),
+        version,
+        2,  # ZPixmap
+        depth,
+        width,
+        height,
+        0,
+        0,  # LSBFirst
+        32,
+        0,
+        32,
+        32,
+        width * 4,
+        4,  # TrueColor
+        0xFF0000,
+        0xFF00,
+        0xFF,
+        8,
+        ncolors,
+        ncolors,
+        width,
+        height,
+        0,
+        0,
+        0,
+    )
+    path.write_bytes(header + name + bytes(ncolors * 12) + pixels)
+    return str(path)
+
+
+def test_xvfb_framebuffer_capture(tmp_path):
+    # one blue and one red pixel, stored as BGRX
+    path = write_xwd(
+        tmp_path / "Xvfb_screen0", bytes([255, 0, 0, 0, 0, 0, 255, 0]), 2, 1
+    )
+    capture = XvfbFramebufferCapture(path)
+    try:
+        assert capture.size == (2, 1)
+        image = capture.grab()
+        assert image.mode == "RGB"
+        assert image.getpixel((0, 0)) == (0, 0, 255)
+        assert image.getpixel((1, 0)) == (255, 0, 0)
+    finally:
+        capture.close()
+
+
+def test_xvfb_framebuffer_grab_png_resizes(tmp_path):
+    pixels = bytes([0, 255, 0, 0]) * (64 * 32)  # green
+    capture = XvfbFramebufferCapture(write_xwd(tmp_path / "fb", pixels, 64, 32))
+    try:
+        image = Image.open(io.BytesIO(capture.grab_png((16, 8))))
+    finally:
+        capture.close()
+    assert image.size == (16, 8)
+    assert image.convert("RGB").getpixel((5, 5)) == (0, 255, 0)
+
+
+def test_xvfb_framebuffer_sees_updates(tmp_path):
+    path = write_xwd(tmp_path / "fb", bytes(4), 1, 1)
+    capture = XvfbFramebufferCapture(path)
+    try:
+        assert capture.grab().getpixel((0, 0)) == (0, 0, 0)
+        digest = capture.frame_digest()
+        assert capture.frame_digest() == digest
+        with open(path, "r+b") as f:
+            f.seek(-4, 2)
+            f.write(bytes([0, 0, 255, 0]))
+        assert capture.grab().getpixel((0, 0)) == (255, 0, 0)
+        assert capture.frame_digest() != digest
+    finally:
+        capture.close()
+
+
+def test_xvfb_framebuffer_remaps_a_recreated_file(tmp_path):
+    path = write_xwd(tmp_path / "Xvfb_screen0", bytes(4), 1, 1)
+    capture = XvfbFramebufferCapture(path)
+    try:
+        digest = capture.frame_digest()
+        # Xvfb restarted at another resolution, making a new file
+        new = write_xwd(tmp_path / "new", bytes([0, 0, 255, 0]) * 2, 2, 1)
+        os.replace(new, path)
+        assert capture.frame_digest() != digest
+        assert capture.size == (2, 1)
+        assert capture.grab().getpixel((1, 0)) == (255, 0, 0)
+    finally:
+        capture.close()
+
+
+def test_xvfb_framebuffer_file_removed(tmp_path):
+    path = write_xwd(tmp_path / "Xvfb_screen0", bytes(4), 1, 1)
+    capture = XvfbFramebufferCapture(path)
+    try:
+        os.remove(path)
+        with pytest.raises(ScreenCaptureError):
+            capture.grab()
+        with pytest.raises(ScreenCaptureError):
+            capture.frame_digest()
+    finally:
+        capture.close()
+
+
+@pytest.mark.parametrize(
+    "kwargs, pixels",
+    [
+        ({"version": 6}, bytes(8)),
+        ({"depth": 16}, bytes(8)),
+        ({}, bytes(4)),  # truncated
+    ],
+)
+def test_xvfb_framebuffer_rejects_unsupported(tmp_path, kwargs, pixels):
+    path = write_xwd(tmp_path / "fb", pixels, 2, 1, **kwargs)
+    with pytest.raises(ScreenCaptureError):
+        XvfbFramebufferCapture(path)
+
+
+XVFB_COMMAND_LINES = [
+    ["bash", "./start_all.sh"],
+    ["Xvfb", ":1", "-ac", "-screen", "0", "1024x768x24", "-fbdir", "/tmp/one"],
+    ["/usr/bin/Xvfb", ":2", "-screen", "0", "1024x768x24", "-fbdir", "/tmp/two"],
+    ["Xvfb", ":3", "-screen", "0", "1024x768x24"],
+]
+
+
+@pytest.mark.parametrize(
+    "display_num, environ, expected",
+    [
+        (1, {}, "/tmp/one/Xvfb_screen0"),
+        (2, {}, "/tmp/two/Xvfb_screen0"),
+        (None, {"DISPLAY": ":2.0"}, "/tmp/two/Xvfb_screen0"),
+        (3, {}, None),  # no -fbdir
+        (4, {}, None),
+        (None, {"DISPLAY": ""}, None),
+    ],
+)
+def test_framebuffer_path(display_num, environ, expected):
+    with (
+        patch("computer_use_demo.tools.screen.XVFB_FBDIR", None),
+        patch(
+            "computer_use_demo.tools.screen._command_lines",
+            return_value=iter(XVFB_COMMAND_LINES),
+        ),
+        patch.dict("os.environ", environ),
+    ):
+        assert framebuffer_path(display_num) == expected
+
+
+def test_framebuffer_path_override():
+    with patch("computer_use_demo.tools.screen.XVFB_FBDIR", "/fb"):
+        assert framebuffer_path(1, screen=1) == "/fb/Xvfb_screen1"
+
+
+def test_open_screen_capture_prefers_framebuffer(tmp_path):
+    write_xwd(tmp_path / "Xvfb_screen0", bytes(8), 2, 1)
+    with patch("computer_use_demo.tools.screen.XVFB_FBDIR", str(tmp_path)):
+        capture = open_screen_capture(1)
+    try:
+        assert isinstance(capture, XvfbFramebufferCapture)
+    finally:
+        capture.close()
+
+
+async def test_screenshot_in_process():
+    tool = ComputerTool20250124()
+    capture = FakeCapture(Image.new("RGB", (1920, 1080)))
+    with (
+        patch(
+            "computer_use_demo.tools.computer.open_screen_capture",
+            return_value=capture,
+        ),
+        patch("computer_use_demo.tools.computer.run") as mock_run,
+    ):
+        result = await tool.screenshot()
+    mock_run.assert_not_called()
+    assert result.base64_image is None
+    image = Image.open(io.BytesIO(result.image))
+    assert image.size == (1366, 768)
+
+
+async def test_screenshot_falls_back_to_subprocess():
+    tool = ComputerTool20250124()
+    capture = FakeCapture(error=ScreenCaptureError("no display"))
+    with (
+        patch(
+            "computer_use_demo.tools.computer.open_screen_capture",
+            return_value=capture,
+        ),
+        patch("computer_use_demo.tools.computer.run") as mock_run,
+        patch("pathlib.Path.exists", return_value=True),
+        patch("pathlib.Path.read_bytes", return_value=b"png"),
+    ):
+        mock_run.return_value = (0, "", "")
+        result = await tool.screenshot()
+    assert mock_run.called
+    assert capture.closed
+    assert result.image == b"png"
+    assert result.image_base64() == base64.b64encode(b"png").decode()
+
+
+async def test_tools_share_the_screen_capture():
+    captures = [FakeCapture(error=ScreenCaptureError("gone")), FakeCapture()]
+    with (
+        patch(
+            "computer_use_demo.tools.computer.open_screen_capture",
+            side_effect=captures,
+        ) as open_capture,
+        patch("computer_use_demo.tools.computer.run", return_value=(0, "", "")),
+        patch("pathlib.Path.exists", return_value=True),
+        patch("pathlib.Path.read_bytes", return_value=b"png"),
+    ):
+        # tools made for later turns reuse the capture rather than opening their own
+        first, second = ComputerTool20250124(), ComputerTool20250124()
+        assert first._get_screen_capture() is second._get_screen_capture()
+        assert open_capture.call_count == 1
+
+        # a capture that fails is closed, and the next tool opens a new one
+        await first.screenshot()
+        assert captures[0].closed
+        assert ComputerTool20250124()._get_screen_capture() is captures[1]
+        assert open_capture.call_count == 2
+
+    close_display_connections()
+    assert captures[1].closed
+
+
+async def test_failed_capture_is_reopened_on_the_next_call():
+    captures = [FakeCapture(error=ScreenCaptureError("gone")), FakeCapture()]
+    captures[1].image = Image.new("RGB", (1920, 1080))
+    tool = ComputerTool20250124()
+    with (
+        patch(
+            "computer_use_demo.tools.computer.open_screen_capture",
+            side_effect=captures,
+        ),
+        patch("computer_use_demo.tools.computer.run", return_value=(0, "", "")),
+        patch("pathlib.Path.exists", return_value=True),
+        patch("pathlib.Path.read_bytes", return_value=b"png"),
+    ):
+        assert (await tool.screenshot()).image == b"png"
+        assert captures[0].closed
+        # the X server is back: the same tool captures in-process again
+        result = await tool.screenshot()
+    assert Image.open(io.BytesIO(result.image)).size == (1366, 768)
+    assert tool._get_screen_capture() is captures[1]
+
+
+def settle_on(capture):
+    tool = ComputerTool20250124()
+    tool._screen_capture = capture
+    tool._settle_mode = "stable"
+    tool._screenshot_delay = 0.1
+    tool._settle_min_delay = 0.01
+    return tool
+
+
+async def test_settle_falls_back_when_xlib_fails():
+    xerror = pytest.importorskip("Xlib.error")
+    with patch("computer_use_demo.tools.screen.xdisplay.Display") as display:
+        root = display.return_value.screen.return_value.root
+        root.get_geometry.side_effect = xerror.ConnectionClosedError("server")
+        tool = settle_on(XlibScreenCapture(1))
+        await tool._wait_for_settle()
+    # the broken capture was dropped, to be reopened by the next call
+    assert tool._screen_capture is None
+
+
+async def test_settle_falls_back_when_framebuffer_is_closed(tmp_path):
+    capture = XvfbFramebufferCapture(write_xwd(tmp_path / "fb", bytes(4), 1, 1))
+    capture.close()
+    tool = settle_on(capture)
+    await tool._wait_for_settle()
+    assert tool._screen_capture is None
@@ -0,0 +1,377 @@
+import os
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from computer_use_demo.tools.computer import ComputerTool20250124, ToolResult
+from computer_use_demo.tools.xinput import (
+    UnsupportedCommand,
+    XInputError,
+    XTestInput,
+    parse_xdotool,
+)
+
+X = pytest.importorskip("Xlib.X")
+XK = pytest.importorskip("Xlib.XK")
+
+SHIFT = 50
+# keycode -> keysyms (unshifted, shifted), like a tiny US layout
+KEYMAP = {
+    SHIFT: ("Shift_L", None),
+    37: ("Control_L", None),
+    36: ("Return", None),
+    38: ("a", "A"),
+    10: ("1", "exclam"),
+    65: ("space", None),
+}
+
+
+class FakeDisplay:
+    def __init__(self):
+        self.events = []
+        self.synced = 0
+        self.remapped = {}
+        # keycodes 8-100, with 90 and 91 free
+        self.display = MagicMock()
+        self.display.info.min_keycode = 8
+        self.display.info.max_keycode = 100
+        self.root = MagicMock()
+        self.root.query_pointer.return_value = MagicMock(
+            root_x=10, root_y=20, child=MagicMock(id=42)
+        )
+
+    def has_extension(self, name):
+        return name == "XTEST"
+
+    def screen(self):
+        return MagicMock(root=self.root)
+
+    def keysym_to_keycodes(self, keysym):
+        return [
+            (code, index)
+            for code, names in KEYMAP.items()
+            for index, name in enumerate(names)
+            if name and XK.string_to_keysym(name) == keysym
+        ]
+
+    def get_keyboard_mapping(self, first_keycode, count):
+        return [
+            [0, 0] if code in (90, 91) else [1, 0]
+            for code in range(first_keycode, first_keycode + count)
+        ]
+
+    def change_keyboard_mapping(self, first_keycode, keysyms):
+        self.events.append(("remap", first_keycode, keysyms[0][0]))
+
+    def keysym_to_keycode(self, keysym):
+        return next(iter(self.keysym_to_keycodes(keysym)), (0, 0))[0]
+
+    def xtest_fake_input(self, event_type, detail=0, x=0, y=0):
+        self.events.append(
+            (event_type, detail, x, y) if x or y else (event_type, detail)
+        )
+
+    def sync(self):
+        self.synced += 1
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def xtest():
+    display = FakeDisplay()
+    with patch("computer_use_demo.tools.xinput.xdisplay.Display", return_value=display):
+        yield XTestInput(1), display
+
+
+def test_parse_chained_commands():
+    assert parse_xdotool(
+        "mousemove --sync 10 20 keydown ctrl click --repeat 3 4 keyup ctrl"
+    ) == [
+        ("mousemove", {"x": 10, "y": 20}),
+        ("keydown", {"keys": ["ctrl"]}),
+        ("click", {"button": 4, "repeat": 3, "delay": 100}),
+        ("keyup", {"keys": ["ctrl"]}),
+    ]
+
+
+def test_parse_key_and_type_take_the_rest():
+    assert parse_xdotool("key -- ctrl+a Return") == [
+        ("key", {"keys": ["ctrl+a", "Return"]})
+    ]
+    assert parse_xdotool("type --delay 12 -- 'click me now'") == [
+        ("type", {"text": "click me now", "delay": 12})
+    ]
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        "windowactivate 123",
+        "mousemove --window 1 10 20",
+        "click",
+        "getmouselocation",
+        "type 'unterminated",
+    ],
+)
+def test_parse_rejects_unsupported(command):
+    with pytest.raises(UnsupportedCommand):
+        parse_xdotool(command)
+
+
+def test_xtest_mouse(xtest):
+    xinput, display = xtest
+    assert xinput.run("mousemove --sync 10 20 click 1") == ""
+    assert display.events == [
+        (X.MotionNotify, 0, 10, 20),
+        (X.ButtonPress, 1),
+        (X.ButtonRelease, 1),
+    ]
+    assert display.synced
+
+
+def test_xtest_key_combo(xtest):
+    xinput, display = xtest
+    xinput.run("key -- ctrl+A")
+    # A is shifted, so shift is held along with ctrl
+    assert display.events == [
+        (X.KeyPress, 37),
+        (X.KeyPress, SHIFT),
+        (X.KeyPress, 38),
+        (X.KeyRelease, 38),
+        (X.KeyRelease, SHIFT),
+        (X.KeyRelease, 37),
+    ]
+
+
+def test_xtest_type(xtest):
+    xinput, display = xtest
+    xinput.run("type --delay 0 -- 'a!'")
+    assert display.events == [
+        (X.KeyPress, 38),
+        (X.KeyRelease, 38),
+        (X.KeyPress, SHIFT),
+        (X.KeyPress, 10),
+        (X.KeyRelease, 10),
+        (X.KeyRelease, SHIFT),
+    ]
+
+
+def test_xtest_unmapped_key_sends_nothing(xtest):
+    xinput, display = xtest
+    with pytest.raises(UnsupportedCommand):
+        xinput.run("type --delay 0 -- 'a€'")
+    assert display.events == []
+
+
+def test_xtest_mouse_location(xtest):
+    xinput, _ = xtest
+    assert xinput.run("getmouselocation --shell") == "X=10\nY=20\nSCREEN=0\nWINDOW=42\n"
+
+
+def test_xtest_bulk_type(xtest):
+    xinput, display = xtest
+    xinput.type_text("aA" * 100)
+    presses = [detail for event, detail in display.events if event == X.KeyPress]
+    assert presses == [38, SHIFT, 38] * 100
+    # batched: far fewer round trips than characters
+    assert 1 < display.synced < 10
+
+
+def test_xtest_bulk_type_remaps_spare_keycodes(xtest):
+    xinput, display = xtest
+    # non Latin-1 characters use their Unicode keysym
+    euro, yen, pound = 0x01000000 + ord("€"), XK.XK_yen, XK.XK_sterling
+    with patch("computer_use_demo.tools.xinput.REMAP_SETTLE_DELAY", 0):
+        xinput.type_text("€a¥€£")
+    assert [e for e in display.events if e[0] != X.KeyRelease] == [
+        # two spare keycodes: € and ¥ first ...
+        ("remap", 90, euro),
+        ("remap", 91, yen),
+        (X.KeyPress, 90),
+        (X.KeyPress, 38),
+        (X.KeyPress, 91),
+        (X.KeyPress, 90),
+        ("remap", 90, 0),
+        ("remap", 91, 0),
+        # ... then £ in a second segment
+        ("remap", 90, pound),
+        (X.KeyPress, 90),
+        ("remap", 90, 0),
+    ]
+
+
+def test_xtest_bulk_type_without_spare_keycodes(xtest):
+    xinput, display = xtest
+    xinput._spare_keycodes = []
+    with pytest.raises(UnsupportedCommand):
+        xinput.type_text("a€")
+    assert display.events == []
+
+
+@pytest.mark.asyncio
+async def test_computer_tool_types_in_bulk(xtest):
+    xinput, display = xtest
+    tool = ComputerTool20250124()
+    tool._input = xinput
+    with (
+        patch.object(tool, "shell") as shell,
+        patch.object(tool, "screenshot", return_value=ToolResult(base64_image="png")),
+    ):
+        result = await tool(action="type", text="a" * 500)
+    shell.assert_not_called()
+    assert result.base64_image == "png"
+    assert [e for e in display.events if e[0] == X.KeyPress] == [(X.KeyPress, 38)] * 500
+
+
+def _keysym_to_char(keysym):
+    if keysym == XK.XK_Return:
+        return "\n"
+    if keysym == XK.XK_Tab:
+        return "\t"
+    return chr(keysym - 0x01000000 if keysym >= 0x01000000 else keysym)
+
+
+def test_type_text_reaches_window():
+    """Type into a real window and check it receives exactly the text."""
+    display_module = pytest.importorskip("Xlib.display")
+    if not os.getenv("DISPLAY"):
+        pytest.skip("needs an X display")
+    try:
+        reader = display_module.Display()
+        xinput = XTestInput(None)
+    except (XInputError, Exception) as e:
+        pytest.skip(f"cannot use the X display: {e}")
+
+    screen = reader.screen()
+    window = screen.root.create_window(
+        0, 0, 400, 200, 0, screen.root_depth, event_mask=X.KeyPressMask | X.ExposureMask
+    )
+    window.map()
+    while reader.next_event().type != X.Expose:
+        pass
+    window.set_input_focus(X.RevertToParent, X.CurrentTime)
+    reader.sync()
+
+    text = "Hello, World!\n\tlorem ~ipsum_ {dolor} <sit> 'amet' \"ü€¥\" 42%\n" * 40
+    received = []
+
+    def read_keys():
+        deadline = time.monotonic() + 20
+        while len(received) < len(text) and time.monotonic() < deadline:
+            if not reader.pending_events():
+                time.sleep(0.001)
+                continue
+            event = reader.next_event()
+            if event.type == X.MappingNotify:
+                reader.refresh_keyboard_mapping(event)
+            elif event.type == X.KeyPress:
+                index = 1 if event.state & X.ShiftMask else 0
+                keysym = reader.keycode_to_keysym(event.detail, index)
+                if keysym not in (XK.XK_Shift_L, XK.XK_Shift_R):
+                    received.append(_keysym_to_char(keysym))
+
+    thread = threading.Thread(target=read_keys)
+    thread.start()
+    start = time.monotonic()
+    try:
+        xinput.type_text(text)
+        elapsed = time.monotonic() - start
+        thread.join()
+    finally:
+        window.destroy()
+        reader.close()
+        xinput.close()
+    assert "".join(received) == text
+    assert elapsed < 2
+
+
+@pytest.mark.asyncio
+async def test_computer_tool_uses_xtest(xtest):
+    xinput, display = xtest
+    tool = ComputerTool20250124()
+    tool._input = xinput
+    with patch("computer_use_demo.tools.computer.run") as run:
+        result = await tool.shell(
+            f"{tool.xdotool} mousemove --sync 1 2", take_screenshot=False
+        )
+    run.assert_not_called()
+    assert result.output == ""
+    assert display.events == [(X.MotionNotify, 0, 1, 2)]
+
+
+@pytest.mark.asyncio
+async def test_computer_tool_falls_back_to_xdotool(xtest):
+    xinput, _ = xtest
+    tool = ComputerTool20250124()
+    tool._input = xinput
+    with patch(
+        "computer_use_demo.tools.computer.run", return_value=(0, "done", "")
+    ) as run:
+        command = f"{tool.xdotool} windowactivate 1"
+        result = await tool.shell(command, take_screenshot=False)
+    run.assert_called_once_with(command)
+    assert result.output == "done"
+    assert tool._input is xinput
+
+
+@pytest.mark.asyncio
+async def test_computer_tool_falls_back_when_key_lookup_fails(xtest):
+    xerror = pytest.importorskip("Xlib.error")
+    xinput, display = xtest
+    tool = ComputerTool20250124()
+    tool._input = xinput
+    with (
+        patch.object(
+            display,
+            "keysym_to_keycodes",
+            side_effect=xerror.ConnectionClosedError("server"),
+        ),
+        patch("computer_use_demo.tools.computer.run", return_value=(0, "", "")) as run,
+    ):
+        command = f"{tool.xdotool} key ctrl+a"
+        await tool.shell(command, take_screenshot=False)
+    run.assert_called_once_with(command)
+    assert display.events == []
+    # the broken channel is dropped
+    assert not tool._input
+
+
+@pytest.mark.asyncio
+async def test_computer_tool_types_through_xdotool_when_remapping_fails(xtest):
+    xerror = pytest.importorskip("Xlib.error")
+    xinput, display = xtest
+    tool = ComputerTool20250124()
+    tool._input = xinput
+    with patch.object(
+        display,
+        "get_keyboard_mapping",
+        side_effect=xerror.ConnectionClosedError("server"),
+    ):
+        assert not await tool._type_in_process("a€")
+    assert display.events == []
+    assert not tool._input
+
+
+def test_computer_tools_share_the_input_channel():
+    channels = [MagicMock(), MagicMock()]
+    with patch(
+        "computer_use_demo.tools.computer.open_input", side_effect=channels
+    ) as open_input:
+        first, second = ComputerTool20250124(), ComputerTool20250124()
+        first._input = second._input = None
+        assert first._get_input() is second._get_input() is channels[0]
+        assert open_input.call_count == 1
+
+        # a channel that failed is closed, and the next tool opens a new one
+        first._disable_input()
+        channels[0].close.assert_called_once()
+        third = ComputerTool20250124()
+        third._input = None
+        assert third._get_input() is channels[1]
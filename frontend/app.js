@@ -2,6 +2,9 @@
 let selectedSession = null;
 let ws = null;
 let wsMessageCount = 0;
+// Chat elements for content blocks that are still streaming, keyed by block index
+let streamingBlocks = {};
+let toolProgressBlocks = {};
 
 // =============== SESSION / TASKS ===============
 
@@ -194,6 +197,7 @@ function parseRegularContent(content) {
   // Split content by lines and parse it
   const lines = content.split('\n');
   let currentTextBlock = [];
+  let screenshot;
   
   for (let i = 0; i < lines.length; i++) {
     const line = lines[i];
@@ -210,8 +214,8 @@ function parseRegularContent(content) {
       }
       // Display tool use indicator
       appendChat(`Agent: ${trimmedLine}`, "agent");
-    } else if (trimmedLine.match(/^!\[.*?\]\(.*?\)$/)) {
-      // This is a markdown image
+    } else if ((screenshot = parseScreenshotLine(trimmedLine))) {
+      // This is a markdown image, or a thumbnail linked to the full image
       // Display any accumulated text first
       if (currentTextBlock.length > 0) {
         const textContent = currentTextBlock.join('\n').trim();
@@ -221,34 +225,10 @@ function parseRegularContent(content) {
         currentTextBlock = [];
       }
       
-      // Extract image URL and display image
-      const imageUrl = trimmedLine.match(/\((.*?)\)/)[1];
+      // Display the image
       const imgContainer = document.createElement("div");
       imgContainer.className = "bot-msg";
-      
-      const imgDiv = document.createElement("div");
-      imgDiv.className = "tool-image";
-      
-      const img = document.createElement("img");
-      img.src = imageUrl;
-      img.alt = "Screenshot";
-      img.style.maxWidth = "100%";
-      img.style.height = "auto";
-      img.style.border = "1px solid #ccc";
-      img.style.borderRadius = "4px";
-      img.style.marginTop = "8px";
-      
-      // Add error handling for image load failures
-      img.onerror = function() {
-        console.error("Failed to load image:", imageUrl);
-        const errorDiv = document.createElement("div");
-        errorDiv.className = "tool-error";
-        errorDiv.textContent = "Failed to load screenshot";
-        imgDiv.appendChild(errorDiv);
-      };
-      
-      imgDiv.appendChild(img);
-      imgContainer.appendChild(imgDiv);
+      imgContainer.appendChild(createScreenshot(screenshot.imageUrl, screenshot.thumbnailUrl, "Screenshot"));
       document.getElementById("chatHistory").appendChild(imgContainer);
     } else {
       // Accumulate this line (including empty lines to preserve formatting)
@@ -346,6 +326,8 @@ function connectProgressStream(sessionId) {
   console.log("🚀 ~ connectProgressStream ~ sessionId:", sessionId)
   if (ws) ws.close();
   wsMessageCount = 0;
+  streamingBlocks = {};
+  toolProgressBlocks = {};
   ws = new WebSocket(
     `ws://${location.hostname}:8080/sessions/${sessionId}/stream`
   );
@@ -370,16 +352,23 @@ function connectProgressStream(sessionId) {
       console.log("🚀 ~ Parsed block:", block);
       console.log("🚀 ~ Block type:", block.type);
       
-      if (block.type === "text" && block.text) {
+      if (block.type === "content_block_start") {
+        startStreamingBlock(block.index, block.content_block);
+      } else if (block.type === "content_block_delta") {
+        appendStreamingDelta(block.index, block.delta);
+      } else if (block.type === "text" && block.text) {
         console.log("🚀 ~ Displaying text block:", block.text);
         appendChat("Agent: " + block.text, "agent");
       } else if (block.type === "tool_use") {
         console.log("🚀 ~ Displaying tool_use block:", block.name);
         appendChat(`Agent: [Running tool: ${block.name}]`, "agent");
+      } else if (block.type === "tool_progress") {
+        appendToolProgress(block.tool_use_id, block.output, block.error);
       } else if (block.type === "tool_result") {
         console.log("🚀 ~ Displaying tool_result block:", block.result);
         console.log("🚀 ~ Tool result keys:", Object.keys(block.result));
         console.log("🚀 ~ Tool result base64_image exists:", !!block.result.base64_image);
+        removeToolProgress(block.tool_use_id);
         displayToolResult(block.result, block.tool_use_id);
       } else if (block.type === "error") {
         console.log("🚀 ~ Displaying error block:", block.message);
@@ -407,6 +396,60 @@ function connectProgressStream(sessionId) {
   };
 }
 
+function startStreamingBlock(index, contentBlock) {
+  // Indexes restart at 0 on every model turn, so a new start replaces the old entry
+  const prefix = {
+    text: "Agent: ",
+    thinking: "Agent (thinking): ",
+  }[contentBlock.type];
+  if (prefix === undefined) {
+    // tool_use blocks are announced once complete, see the "tool_use" handler
+    delete streamingBlocks[index];
+    return;
+  }
+  const chat = document.getElementById("chatHistory");
+  const div = document.createElement("div");
+  div.className = "bot-msg";
+  div.textContent = prefix;
+  chat.appendChild(div);
+  streamingBlocks[index] = div;
+}
+
+function appendStreamingDelta(index, delta) {
+  const div = streamingBlocks[index];
+  if (!div) return;
+  if (delta.type === "text_delta") {
+    div.textContent += delta.text;
+  } else if (delta.type === "thinking_delta") {
+    div.textContent += delta.thinking;
+  } else {
+    return;
+  }
+  const chat = document.getElementById("chatHistory");
+  chat.scrollTop = chat.scrollHeight;
+}
+
+function appendToolProgress(toolUseId, output, error) {
+  // Live output of a running tool, replaced by its result once it finishes
+  const chat = document.getElementById("chatHistory");
+  let div = toolProgressBlocks[toolUseId];
+  if (!div) {
+    div = document.createElement("div");
+    div.className = "bot-msg tool-output";
+    chat.appendChild(div);
+    toolProgressBlocks[toolUseId] = div;
+  }
+  div.textContent += (output || "") + (error || "");
+  chat.scrollTop = chat.scrollHeight;
+}
+
+function removeToolProgress(toolUseId) {
+  const div = toolProgressBlocks[toolUseId];
+  if (!div) return;
+  div.remove();
+  delete toolProgressBlocks[toolUseId];
+}
+
 function displayToolResult(result, toolUseId) {
   const chat = document.getElementById("chatHistory");
   const div = document.createElement("div");
@@ -440,29 +483,7 @@ function displayToolResult(result, toolUseId) {
   
   // Add image if available
   if (result.image_url) {
-    const imgDiv = document.createElement("div");
-    imgDiv.className = "tool-image";
-    
-    const img = document.createElement("img");
-    img.src = result.image_url;
-    img.alt = "Tool result image";
-    img.style.maxWidth = "100%";
-    img.style.height = "auto";
-    img.style.border = "1px solid #ccc";
-    img.style.borderRadius = "4px";
-    img.style.marginTop = "8px";
-    
-    // Add error handling for image load failures
-    img.onerror = function() {
-      console.error("Failed to load image:", result.image_url);
-      const errorDiv = document.createElement("div");
-      errorDiv.className = "tool-error";
-      errorDiv.textContent = "Failed to load screenshot";
-      imgDiv.appendChild(errorDiv);
-    };
-    
-    imgDiv.appendChild(img);
-    contentDiv.appendChild(imgDiv);
+    contentDiv.appendChild(createScreenshot(result.image_url, result.thumbnail_url, "Tool result image"));
   }
   
   div.appendChild(contentDiv);
@@ -470,6 +491,48 @@ function displayToolResult(result, toolUseId) {
   chat.scrollTop = chat.scrollHeight;
 }
 
+function createScreenshot(imageUrl, thumbnailUrl, alt) {
+  // Show the thumbnail, if there is one, and load the full image only once it's clicked
+  const imgDiv = document.createElement("div");
+  imgDiv.className = "tool-image";
+  
+  const img = document.createElement("img");
+  img.src = thumbnailUrl || imageUrl;
+  img.alt = alt;
+  // Long sessions have hundreds of screenshots, only fetch the ones scrolled to
+  img.loading = "lazy";
+  img.style.maxWidth = "100%";
+  img.style.height = "auto";
+  img.style.border = "1px solid #ccc";
+  img.style.borderRadius = "4px";
+  img.style.marginTop = "8px";
+  
+  if (thumbnailUrl) {
+    img.classList.add("thumbnail");
+    img.title = "Click to show the full screenshot";
+    img.onclick = function() {
+      // Toggle between the thumbnail and the full image
+      const showFull = img.classList.contains("thumbnail");
+      img.src = showFull ? imageUrl : thumbnailUrl;
+      img.classList.toggle("thumbnail", !showFull);
+      img.classList.toggle("expanded", showFull);
+      img.title = showFull ? "Click to show the thumbnail" : "Click to show the full screenshot";
+    };
+  }
+  
+  // Add error handling for image load failures
+  img.onerror = function() {
+    console.error("Failed to load image:", img.src);
+    const errorDiv = document.createElement("div");
+    errorDiv.className = "tool-error";
+    errorDiv.textContent = "Failed to load screenshot";
+    imgDiv.appendChild(errorDiv);
+  };
+  
+  imgDiv.appendChild(img);
+  return imgDiv;
+}
+
 // =============== VNC VIEWER ===============
 
 window.onload = function () {
@@ -0,0 +1,20 @@
+// =============== SCREENSHOTS ===============
+
+// Read a screenshot line of the chat history: a markdown image, as older messages
+// have, or a thumbnail linked to the full image. Returns null for any other line.
+function parseScreenshotLine(line) {
+  const linked = line.match(/^\[!\[.*?\]\((.*?)\)\]\((.*?)\)$/);
+  if (linked) {
+    return { imageUrl: linked[2], thumbnailUrl: linked[1] };
+  }
+  const image = line.match(/^!\[.*?\]\((.*?)\)$/);
+  if (image) {
+    return { imageUrl: image[1], thumbnailUrl: null };
+  }
+  return null;
+}
+
+// Loaded as a plain script by the page, and as a module by the tests
+if (typeof module !== "undefined") {
+  module.exports = { parseScreenshotLine };
+}
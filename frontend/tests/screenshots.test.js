@@ -0,0 +1,33 @@
+const assert = require("node:assert");
+const test = require("node:test");
+
+const { parseScreenshotLine } = require("../screenshots.js");
+
+const IMAGE = "http://localhost:8080/minio/screenshots/screenshot_ab12.webp";
+const THUMBNAIL = "http://localhost:8080/minio/screenshots/screenshot_ab12_thumb.webp";
+
+test("a thumbnail linked to the full image", () => {
+  assert.deepStrictEqual(parseScreenshotLine(`[![Screenshot](${THUMBNAIL})](${IMAGE})`), {
+    imageUrl: IMAGE,
+    thumbnailUrl: THUMBNAIL,
+  });
+});
+
+test("an image without a thumbnail, as older messages have", () => {
+  assert.deepStrictEqual(parseScreenshotLine(`![Screenshot](${IMAGE})`), {
+    imageUrl: IMAGE,
+    thumbnailUrl: null,
+  });
+});
+
+test("other lines", () => {
+  for (const line of [
+    "",
+    "[TOOL USE] computer",
+    "See [the docs](http://example.com)",
+    `text before ![Screenshot](${IMAGE})`,
+    "[ERROR SAVING SCREENSHOT]",
+  ]) {
+    assert.strictEqual(parseScreenshotLine(line), null, line);
+  }
+});